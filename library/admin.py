@@ -4,11 +4,14 @@ from django.contrib import messages
 from django.shortcuts import render, redirect
 from django.urls import path, reverse
 from django.utils import timezone
-from datetime import timedelta
 import requests
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
-from .models import User, Book, BookCopy, Reservation, Borrowing, ReservationLog
+from .models import User, Book, BookCopy, Reservation, Borrowing, ReservationLog, BookAvailability, EmailOutbox, IsbnMetadata
+from .availability import get_book_availability, refresh_book_availability
+from .user_summary import invalidate_user_summary
+from .isbn_lookup import book_fields, get_volume_info, normalize_isbn
+from .waitlist import return_borrowings
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'role', 'is_active', 'date_joined')
@@ -97,14 +100,14 @@ class BookAdmin(ImportExportModelAdmin):
         }),
         ('Cover Image', {
             'fields': ('cover_image', 'cover_preview'),
-            'description': 'Upload a cover image or leave blank to use Google Books API (requires ISBN)'
+            'description': 'Upload a cover image or leave blank to use Google Books API (requires ISBN, fetched by prefetch_covers)'
         }),
     )
     change_list_template = 'admin/library/book/change_list.html'  # Explicitly set the template
 
     def has_cover(self, obj):
-        """Display if book has a cover (uploaded or available via API)"""
-        return bool(obj.cover_image or obj.isbn)
+        """Display if book has a cover (uploaded or found by prefetch_covers)"""
+        return bool(obj.cover_image or obj.cover_url)
     has_cover.boolean = True
     has_cover.short_description = 'Has Cover'
 
@@ -128,28 +131,28 @@ class BookAdmin(ImportExportModelAdmin):
         ]
         return custom_urls + urls
 
+    def _import_isbn(self, request, isbn, via=''):
+        """Create a Book from cached/fetched Google Books metadata"""
+        isbn = normalize_isbn(isbn) or isbn
+        try:
+            volume_info = get_volume_info(isbn)
+        except requests.RequestException as e:
+            self.message_user(request, f"Error fetching ISBN: {e}", level=messages.ERROR)
+            return
+        if volume_info is None:
+            self.message_user(request, "No book found for this ISBN", level=messages.ERROR)
+            return
+        if Book.objects.filter(isbn=isbn).exists():
+            self.message_user(request, f"A book with ISBN {isbn} already exists", level=messages.WARNING)
+            return
+        book = Book.objects.create(isbn=isbn, **book_fields(volume_info))
+        self.message_user(request, f"Imported {book.title}{via}")
+
     def import_by_isbn(self, request):
         if request.method == 'POST':
             isbn = request.POST.get('isbn', '')
             if isbn:
-                try:
-                    response = requests.get(f'https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}')
-                    response.raise_for_status()
-                    data = response.json()
-                    if data['totalItems'] > 0:
-                        book_data = data['items'][0]['volumeInfo']
-                        book = Book.objects.create(
-                            title=book_data.get('title', 'Unknown'),
-                            author=', '.join(book_data.get('authors', ['Unknown'])),
-                            publication_year=book_data.get('publishedDate', '')[:4] if 'publishedDate' in book_data else None,
-                            genre=book_data.get('categories', ['Unknown'])[0] if 'categories' in book_data else None,
-                            isbn=isbn
-                        )
-                        self.message_user(request, f"Imported {book.title}")
-                    else:
-                        self.message_user(request, "No book found for this ISBN", level=messages.ERROR)
-                except requests.RequestException as e:
-                    self.message_user(request, f"Error fetching ISBN: {e}", level=messages.ERROR)
+                self._import_isbn(request, isbn)
             else:
                 self.message_user(request, "Please provide an ISBN", level=messages.ERROR)
             return redirect('admin:library_book_changelist')
@@ -162,24 +165,7 @@ class BookAdmin(ImportExportModelAdmin):
         if request.method == 'POST':
             barcode = request.POST.get('barcode', '')
             if barcode:
-                try:
-                    response = requests.get(f'https://www.googleapis.com/books/v1/volumes?q=isbn:{barcode}')
-                    response.raise_for_status()
-                    data = response.json()
-                    if data['totalItems'] > 0:
-                        book_data = data['items'][0]['volumeInfo']
-                        book = Book.objects.create(
-                            title=book_data.get('title', 'Unknown'),
-                            author=', '.join(book_data.get('authors', ['Unknown'])),
-                            publication_year=book_data.get('publishedDate', '')[:4] if 'publishedDate' in book_data else None,
-                            genre=book_data.get('categories', ['Unknown'])[0] if 'categories' in book_data else None,
-                            isbn=barcode
-                        )
-                        self.message_user(request, f"Imported {book.title} via barcode")
-                    else:
-                        self.message_user(request, "No book found for this barcode", level=messages.ERROR)
-                except requests.RequestException as e:
-                    self.message_user(request, f"Error fetching barcode: {e}", level=messages.ERROR)
+                self._import_isbn(request, barcode, via=' via barcode')
             else:
                 self.message_user(request, "Please provide a barcode", level=messages.ERROR)
             return redirect('admin:library_book_changelist')
@@ -191,22 +177,19 @@ class BookAdmin(ImportExportModelAdmin):
 class ReservationAdmin(admin.ModelAdmin):
     list_display = ('user', 'book', 'status', 'expiration_date', 'available_copies')
     list_filter = ('status',)
+    list_select_related = ('user', 'book__availability')
     actions = ['mark_expired', 'mark_picked_up', 'mark_canceled']
 
     def available_copies(self, obj):
-        available = BookCopy.objects.filter(
-            book=obj.book
-        ).exclude(
-            id__in=Reservation.objects.filter(status__in=['assigned', 'picked_up']).values('copy_id')
-        ).exclude(
-            id__in=Borrowing.objects.filter(return_date__isnull=True).values('copy_id')
-        ).count()
-        return available
+        return get_book_availability(obj.book).available_copies
 
     available_copies.short_description = "Available Copies"
 
     def mark_expired(self, request, queryset):
+        affected = list(queryset.values_list('book_id', 'user_id'))
         queryset.update(status='expired', copy=None)
+        refresh_book_availability({book_id for book_id, _ in affected})
+        invalidate_user_summary(user_id for _, user_id in affected)
         self.message_user(request, "Selected reservations marked as expired")
 
     def mark_picked_up(self, request, queryset):
@@ -236,7 +219,10 @@ class ReservationAdmin(admin.ModelAdmin):
             self.message_user(request, "No reservations were updated (must be in 'assigned' status)", level=messages.WARNING)
 
     def mark_canceled(self, request, queryset):
+        affected = list(queryset.values_list('book_id', 'user_id'))
         queryset.update(status='canceled', copy=None)
+        refresh_book_availability({book_id for book_id, _ in affected})
+        invalidate_user_summary(user_id for _, user_id in affected)
         self.message_user(request, "Selected reservations marked as canceled")
 
     mark_expired.short_description = "Mark as expired"
@@ -249,58 +235,16 @@ class BorrowingAdmin(admin.ModelAdmin):
     actions = ['confirm_return', 'renew_borrowing']  # Removed mark_returned to avoid confusion
     
     def get_queryset(self, request):
-        qs = super().get_queryset(request).select_related('user', 'copy')
+        qs = super().get_queryset(request).select_related('user', 'copy__book')  # Borrowing.__str__ shows the title
         return qs
 
     def confirm_return(self, request, queryset):
         """Confirm returns after physical verification (handles both pending and direct returns)"""
-        confirmed_count = 0
-        auto_assigned_count = 0
-        
-        for borrowing in queryset:
+        to_return = []
+        for borrowing in queryset.select_related('copy__book'):
             # Handle both return_pending status and direct admin returns
             if borrowing.status in ['return_pending', 'active'] and borrowing.return_date is None:
-                # CRITICAL: Set return_date and status FIRST before auto-assignment
-                # This ensures the copy appears as truly available in availability queries
-                borrowing.return_date = timezone.now()
-                borrowing.status = 'returned'
-                borrowing.save()
-                confirmed_count += 1
-                
-                # Now that the copy is truly available, auto-assign to next pending reservation
-                book = borrowing.copy.book
-                pending_reservations = Reservation.objects.filter(
-                    book=book,
-                    status='pending'
-                ).order_by('reservation_date')  # First come, first served
-                
-                if pending_reservations.exists():
-                    # Assign to the first pending reservation
-                    next_reservation = pending_reservations.first()
-                    next_reservation.copy = borrowing.copy
-                    next_reservation.status = 'assigned'
-                    next_reservation.expiration_date = timezone.now() + timedelta(days=3)
-                    next_reservation.save()
-                    auto_assigned_count += 1
-                    
-                    # Log the action
-                    ReservationLog.objects.create(
-                        reservation=next_reservation,
-                        action='auto_assigned_on_return',
-                        details=f'Auto-assigned copy {borrowing.copy.location} after return by {borrowing.user.username}'
-                    )
-                    
-                    self.message_user(
-                        request,
-                        f"📚 Copy auto-assigned to {next_reservation.user.username}'s pending reservation!",
-                        level=messages.SUCCESS
-                    )
-                
-                self.message_user(
-                    request,
-                    f"✓ Confirmed return for {borrowing.user.username} - {borrowing.copy.book.title}",
-                    level=messages.SUCCESS
-                )
+                to_return.append(borrowing)
             elif borrowing.return_date is not None:
                 self.message_user(
                     request,
@@ -314,10 +258,25 @@ class BorrowingAdmin(admin.ModelAdmin):
                     level=messages.WARNING
                 )
         
-        if confirmed_count > 0:
-            summary = f"Confirmed {confirmed_count} return(s)"
-            if auto_assigned_count > 0:
-                summary += f" and auto-assigned {auto_assigned_count} to pending reservations"
+        # Returns are written in bulk, then the copies go to the waitlist first come, first served
+        returned, assignments = return_borrowings(to_return)
+        for borrowing in returned:
+            self.message_user(
+                request,
+                f"✓ Confirmed return for {borrowing.user.username} - {borrowing.copy.book.title}",
+                level=messages.SUCCESS
+            )
+        for reservation, _ in assignments:
+            self.message_user(
+                request,
+                f"📚 Copy auto-assigned to {reservation.user.username}'s pending reservation!",
+                level=messages.SUCCESS
+            )
+        
+        if returned:
+            summary = f"Confirmed {len(returned)} return(s)"
+            if assignments:
+                summary += f" and auto-assigned {len(assignments)} to pending reservations"
             self.message_user(request, summary)
 
     def renew_borrowing(self, request, queryset):
@@ -348,9 +307,54 @@ class BorrowingAdmin(admin.ModelAdmin):
     confirm_return.short_description = "✓ Confirm return (verify book physically received)"
     renew_borrowing.short_description = "Renew borrowing (+14 days)"
 
+class BookCopyAdmin(admin.ModelAdmin):
+    list_select_related = ('book',)  # BookCopy.__str__ shows the book title
+
+class ReservationLogAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'action_date')
+    list_select_related = ('reservation__user', 'reservation__book')
+
+class BookAvailabilityAdmin(admin.ModelAdmin):
+    list_display = ('book', 'total_copies', 'unavailable_copies', 'available_copies', 'lost_copies', 'updated_at')
+    list_select_related = ('book',)
+    search_fields = ('book__title',)
+    readonly_fields = ('book', 'total_copies', 'unavailable_copies', 'available_copies', 'lost_copies', 'updated_at')
+
+    def has_add_permission(self, request):
+        # Rows are maintained automatically (see library/availability.py)
+        return False
+
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    actions = ['retry_now']
+
+    def has_add_permission(self, request):
+        # Rows are queued by library/email_utils.py
+        return False
+
+    def retry_now(self, request, queryset):
+        count = queryset.exclude(status='sent').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"{count} email(s) queued for the next process_outbox run")
+
+    retry_now.short_description = "Retry now"
+
+class IsbnMetadataAdmin(admin.ModelAdmin):
+    list_display = ('isbn', 'title', 'fetched_at')
+    search_fields = ('isbn',)
+    readonly_fields = ('isbn', 'volume_info', 'fetched_at')
+
+    def title(self, obj):
+        return (obj.volume_info or {}).get('title', '—')
+
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Book, BookAdmin)
-admin.site.register(BookCopy)
+admin.site.register(BookCopy, BookCopyAdmin)
 admin.site.register(Reservation, ReservationAdmin)
 admin.site.register(Borrowing, BorrowingAdmin)
-admin.site.register(ReservationLog)
\ No newline at end of file
+admin.site.register(ReservationLog, ReservationLogAdmin)
+admin.site.register(BookAvailability, BookAvailabilityAdmin)
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
+admin.site.register(IsbnMetadata, IsbnMetadataAdmin)
\ No newline at end of file
@@ -5,4 +5,10 @@ class LibraryConfig(AppConfig):
     name = 'library'
 
     def ready(self):
-        import library.signals
\ No newline at end of file
+        import library.signals
+        from django.core.signals import request_finished
+        from django.db.backends.signals import connection_created
+        from library.db import apply_sqlite_pragmas, optimize_after_request
+
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='library_sqlite_pragmas')
+        request_finished.connect(optimize_after_request, dispatch_uid='library_sqlite_optimize')
@@ -0,0 +1,89 @@
+"""
+Copy assignment for pending reservations.
+
+A free copy is found with an index-backed lookup on the reservation's
+book (bookcopy_book_idx plus NOT EXISTS probes on the open borrowing and
+assigned reservation indexes), then claimed with a single conditional
+UPDATE that only succeeds if the reservation is still pending and the
+copy is still free. The partial unique constraint
+reservation_one_assigned_per_copy backs this up at the database level,
+so two concurrent requests can never be handed the same copy: the loser
+simply retries with the next free copy.
+"""
+
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists
+from django.utils import timezone
+
+from .availability import refresh_book_availability, unavailable_copy_filter
+from .audit import log_event
+from .models import BookAvailability, BookCopy, Borrowing, Reservation
+from .user_summary import invalidate_user_summary
+
+PICKUP_WINDOW = timedelta(days=3)
+MAX_CLAIM_ATTEMPTS = 5  # Free copies tried before giving up for this round
+
+
+def free_copy_ids(book_id, limit=MAX_CLAIM_ATTEMPTS):
+    """Ids of circulating copies of a book that are neither borrowed nor assigned"""
+    return list(
+        BookCopy.objects.filter(book_id=book_id).exclude(condition='lost').filter(
+            ~unavailable_copy_filter()
+        ).order_by('id').values_list('id', flat=True)[:limit]
+    )
+
+
+def claim_copy(reservation_id, copy_id, expiration_date):
+    """
+    Assign `copy_id` to a pending reservation in one conditional UPDATE.
+    Returns True if this call won the copy.
+    """
+    open_borrowing = Borrowing.objects.filter(copy_id=copy_id, return_date__isnull=True)
+    assigned = Reservation.objects.filter(copy_id=copy_id, status='assigned')
+    try:
+        with transaction.atomic():
+            claimed = Reservation.objects.filter(
+                id=reservation_id, status='pending',
+            ).filter(
+                ~Exists(open_borrowing), ~Exists(assigned),
+            ).update(copy_id=copy_id, status='assigned', expiration_date=expiration_date)
+    except IntegrityError:
+        # Another transaction assigned the copy between our check and write
+        return False
+    return claimed == 1
+
+
+def assign_copy(reservation):
+    """
+    Give a pending reservation a free copy of its book. Returns the
+    assigned BookCopy, or None if no copy is free (or the reservation is
+    no longer pending). Updates `reservation` in place.
+    """
+    if reservation.status != 'pending':
+        return None
+
+    # Cheap check against the materialized counters before searching for a copy
+    available_count = BookAvailability.objects.filter(
+        book_id=reservation.book_id
+    ).values_list('available_copies', flat=True).first()
+    if available_count == 0:
+        return None
+
+    expiration_date = timezone.now() + PICKUP_WINDOW
+    with transaction.atomic():
+        for copy_id in free_copy_ids(reservation.book_id):
+            if claim_copy(reservation.id, copy_id, expiration_date):
+                break
+        else:
+            return None
+
+        # update() skips post_save, so do what the signal handlers would have done
+        reservation.copy_id = copy_id
+        reservation.status = 'assigned'
+        reservation.expiration_date = expiration_date
+        log_event(reservation, 'updated', f"Status changed to {reservation.status}")
+        refresh_book_availability([reservation.book_id])
+        invalidate_user_summary([reservation.user_id])
+    return reservation.copy
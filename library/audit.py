@@ -0,0 +1,80 @@
+"""
+Buffered reservation audit trail.
+
+log_event() / log_events() do not write ReservationLog rows right away.
+Inside an audit_scope() (opened for every request by
+library.middleware.AuditLogMiddleware, and by commands that log per row)
+events are collected and written with a single bulk INSERT when the scope
+ends. Each event only joins the buffer once its own transaction commits,
+so work that is rolled back leaves no audit rows. Outside a scope each
+call is written with one bulk INSERT on commit. A failed audit write is
+logged and never breaks the already committed work it describes.
+"""
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+
+from .models import Reservation, ReservationLog
+
+logger = logging.getLogger(__name__)
+
+_buffer = ContextVar('audit_buffer', default=None)
+
+
+def log_event(reservation, action, details=None):
+    """Record one audit event for a reservation (None for copy-level events)"""
+    log_events([ReservationLog(reservation=reservation, action=action, details=details)])
+
+
+def log_events(entries):
+    """Record unsaved ReservationLog instances"""
+    entries = list(entries)
+    if not entries:
+        return
+
+    buffer = _buffer.get()
+    if buffer is None:
+        transaction.on_commit(lambda: write_events(entries), robust=True)
+    else:
+        transaction.on_commit(lambda: buffer.extend(entries))
+
+
+@contextmanager
+def audit_scope():
+    """Collect audit events until the block exits, then write them in one INSERT"""
+    if _buffer.get() is not None:
+        # Nested scopes share the outermost buffer
+        yield
+        return
+
+    buffer = []
+    token = _buffer.set(buffer)
+    try:
+        yield
+    finally:
+        _buffer.reset(token)
+        # Events from a still-open transaction join the buffer when it commits;
+        # callbacks run in order, so this flush runs after them
+        transaction.on_commit(lambda: write_events(buffer), robust=True)
+
+
+def write_events(entries):
+    if not entries:
+        return
+    try:
+        with transaction.atomic():
+            ReservationLog.objects.bulk_create(entries, batch_size=500)
+    except IntegrityError:
+        # A reservation was deleted after its event was recorded; keep the rest
+        existing = set(Reservation.objects.filter(
+            id__in={entry.reservation_id for entry in entries}
+        ).values_list('id', flat=True))
+        kept = [entry for entry in entries if entry.reservation_id is None or entry.reservation_id in existing]
+        for entry in kept:
+            entry.pk = None  # May have been assigned before the rollback
+        logger.warning('audit dropped=%d reason=reservation_deleted', len(entries) - len(kept))
+        ReservationLog.objects.bulk_create(kept, batch_size=500)
+    logger.debug('audit written=%d', len(entries))
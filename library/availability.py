@@ -0,0 +1,129 @@
+"""
+Materialized per-book availability counters.
+
+BookAvailability rows are recomputed from the circulation tables whenever a
+Borrowing, Reservation or BookCopy changes state (see library/signals.py).
+Code that changes circulation state with queryset.update() bypasses the
+signals and must call refresh_book_availability() itself; that also bumps
+the cache namespaces of the circulation models (library/cache_versions.py).
+"""
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, FloatField, OuterRef, Q, Subquery
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .cache_versions import invalidate_models
+from .models import Book, BookAvailability, BookCopy, Borrowing, Reservation
+
+COUNTER_FIELDS = (
+    'total_copies', 'unavailable_copies', 'available_copies', 'lost_copies', 'active_loans', 'pending_reservations',
+)
+
+
+def unavailable_copy_filter():
+    """
+    Q object matching copies that are out of circulation right now:
+    borrowed and not yet returned, or assigned to a reservation.
+    Must be used on a BookCopy queryset.
+    """
+    open_borrowing = Borrowing.objects.filter(copy_id=OuterRef('pk'), return_date__isnull=True)
+    assigned_reservation = Reservation.objects.filter(copy_id=OuterRef('pk'), status='assigned')
+    return Q(Exists(open_borrowing)) | Q(Exists(assigned_reservation))
+
+
+def _count_per_book(queryset, book_field='book_id'):
+    """Correlated COUNT of the queryset's rows for the outer Book, 0 when there are none"""
+    rows = queryset.filter(**{book_field: OuterRef('pk')}).values(book_field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(rows), 0)
+
+
+def compute_book_availability(book_ids):
+    """Return {book_id: {counter: value}} computed from the source tables (1 query)"""
+    in_circulation = BookCopy.objects.exclude(condition='lost')
+    rows = Book.objects.filter(id__in=set(book_ids)).annotate(
+        total=_count_per_book(in_circulation),
+        unavailable=_count_per_book(in_circulation.filter(unavailable_copy_filter())),
+        lost=_count_per_book(BookCopy.objects.filter(condition='lost')),
+        loans=_count_per_book(Borrowing.objects.filter(return_date__isnull=True, status='active'), 'copy__book_id'),
+        pending=_count_per_book(Reservation.objects.filter(status='pending')),
+    ).values('id', 'total', 'unavailable', 'lost', 'loans', 'pending')
+
+    return {
+        row['id']: {
+            'total_copies': row['total'],
+            'unavailable_copies': row['unavailable'],
+            'available_copies': row['total'] - row['unavailable'],
+            'lost_copies': row['lost'],
+            'active_loans': row['loans'],
+            'pending_reservations': row['pending'],
+        }
+        for row in rows
+    }
+
+
+def refresh_book_availability(book_ids):
+    """
+    Recompute and upsert the BookAvailability rows for the given books.
+    Runs in the caller's transaction so counters never drift from the
+    circulation change that triggered them.
+    """
+    book_ids = {book_id for book_id in book_ids if book_id is not None}
+    if not book_ids:
+        return
+
+    with transaction.atomic():
+        # Books deleted earlier in this transaction are not counted
+        now = timezone.now()
+        rows = [
+            BookAvailability(book_id=book_id, updated_at=now, **counters)
+            for book_id, counters in compute_book_availability(book_ids).items()
+        ]
+        if not rows:
+            return
+        BookAvailability.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['book'],
+            update_fields=list(COUNTER_FIELDS) + ['updated_at'],
+        )
+    invalidate_models(BookCopy, Borrowing, Reservation)
+
+
+def create_empty_availability(book_ids):
+    """
+    Add zeroed availability rows for books created with bulk_create(), which
+    skips the post_save signal. New books have no copies, so nothing to count.
+    """
+    BookAvailability.objects.bulk_create(
+        [BookAvailability(book_id=book_id) for book_id in book_ids],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    invalidate_models(Book)
+
+
+def get_book_availability(book):
+    """Return the availability row for a book, treating a missing row as no copies"""
+    try:
+        return book.availability
+    except BookAvailability.DoesNotExist:
+        return BookAvailability(book=book)
+
+
+def low_stock_availability(threshold, limit):
+    """
+    Top `limit` scarcest titles with fewer than `threshold` available copies,
+    ordered by available/total ratio (1 query, served by the available index)
+    """
+    return BookAvailability.objects.filter(
+        total_copies__gt=0,
+        available_copies__lt=threshold,
+    ).annotate(
+        available_ratio=Cast('available_copies', FloatField()) / F('total_copies'),
+    ).select_related('book').order_by('available_ratio', 'available_copies', 'book__title')[:limit]
+
+
+def book_ids_for_copies(copy_ids):
+    """Map copy ids to the set of their book ids"""
+    return set(BookCopy.objects.filter(id__in=copy_ids).values_list('book_id', flat=True))
@@ -0,0 +1,69 @@
+"""
+Cached book card fragments for the catalog.
+
+Each card is rendered once and cached under the book id plus a stamp: a
+digest of everything the card shows (title, author, year, genre, ISBN,
+cover URL and the availability counters). When the book, its copies or
+its circulation state change, the counters or fields change with them,
+so the card gets a new key and the old fragment is never read again.
+That holds for bulk writes too, with no signal wiring. A page of cards
+is assembled with one get_many() and only the misses are rendered.
+
+Cards with search highlights depend on the query and are always
+rendered fresh.
+"""
+
+import hashlib
+import logging
+
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from .request_metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+CARD_TEMPLATE = 'library/partials/book_card.html'
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def card_stamp(book):
+    """Digest of the values shown on a card (book prepared by views._attach_availability)"""
+    values = (
+        book.title, book.author, book.publication_year, book.genre, book.isbn,
+        book.get_cover_url(), book.total_copies, book.available_copies,
+    )
+    return hashlib.md5(repr(values).encode()).hexdigest()
+
+
+def card_key(book):
+    return f'book_card_{book.id}_{card_stamp(book)}'
+
+
+def render_book_cards(books):
+    """HTML for a list of cards, served from the fragment cache where possible"""
+    template = get_template(CARD_TEMPLATE)
+    keys = {
+        book.id: card_key(book)
+        for book in books
+        if not (getattr(book, 'title_html', None) or getattr(book, 'author_html', None))
+    }
+    cached = cache.get_many(keys.values()) if keys else {}
+    record_cache('book_cards', hits=len(cached), misses=len(keys) - len(cached))
+
+    parts = []
+    rendered = {}
+    for book in books:
+        key = keys.get(book.id)
+        html = cached.get(key) if key else None
+        if html is None:
+            html = template.render({'book': book})
+            if key:
+                rendered[key] = html
+        parts.append(html)
+
+    if rendered:
+        cache.set_many(rendered, CARD_CACHE_TIMEOUT)
+    logger.debug('book cards hits=%d rendered=%d', len(cached), len(parts) - len(cached))
+    return mark_safe(''.join(parts))
@@ -0,0 +1,89 @@
+"""
+Versioned cache namespaces with model-driven invalidation.
+
+Cached values are stored under keys that embed the current version of
+their namespace ('catalog', 'dashboard', 'lists', ...). Each model is
+registered with the namespaces its rows feed; saving or deleting one
+bumps those versions once the transaction commits (see
+library/signals.py), so old entries are simply never read again and
+expire on their own. Entries can therefore be cached for a long time
+without ever being served stale.
+
+Code that writes with bulk_create()/update() skips the signals and must
+call invalidate_models() itself. refresh_book_availability() and
+create_empty_availability() already do, so every bulk circulation path
+that keeps the availability counters right also keeps the cache right.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .request_metrics import record_cache
+
+_namespaces = {}  # model -> set of namespace names
+_missing = object()
+
+
+def register(model, *namespaces):
+    """Declare that changes to `model` invalidate `namespaces`"""
+    _namespaces.setdefault(model, set()).update(namespaces)
+
+
+def namespaces_for(*models):
+    names = set()
+    for model in models:
+        names |= _namespaces.get(model, set())
+    return names
+
+
+def _version_key(namespace):
+    return f'cache_version_{namespace}'
+
+
+def namespace_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Start from a fresh version so an evicted counter can't resurrect old entries;
+        # add() keeps the value of a worker that got there first
+        cache.add(_version_key(namespace), time.time_ns(), None)
+        version = cache.get(_version_key(namespace), time.time_ns())
+    return version
+
+
+def versioned_key(namespace, key):
+    return f'{namespace}_v{namespace_version(namespace)}_{key}'
+
+
+def get_or_compute(namespace, key, compute, timeout):
+    """Return the cached value of `key` in `namespace`, computing and storing it on a miss"""
+    full_key = versioned_key(namespace, key)
+    value = cache.get(full_key, _missing)
+    if value is _missing:
+        record_cache(namespace, misses=1)
+        value = compute()
+        cache.set(full_key, value, timeout)
+    else:
+        record_cache(namespace, hits=1)
+    return value
+
+
+def bump(*namespaces):
+    """Move namespaces to a new version right away"""
+    for namespace in set(namespaces):
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            cache.set(_version_key(namespace), time.time_ns(), None)
+
+
+def invalidate_models(*models):
+    """
+    Bump the namespaces of `models` when the current transaction commits.
+    Bumping earlier would let a concurrent request cache the pre-commit
+    data under the new version.
+    """
+    namespaces = namespaces_for(*models)
+    if namespaces:
+        transaction.on_commit(lambda: bump(*namespaces))
@@ -0,0 +1,56 @@
+"""
+Book cover lookup against the Google Books API.
+
+Covers are resolved in the background by `manage.py prefetch_covers` and
+stored on the Book row (cover_url / cover_retry_after), so rendering a
+page never waits on an outbound HTTP call.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .isbn_lookup import cover_from_volume, fetch_volume_info
+from .models import Book
+
+NO_COVER_RETRY = timedelta(days=30)  # Google rarely adds covers later
+ERROR_RETRY = timedelta(hours=1)  # API errors and timeouts
+
+
+def fetch_cover_url(isbn, timeout=5):
+    """
+    Look up the best cover image for an ISBN. Returns the URL, or None if
+    Google Books has no cover. Raises requests.RequestException on errors.
+    """
+    return cover_from_volume(fetch_volume_info(isbn, timeout=timeout))
+
+
+def books_needing_covers(now=None):
+    """Books with an ISBN and no uploaded image whose cover is unknown or due for a retry"""
+    now = now or timezone.now()
+    return Book.objects.exclude(isbn__isnull=True).exclude(isbn='').filter(
+        Q(cover_image__isnull=True) | Q(cover_image=''),
+    ).filter(
+        Q(cover_url__isnull=True) |
+        Q(cover_url=Book.NO_COVER, cover_retry_after__lte=now)
+    )
+
+
+class RateLimiter:
+    """Spaces out calls across threads to at most `rate` per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
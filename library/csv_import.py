@@ -0,0 +1,178 @@
+"""
+Streaming book CSV import used by the admin "Import CSV" page and the
+import_books_csv command.
+
+The file is decoded and parsed incrementally and processed in chunks:
+for each chunk the matching books are loaded with two IN queries (by ISBN
+and by author), then new and changed books are written with bulk_create /
+bulk_update in one transaction. Memory use depends on the chunk size, not
+the file size. Bad rows are reported and skipped; they never abort the run.
+
+Columns: title, author, isbn, genre, publication_year (publisher and
+description are accepted but not stored).
+"""
+
+import csv
+import io
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+
+from .availability import create_empty_availability
+from .cache_versions import invalidate_models
+from .models import Book
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100  # Only the first errors are kept; all are counted
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, row_num, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'Row {row_num}: {message}')
+
+
+def parse_row(row):
+    """
+    Clean one CSV row into Book fields. Returns (fields, warning); raises
+    ValueError for rows that cannot be imported.
+    """
+    title = (row.get('title') or '').strip()
+    author = (row.get('author') or '').strip()
+    if not title or not author:
+        raise ValueError('Title and author are required')
+
+    # Convert year to integer if provided (an invalid year is reported but the book is still imported)
+    publication_year = (row.get('publication_year') or '').strip()
+    year, warning = None, None
+    if publication_year:
+        try:
+            year = int(publication_year)
+        except ValueError:
+            warning = f'Invalid year "{publication_year}"'
+
+    fields = {
+        'title': title,
+        'author': author,
+        'isbn': (row.get('isbn') or '').strip() or None,  # NULL, not '', so blanks don't collide on the unique index
+        'genre': (row.get('genre') or '').strip(),
+        'publication_year': year,
+    }
+    return fields, warning
+
+
+def import_books_csv(binary_file, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import books from a binary CSV file object; returns an ImportResult"""
+    result = ImportResult()
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    rows = enumerate(csv.DictReader(text), start=2)  # Start at 2 (header is row 1)
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            result.rows += len(chunk)
+            _import_chunk(chunk, result)
+    finally:
+        text.detach()  # Leave the underlying upload open for Django to clean up
+
+    # bulk_update() skips the post_save signals
+    invalidate_models(Book)
+    return result
+
+
+def _import_chunk(chunk, result):
+    parsed = []
+    for row_num, row in chunk:
+        try:
+            fields, warning = parse_row(row)
+        except ValueError as e:
+            result.error(row_num, e)
+            continue
+        if warning:
+            result.error(row_num, warning)
+        parsed.append((row_num, fields))
+
+    # Existing books this chunk can match, in two queries
+    isbns = {fields['isbn'] for _, fields in parsed if fields['isbn']}
+    authors = {fields['author'] for _, fields in parsed}
+    by_isbn = {book.isbn: book for book in Book.objects.filter(isbn__in=isbns)}
+    by_author = {book.author: book for book in Book.objects.filter(author__in=authors)}  # author is unique
+
+    to_create = []
+    to_update = {}
+    for row_num, fields in parsed:
+        isbn, author = fields['isbn'], fields['author']
+
+        # Match by ISBN, then by title + author (including rows created earlier in this chunk)
+        book = by_isbn.get(isbn) if isbn else None
+        if book is None and author in by_author and by_author[author].title == fields['title']:
+            book = by_author[author]
+
+        if book is None:
+            if author in by_author:
+                result.error(row_num, f'Author "{author}" already has a book ("{by_author[author].title}")')
+                continue
+            book = Book(**fields)
+            to_create.append((row_num, book))
+            by_author[author] = book
+            if isbn:
+                by_isbn[isbn] = book
+            continue
+
+        # Update existing book (only written if something actually changed)
+        changed = False
+        if isbn and not book.isbn and isbn not in by_isbn:
+            book.isbn = isbn
+            by_isbn[isbn] = book
+            changed = True
+        if fields['genre'] and fields['genre'] != book.genre:
+            book.genre = fields['genre']
+            changed = True
+        if fields['publication_year'] and fields['publication_year'] != book.publication_year:
+            book.publication_year = fields['publication_year']
+            changed = True
+        if changed and book.pk:
+            to_update[book.pk] = (row_num, book)
+
+    try:
+        with transaction.atomic():
+            created = Book.objects.bulk_create([book for _, book in to_create])
+            Book.objects.bulk_update(
+                [book for _, book in to_update.values()], ['isbn', 'genre', 'publication_year']
+            )
+            # bulk_create() skips post_save signals, so add the availability rows here
+            create_empty_availability(book.pk for book in created)
+        result.created += len(to_create)
+        result.updated += len(to_update)
+    except IntegrityError:
+        # A concurrent change collided with this chunk; fall back to row by row to isolate it
+        _save_rows_individually(to_create, list(to_update.values()), result)
+
+
+def _save_rows_individually(to_create, to_update, result):
+    for _, book in to_create:
+        # bulk_create() may have assigned ids before the transaction rolled back
+        book.pk = None
+        book._state.adding = True
+
+    for row_num, book in to_create + to_update:
+        creating = book.pk is None
+        try:
+            with transaction.atomic():
+                book.save()
+        except IntegrityError as e:
+            result.error(row_num, e)
+            continue
+        if creating:
+            result.created += 1
+        else:
+            result.updated += 1
@@ -0,0 +1,54 @@
+"""
+SQLite connection tuning.
+
+Every new SQLite connection gets the pragmas from settings.SQLITE_PRAGMAS
+(WAL journal, busy timeout, relaxed fsync, bigger page cache, ...) via
+the connection_created signal. Connections are kept open between requests
+(CONN_MAX_AGE), so each one also runs PRAGMA optimize every
+SQLITE_OPTIMIZE_INTERVAL seconds to keep the query planner statistics
+current. Nothing here runs on other database backends.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created handler"""
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    connection.last_optimized = time.monotonic()
+    logger.debug('sqlite connection tuned pragmas=%s', settings.SQLITE_PRAGMAS)
+
+
+def optimize_sqlite(connection, interval=None):
+    """Run PRAGMA optimize on an open SQLite connection if the interval has passed"""
+    if connection.vendor != 'sqlite' or connection.connection is None or connection.in_atomic_block:
+        return False
+
+    interval = settings.SQLITE_OPTIMIZE_INTERVAL if interval is None else interval
+    last_optimized = getattr(connection, 'last_optimized', 0)
+    if time.monotonic() - last_optimized < interval:
+        return False
+
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA optimize')
+    connection.last_optimized = time.monotonic()
+    logger.info('sqlite optimize alias=%s ms=%.1f', connection.alias, (time.perf_counter() - started) * 1000)
+    return True
+
+
+def optimize_after_request(sender, **kwargs):
+    """request_finished handler: periodic PRAGMA optimize on the persistent connections"""
+    for connection in connections.all(initialized_only=True):
+        optimize_sqlite(connection)
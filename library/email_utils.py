@@ -4,11 +4,16 @@ Sends emails for reservations, borrowings, due dates, and overdue notices.
 """
 
 from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.template.loader import get_template, render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
 from datetime import datetime, timedelta
+from . import metrics
+from .outbox import enqueue_email, enqueue_emails
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def get_site_url():
@@ -25,6 +30,33 @@ def get_site_url():
     return site_url
 
 
+def deliver_email(kind, to_email, subject, plain_message, html_message):
+    """
+    Queue an email in the outbox (delivered by process_outbox), or send it
+    right away when USE_EMAIL_OUTBOX is off. Returns False if sending failed.
+    """
+    if settings.USE_EMAIL_OUTBOX:
+        enqueue_email(kind, to_email, subject, plain_message, html_message)
+        logger.debug('email queued kind=%s to=%s', kind, to_email)
+        return True
+
+    try:
+        with metrics.timed('library_email_send_duration_seconds', 'library_email_failures_total', kind=kind):
+            send_mail(
+                subject=subject,
+                message=plain_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[to_email],
+                html_message=html_message,
+                fail_silently=False,
+            )
+        logger.info('email sent kind=%s to=%s', kind, to_email)
+        return True
+    except Exception as e:
+        logger.error('email failed kind=%s to=%s error=%s', kind, to_email, e)
+        return False
+
+
 def send_reservation_confirmation(user, reservation):
     """
     Send confirmation email when a user makes a reservation.
@@ -53,32 +85,11 @@ def send_reservation_confirmation(user, reservation):
     html_message = render_to_string('emails/reservation_confirmed.html', context)
     plain_message = strip_tags(html_message)
     
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,  # Show errors during testing
-        )
-        print(f"✅ Reservation confirmation email sent to {user.email}")
-    except Exception as e:
-        print(f"❌ Failed to send reservation confirmation to {user.email}: {e}")
+    deliver_email('reservation_confirmed', user.email, subject, plain_message, html_message)
 
 
-def send_reservation_assigned(user, reservation, book_copy):
-    """
-    Send email when an admin assigns a copy to a reservation.
-    
-    Args:
-        user: User who made the reservation
-        reservation: Reservation object
-        book_copy: BookCopy that was assigned
-    """
-    if not settings.SEND_RESERVATION_EMAILS:
-        return
-    
+def reservation_assigned_email(user, reservation, book_copy):
+    """Subject and template context for a pickup notification"""
     subject = f'📖 Your Book is Ready for Pickup - {reservation.book.title}'
     
     # Calculate pickup deadline (48 hours from now)
@@ -93,36 +104,55 @@ def send_reservation_assigned(user, reservation, book_copy):
         'pickup_deadline': pickup_deadline,
         'site_url': get_site_url(),
     }
+    return subject, context
+
+
+def send_reservation_assigned(user, reservation, book_copy):
+    """
+    Send email when an admin assigns a copy to a reservation.
+    
+    Args:
+        user: User who made the reservation
+        reservation: Reservation object
+        book_copy: BookCopy that was assigned
+    """
+    if not settings.SEND_RESERVATION_EMAILS:
+        return
+    
+    subject, context = reservation_assigned_email(user, reservation, book_copy)
     
     # Render HTML email
     html_message = render_to_string('emails/reservation_assigned.html', context)
     plain_message = strip_tags(html_message)
     
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,  # Show errors during testing
-        )
-        print(f"✅ Assignment notification email sent to {user.email}")
-    except Exception as e:
-        print(f"❌ Failed to send assignment notification to {user.email}: {e}")
+    deliver_email('reservation_assigned', user.email, subject, plain_message, html_message)
 
 
-def send_due_date_reminder(user, borrowing):
+def send_reservations_assigned(assignments):
     """
-    Send reminder email 2 days before book is due.
-    
-    Args:
-        user: User who borrowed the book
-        borrowing: Borrowing object
+    Pickup notifications for many [(reservation, book_copy)] at once, e.g.
+    after the waitlist hands out returned copies; queued with one INSERT.
     """
-    if not settings.SEND_DUE_DATE_REMINDERS:
+    if not settings.SEND_RESERVATION_EMAILS or not assignments:
+        return
+    
+    if not settings.USE_EMAIL_OUTBOX:
+        for reservation, book_copy in assignments:
+            send_reservation_assigned(reservation.user, reservation, book_copy)
         return
     
+    template = get_template('emails/reservation_assigned.html')
+    outgoing = []
+    for reservation, book_copy in assignments:
+        subject, context = reservation_assigned_email(reservation.user, reservation, book_copy)
+        html_message = template.render(context)
+        outgoing.append((reservation.user.email, subject, strip_tags(html_message), html_message))
+    enqueue_emails('reservation_assigned', outgoing)
+    logger.debug('email queued kind=reservation_assigned count=%d', len(outgoing))
+
+
+def due_date_reminder_email(user, borrowing):
+    """Subject and template context for a due date reminder"""
     subject = f'⏰ Due Date Reminder - {borrowing.copy.book.title}'
     
     # Calculate days until due
@@ -136,36 +166,11 @@ def send_due_date_reminder(user, borrowing):
         'days_until_due': days_until_due,
         'site_url': get_site_url(),
     }
-    
-    # Render HTML email
-    html_message = render_to_string('emails/due_reminder.html', context)
-    plain_message = strip_tags(html_message)
-    
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        print(f"✅ Due date reminder sent to {user.email}")
-    except Exception as e:
-        print(f"❌ Failed to send due date reminder to {user.email}: {e}")
+    return subject, context
 
 
-def send_overdue_notice(user, borrowing):
-    """
-    Send overdue notice when book is past due date.
-    
-    Args:
-        user: User who borrowed the book
-        borrowing: Borrowing object
-    """
-    if not settings.SEND_OVERDUE_NOTIFICATIONS:
-        return
-    
+def overdue_notice_email(user, borrowing):
+    """Subject and template context for an overdue notice"""
     subject = f'⚠️ Overdue Book Notice - {borrowing.copy.book.title}'
     
     # Calculate days overdue
@@ -179,23 +184,45 @@ def send_overdue_notice(user, borrowing):
         'days_overdue': days_overdue,
         'site_url': get_site_url(),
     }
+    return subject, context
+
+
+def render_reminder(kind, user, borrowing):
+    """Subject, plain text and HTML of a 'due_reminder' or 'overdue_notice' email"""
+    build_email = due_date_reminder_email if kind == 'due_reminder' else overdue_notice_email
+    subject, context = build_email(user, borrowing)
+    html_message = render_to_string(f'emails/{kind}.html', context)
+    return subject, strip_tags(html_message), html_message
+
+
+def send_due_date_reminder(user, borrowing):
+    """
+    Send reminder email 2 days before book is due.
     
-    # Render HTML email
-    html_message = render_to_string('emails/overdue_notice.html', context)
-    plain_message = strip_tags(html_message)
+    Args:
+        user: User who borrowed the book
+        borrowing: Borrowing object
+    """
+    if not settings.SEND_DUE_DATE_REMINDERS:
+        return
     
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        print(f"✅ Overdue notice sent to {user.email}")
-    except Exception as e:
-        print(f"❌ Failed to send overdue notice to {user.email}: {e}")
+    subject, plain_message, html_message = render_reminder('due_reminder', user, borrowing)
+    deliver_email('due_reminder', user.email, subject, plain_message, html_message)
+
+
+def send_overdue_notice(user, borrowing):
+    """
+    Send overdue notice when book is past due date.
+    
+    Args:
+        user: User who borrowed the book
+        borrowing: Borrowing object
+    """
+    if not settings.SEND_OVERDUE_NOTIFICATIONS:
+        return
+    
+    subject, plain_message, html_message = render_reminder('overdue_notice', user, borrowing)
+    deliver_email('overdue_notice', user.email, subject, plain_message, html_message)
 
 
 def send_pickup_confirmation(user, borrowing):
@@ -219,18 +246,7 @@ def send_pickup_confirmation(user, borrowing):
     html_message = render_to_string('emails/pickup_confirmed.html', context)
     plain_message = strip_tags(html_message)
     
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        print(f"✅ Pickup confirmation email sent to {user.email}")
-    except Exception as e:
-        print(f"❌ Failed to send pickup confirmation to {user.email}: {e}")
+    deliver_email('pickup_confirmed', user.email, subject, plain_message, html_message)
 
 
 def send_return_confirmation(user, borrowing):
@@ -264,15 +280,4 @@ def send_return_confirmation(user, borrowing):
     html_message = render_to_string('emails/return_confirmed.html', context)
     plain_message = strip_tags(html_message)
     
-    try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        print(f"✅ Return confirmation email sent to {user.email}")
-    except Exception as e:
-        print(f"❌ Failed to send return confirmation to {user.email}: {e}")
+    deliver_email('return_confirmed', user.email, subject, plain_message, html_message)
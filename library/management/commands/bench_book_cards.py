@@ -0,0 +1,90 @@
+"""
+Management command to time rendering the catalog's book cards with and
+without the fragment cache (library/book_cards.py).
+
+Cards are rendered for in-memory books, so the database is not touched;
+the configured cache is used, since its speed is part of what is measured.
+Three timings per page size:
+  uncached - every card rendered from the template (the old behaviour)
+  cold     - cache misses: render plus storing the fragments
+  warm     - every card served from the cache
+
+Usage: python manage.py bench_book_cards [--sizes 12 48] [--rounds 50]
+"""
+
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+from library.book_cards import CARD_TEMPLATE, card_key, render_book_cards
+from library.models import Book
+
+FIRST_ID = 10 ** 9  # Far above real ids, so no real card is touched
+
+
+def make_books(count, round_number):
+    """Books shaped like _attach_availability output; titles differ per round for cold runs"""
+    books = []
+    for i in range(count):
+        book = Book(
+            id=FIRST_ID + i,
+            title=f'Benchmark Book {i} ({round_number})',
+            author=f'Author {i}',
+            publication_year=1950 + i % 70,
+            genre=('Fantasy', 'History', 'Science')[i % 3],
+            isbn=f'978{i:010d}',
+            cover_url=f'https://books.google.com/books/content?id=bench{i}&printsec=frontcover&img=1',
+        )
+        book.total_copies = 3
+        book.available_copies = i % 4
+        book.unavailable_count = book.total_copies - book.available_copies
+        books.append(book)
+    return books
+
+
+class Command(BaseCommand):
+    help = 'Benchmark catalog card rendering with and without the fragment cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[12, 48], help='Cards per page (default: 12 48)')
+        parser.add_argument('--rounds', type=int, default=50, help='Renders per measurement (default: 50)')
+
+    def handle(self, *args, **options):
+        template = get_template(CARD_TEMPLATE)
+        rounds = options['rounds']
+        backend = settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1]
+        self.stdout.write(f'🏁 {rounds} round(s) per measurement, cache backend {backend}')
+
+        for size in options['sizes']:
+            uncached, cold, warm = [], [], []
+            warm_books = make_books(size, 'warm')
+            render_book_cards(warm_books)  # Prime the warm set
+
+            for round_number in range(rounds):
+                books = make_books(size, round_number)
+
+                started = time.perf_counter()
+                ''.join(template.render({'book': book}) for book in books)
+                uncached.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                render_book_cards(books)
+                cold.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                render_book_cards(warm_books)
+                warm.append(time.perf_counter() - started)
+
+                cache.delete_many([card_key(book) for book in books])
+            cache.delete_many([card_key(book) for book in warm_books])
+
+            uncached_ms, cold_ms, warm_ms = (statistics.median(values) * 1000 for values in (uncached, cold, warm))
+            self.stdout.write(
+                f'  {size:>3} cards: uncached {uncached_ms:6.2f}ms, cold {cold_ms:6.2f}ms, warm {warm_ms:6.2f}ms '
+                f'(median)'
+            )
+            if warm_ms:
+                self.stdout.write(self.style.SUCCESS(f'  ✅ Warm cache: {uncached_ms / warm_ms:.1f}x faster than uncached'))
@@ -0,0 +1,203 @@
+"""
+Management command to benchmark the hot views and the maintenance
+commands against synthetic data at several scales.
+
+For each scale a scratch database is created (the project database is
+not touched), filled by library.synthetic.build_dataset and measured:
+each view is requested --rounds times after one cold request, each
+command is run once. Latency (p50/p95) and SQL query counts (on the main
+thread's connection) are printed and written as JSON, so runs can be
+compared between releases.
+A private in-memory cache is used, so the project cache is not touched
+either.
+
+Usage: python manage.py bench_library [--scales 1000 10000 100000] [--rounds 20] [--output bench_library.json]
+"""
+
+import json
+import os
+import platform
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from io import StringIO
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from library.models import Book, User
+from library.pagination import encode_cursor
+from library.synthetic import GENRES, SEARCH_TERM, build_dataset
+
+BENCH_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench_library'}}
+
+# Run in this order; the later ones change the data the earlier ones read
+COMMANDS = (
+    ('rebuild_availability', ['--check']),
+    ('send_due_reminders', []),
+    ('process_outbox', []),
+    ('expire_reservations', []),
+    ('mark_lost_books', []),
+)
+
+
+class QueryCounter:
+    """execute_wrapper that counts statements without keeping them (no 9000-query log limit)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0
+
+
+def summarize(latencies, queries):
+    return {
+        'runs': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'queries': max(queries),
+    }
+
+
+@contextmanager
+def scratch_database():
+    """A freshly migrated copy of the default database (a temp file on SQLite)"""
+    old_name = connection.settings_dict['NAME']
+    old_test = connection.settings_dict.get('TEST', {})
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST'] = {**old_test, 'NAME': os.path.join(directory, 'bench.sqlite3')}
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict['TEST'] = old_test
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the catalog, admin views and maintenance commands on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', type=int, nargs='+', default=[1000, 10000],
+            help='Number of books per run (default: 1000 10000; 100000 takes a few minutes)',
+        )
+        parser.add_argument('--rounds', type=int, default=20, help='Requests per view after the cold one (default: 20)')
+        parser.add_argument('--output', default='bench_library.json', help='JSON report path (default: bench_library.json)')
+        parser.add_argument('--label', default='', help='Free-form label stored in the report, e.g. a release tag')
+        parser.add_argument('--skip-commands', action='store_true', help='Only benchmark the views')
+
+    def handle(self, *args, **options):
+        report = {
+            'label': options['label'],
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'sqlite': sqlite3.sqlite_version if connection.vendor == 'sqlite' else None,
+            'rounds': options['rounds'],
+            'scales': {},
+        }
+
+        setup_test_environment()  # Allows the test client's host and keeps emails in memory
+        try:
+            with override_settings(CACHES=BENCH_CACHES):
+                for scale in options['scales']:
+                    report['scales'][str(scale)] = self.run_scale(scale, options)
+        finally:
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Report written to {options["output"]}'))
+
+    def run_scale(self, scale, options):
+        self.stdout.write(f'\n📚 {scale} books')
+        with scratch_database():
+            started = time.perf_counter()
+            counts = build_dataset(scale)
+            build_seconds = time.perf_counter() - started
+            self.stdout.write(
+                f'  Built {", ".join(f"{count} {name}" for name, count in counts.items())} in {build_seconds:.1f}s'
+            )
+
+            result = {'dataset': counts, 'build_seconds': round(build_seconds, 2), 'views': {}, 'commands': {}}
+            for name, stats in self.bench_views(options['rounds']):
+                result['views'][name] = stats
+                self.report(name, stats)
+            if not options['skip_commands']:
+                for name, stats in self.bench_commands():
+                    result['commands'][name] = stats
+                    self.report(name, stats)
+        return result
+
+    def view_scenarios(self):
+        staff = User.objects.create_user('bench_staff', 'staff@example.com', 'bench-password', is_staff=True)
+        student = User.objects.filter(is_staff=False).order_by('id').first()
+
+        # Cursor 90% of the way through the alphabetical catalog
+        deep = Book.objects.order_by('title', 'id').values_list('title', 'id')[Book.objects.count() * 9 // 10]
+        catalog = reverse('book_catalog')
+        return [
+            ('book_catalog', student, catalog, {}),
+            ('book_catalog_search', student, catalog, {'search': SEARCH_TERM}),
+            ('book_catalog_genre', student, catalog, {'genre': GENRES[0]}),
+            ('book_catalog_deep_page', student, catalog, {'cursor': encode_cursor(list(deep), 'n', ('title', 'id'))}),
+            ('admin_dashboard', staff, reverse('admin_dashboard'), {}),
+            ('admin_borrowings', staff, reverse('admin_borrowings'), {}),
+            ('admin_reservations', staff, reverse('admin_reservations'), {}),
+            ('admin_users', staff, reverse('admin_users'), {}),
+        ]
+
+    def bench_views(self, rounds):
+        client = Client()
+        for name, user, url, params in self.view_scenarios():
+            client.force_login(user)
+            latencies, queries = [], []
+            cold = None
+            for round_number in range(rounds + 1):
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    started = time.perf_counter()
+                    response = client.get(url, params)
+                    elapsed = time.perf_counter() - started
+                if response.status_code != 200:
+                    raise RuntimeError(f'{name} returned {response.status_code}')
+                if round_number == 0:
+                    cold = elapsed
+                    continue
+                latencies.append(elapsed)
+                queries.append(counter.count)
+            stats = summarize(latencies, queries)
+            stats['cold_ms'] = round(cold * 1000, 2)
+            yield name, stats
+
+    def bench_commands(self):
+        for name, args in COMMANDS:
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                call_command(name, *args, stdout=StringIO(), stderr=StringIO())
+                elapsed = time.perf_counter() - started
+            yield name, summarize([elapsed], [counter.count])
+
+    def report(self, name, stats):
+        cold = f', cold {stats["cold_ms"]:8.2f}ms' if 'cold_ms' in stats else ''
+        self.stdout.write(
+            f'  {name:<24} p50 {stats["p50_ms"]:9.2f}ms  p95 {stats["p95_ms"]:9.2f}ms  '
+            f'{stats["queries"]:>5} queries{cold}'
+        )
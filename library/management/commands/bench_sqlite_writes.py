@@ -0,0 +1,168 @@
+"""
+Management command to measure concurrent write throughput on SQLite with
+the stock connection setup and with the tuned one from settings
+(SQLITE_PRAGMAS plus IMMEDIATE transactions).
+
+Each writer thread runs reservation-shaped transactions (read a counter,
+insert a row, update the counter) against a scratch database file while
+reader threads run catalog-style queries. The project database is not
+touched.
+
+Usage: python manage.py bench_sqlite_writes [--writers 8] [--readers 4] [--seconds 5]
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+BOOKS = 200
+
+# Django's SQLite defaults before tuning: rollback journal, fsync on every
+# commit, deferred transactions, Python's 5 second lock timeout
+STOCK = {
+    'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'begin': 'BEGIN',
+    'timeout': 5.0,
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0
+
+
+def connect(path, profile):
+    conn = sqlite3.connect(path, timeout=profile['timeout'], isolation_level=None, check_same_thread=False)
+    for name, value in profile['pragmas'].items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def create_schema(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.executescript(
+        """
+        CREATE TABLE availability (book_id INTEGER PRIMARY KEY, available INTEGER NOT NULL);
+        CREATE TABLE reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX reservations_book_idx ON reservations (book_id);
+        """
+    )
+    conn.executemany('INSERT INTO availability VALUES (?, ?)', [(i, 1000) for i in range(BOOKS)])
+    conn.close()
+
+
+class Result:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commits = 0
+        self.reads = 0
+        self.lock_errors = 0
+        self.latencies = []
+
+
+def writer(path, profile, deadline, result, seed):
+    conn = connect(path, profile)
+    i = seed
+    while time.perf_counter() < deadline:
+        book_id = i % BOOKS
+        i += 7
+        started = time.perf_counter()
+        try:
+            conn.execute(profile['begin'])
+            conn.execute('SELECT available FROM availability WHERE book_id = ?', (book_id,)).fetchone()
+            conn.execute(
+                "INSERT INTO reservations (book_id, user_id, created_at) VALUES (?, ?, datetime('now'))",
+                (book_id, seed),
+            )
+            conn.execute('UPDATE availability SET available = available - 1 WHERE book_id = ?', (book_id,))
+            conn.execute('COMMIT')
+        except sqlite3.OperationalError:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            with result.lock:
+                result.lock_errors += 1
+            continue
+        with result.lock:
+            result.commits += 1
+            result.latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def reader(path, profile, deadline, result):
+    conn = connect(path, profile)
+    while time.perf_counter() < deadline:
+        try:
+            conn.execute(
+                'SELECT book_id, COUNT(*) FROM reservations GROUP BY book_id ORDER BY 2 DESC LIMIT 10'
+            ).fetchall()
+        except sqlite3.OperationalError:
+            with result.lock:
+                result.lock_errors += 1
+            continue
+        with result.lock:
+            result.reads += 1
+    conn.close()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent SQLite writes with the stock and the tuned connection settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Writer threads (default: 8)')
+        parser.add_argument('--readers', type=int, default=4, help='Reader threads (default: 4)')
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run (default: 5)')
+
+    def handle(self, *args, **options):
+        tuned = {
+            'pragmas': settings.SQLITE_PRAGMAS,
+            'begin': 'BEGIN IMMEDIATE',
+            'timeout': settings.SQLITE_PRAGMAS.get('busy_timeout', 5000) / 1000,
+        }
+        self.stdout.write(
+            f'🏁 {options["writers"]} writer(s), {options["readers"]} reader(s), {options["seconds"]:g}s per run'
+        )
+        results = {}
+        for label, profile in (('stock', STOCK), ('tuned', tuned)):
+            results[label] = self.run(profile, options)
+            self.report(label, results[label], options['seconds'])
+
+        if results['stock'].commits:
+            speedup = results['tuned'].commits / results['stock'].commits
+            self.stdout.write(self.style.SUCCESS(f'✅ Tuned settings: {speedup:.1f}x write throughput'))
+
+    def run(self, profile, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.sqlite3')
+            create_schema(path)
+            result = Result()
+            deadline = time.perf_counter() + options['seconds']
+            threads = [
+                threading.Thread(target=writer, args=(path, profile, deadline, result, seed))
+                for seed in range(options['writers'])
+            ] + [
+                threading.Thread(target=reader, args=(path, profile, deadline, result))
+                for _ in range(options['readers'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return result
+
+    def report(self, label, result, seconds):
+        latencies = result.latencies
+        self.stdout.write(
+            f'  {label:>5}: {result.commits / seconds:8.0f} commits/s, {result.reads / seconds:8.0f} reads/s, '
+            f'{result.lock_errors} "database is locked" error(s), '
+            f'commit p50 {percentile(latencies, 0.5) * 1000:.2f}ms / p95 {percentile(latencies, 0.95) * 1000:.2f}ms'
+        )
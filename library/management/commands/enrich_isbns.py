@@ -0,0 +1,142 @@
+"""
+Management command to bulk-import books from a list of ISBNs (e.g. a
+donation spreadsheet). Metadata comes from Google Books, fetched
+concurrently and cached in the IsbnMetadata table, so re-running the
+command or scanning the same ISBNs later does not call the API again.
+
+The file holds one ISBN per line (extra CSV columns and lines starting
+with # are ignored); use - to read from stdin.
+
+Usage: python manage.py enrich_isbns isbns.txt [--workers 16] [--no-create]
+"""
+
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from library.availability import create_empty_availability
+from library.isbn_lookup import LOOKUP_TIMEOUT, book_fields, normalize_isbn, resolve_isbns
+from library.models import Book
+
+IN_BATCH = 500  # ISBNs per isbn__in query
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Look up ISBNs from a file on Google Books (cached, concurrent) and create the missing books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File with one ISBN per line, or - for stdin')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help='Concurrent API requests (default: 16)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=LOOKUP_TIMEOUT,
+            help=f'Per-request timeout in seconds (default: {LOOKUP_TIMEOUT})',
+        )
+        parser.add_argument(
+            '--no-create',
+            action='store_true',
+            help='Only fill the metadata cache, do not create books',
+        )
+
+    def handle(self, *args, **options):
+        isbns, invalid = self.read_isbns(options['path'])
+        if invalid:
+            self.stdout.write(self.style.WARNING(f'⚠️  Skipping {len(invalid)} invalid ISBN(s): {", ".join(invalid[:10])}'))
+        if not isbns:
+            self.stdout.write(self.style.WARNING('⚠️  No ISBNs to look up'))
+            return
+
+        self.stdout.write(f'📚 Resolving {len(isbns)} ISBN(s) with {options["workers"]} workers...')
+        started = time.perf_counter()
+        result = resolve_isbns(isbns, workers=options['workers'], timeout=options['timeout'])
+        lookup_time = time.perf_counter() - started
+
+        not_found = [isbn for isbn, volume_info in result.volumes.items() if volume_info is None]
+        self.stdout.write(
+            f'  🔎 {result.hits} cache hit(s), {result.misses} fetched, '
+            f'{len(not_found)} not found, {len(result.errors)} error(s) in {lookup_time:.2f}s'
+        )
+        if result.latencies:
+            latencies = result.latencies
+            self.stdout.write(
+                f'  ⏱️  API latency: avg {sum(latencies) / len(latencies) * 1000:.0f}ms, '
+                f'p50 {percentile(latencies, 0.5) * 1000:.0f}ms, '
+                f'p95 {percentile(latencies, 0.95) * 1000:.0f}ms, '
+                f'max {max(latencies) * 1000:.0f}ms'
+            )
+        for isbn, error in list(result.errors.items())[:10]:
+            self.stdout.write(self.style.ERROR(f'  ❌ {isbn}: {error}'))
+        if result.errors:
+            self.stdout.write(self.style.WARNING('  ⚠️  Rerun the command to retry failed ISBNs'))
+
+        if not options['no_create']:
+            self.create_books(result)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Done in {elapsed:.2f}s ({len(isbns) / elapsed:.1f} ISBNs/s)')
+        )
+
+    def read_isbns(self, path):
+        try:
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+        isbns, invalid = [], []
+        with stream:
+            for line in stream:
+                value = line.split(',')[0].strip()
+                if not value or value.startswith('#') or value.lower() == 'isbn':
+                    continue
+                isbn = normalize_isbn(value)
+                if isbn:
+                    isbns.append(isbn)
+                else:
+                    invalid.append(value)
+        return list(dict.fromkeys(isbns)), invalid
+
+    def existing_isbns(self, isbns):
+        existing = set()
+        for start in range(0, len(isbns), IN_BATCH):
+            existing.update(
+                Book.objects.filter(isbn__in=isbns[start:start + IN_BATCH]).values_list('isbn', flat=True)
+            )
+        return existing
+
+    def create_books(self, result):
+        found = [isbn for isbn, volume_info in result.volumes.items() if volume_info is not None]
+        existing = self.existing_isbns(found)
+        new_isbns = [isbn for isbn in found if isbn not in existing]
+
+        books = [Book(isbn=isbn, **book_fields(result.volumes[isbn])) for isbn in new_isbns]
+        # ignore_conflicts skips rows that clash with an existing ISBN or author
+        Book.objects.bulk_create(books, batch_size=IN_BATCH, ignore_conflicts=True)
+
+        created_ids = []
+        for start in range(0, len(new_isbns), IN_BATCH):
+            created_ids.extend(
+                Book.objects.filter(isbn__in=new_isbns[start:start + IN_BATCH]).values_list('id', flat=True)
+            )
+        # bulk_create() skips post_save signals, so add the availability rows here
+        create_empty_availability(created_ids)
+
+        skipped = len(new_isbns) - len(created_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f'  📖 Created {len(created_ids)} book(s); {len(existing)} already in the catalog')
+        )
+        if skipped:
+            self.stdout.write(
+                self.style.WARNING(f'  ⚠️  {skipped} book(s) skipped because their author already has a book')
+            )
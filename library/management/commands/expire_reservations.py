@@ -1,72 +1,61 @@
+"""
+Management command to expire assigned reservations that were not picked
+up in time and hand their copies to the next pending reservations.
+Expiry is set-based (one UPDATE and one log INSERT per batch), so it is
+cheap enough to run every minute via Windows Task Scheduler or cron job.
+
+Usage: python manage.py expire_reservations [--batch-size 500]
+"""
+
+import time
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import timedelta
-from library.models import Reservation, ReservationLog
+from library.waitlist import expire_pickups
+
 
 class Command(BaseCommand):
     help = 'Expires overdue assigned reservations and auto-assigns to next pending'
 
-    def handle(self, *args, **kwargs):
-        expired = Reservation.objects.filter(
-            status='assigned',
-            expiration_date__lt=timezone.now()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Reservations expired per transaction (default: 500)',
         )
-        
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        now = timezone.now()
         expired_count = 0
         reassigned_count = 0
-        
-        for reservation in expired:
-            # Save the copy and book before expiring
-            expired_copy = reservation.copy
-            book = reservation.book
-            
-            # Expire the reservation
-            reservation.status = 'expired'
-            reservation.copy = None
-            reservation.save()
-            expired_count += 1
-            
-            self.stdout.write(self.style.WARNING(f'Expired reservation {reservation.id} for {reservation.user.username}'))
-            
-            # Log the expiration
-            ReservationLog.objects.create(
-                reservation=reservation,
-                action='expired',
-                details=f'Reservation expired after {reservation.expiration_date}'
-            )
-            
-            # Try to auto-assign the copy to next pending reservation for the same book
-            if expired_copy:
-                next_pending = Reservation.objects.filter(
-                    book=book,
-                    status='pending'
-                ).order_by('reservation_date').first()
-                
-                if next_pending:
-                    next_pending.copy = expired_copy
-                    next_pending.status = 'assigned'
-                    next_pending.expiration_date = timezone.now() + timedelta(days=3)
-                    next_pending.save()
-                    reassigned_count += 1
-                    
-                    # Log the auto-assignment
-                    ReservationLog.objects.create(
-                        reservation=next_pending,
-                        action='auto_assigned_on_expiration',
-                        details=f'Auto-assigned copy {expired_copy.location} after reservation {reservation.id} expired'
-                    )
-                    
+
+        while True:
+            expired, assignments = expire_pickups(now, options['batch_size'])
+            if not expired:
+                break
+            expired_count += len(expired)
+            reassigned_count += len(assignments)
+
+            # Per-reservation details only with -v 2, so a cron run every minute stays quiet
+            if options['verbosity'] >= 2:
+                for row in expired:
+                    self.stdout.write(self.style.WARNING(f"Expired reservation {row['id']} for {row['user__username']}"))
+                for next_pending, copy in assignments:
                     self.stdout.write(
                         self.style.SUCCESS(
-                            f'  → Auto-assigned copy {expired_copy.location} to {next_pending.user.username} (reservation {next_pending.id})'
+                            f'  → Auto-assigned copy {copy.location} to {next_pending.user.username} (reservation {next_pending.id})'
                         )
                     )
-        
+
+        elapsed = time.perf_counter() - started
+
         # Summary
         if expired_count > 0:
             summary = f'Processed {expired_count} expired reservation(s)'
             if reassigned_count > 0:
                 summary += f', auto-assigned {reassigned_count} to pending reservations'
-            self.stdout.write(self.style.SUCCESS(summary))
+            self.stdout.write(self.style.SUCCESS(f'{summary} in {elapsed:.2f}s'))
         else:
-            self.stdout.write(self.style.SUCCESS('No expired reservations found'))
\ No newline at end of file
+            self.stdout.write(self.style.SUCCESS(f'No expired reservations found ({elapsed:.2f}s)'))
@@ -0,0 +1,48 @@
+"""
+Management command to import a book catalog CSV (same format as the admin
+"Import CSV" page) without the upload size limit. Use this for catalog
+migrations; the file is streamed, so memory use stays flat.
+
+Usage: python manage.py import_books_csv catalog.csv [--chunk-size 1000]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from library.csv_import import IMPORT_CHUNK_SIZE, import_books_csv
+
+
+class Command(BaseCommand):
+    help = 'Create or update books from a CSV file in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with title, author, isbn, genre, publication_year columns')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=IMPORT_CHUNK_SIZE,
+            help=f'Rows per transaction (default: {IMPORT_CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            csv_file = open(options['path'], 'rb')
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["path"]}: {e}')
+
+        started = time.perf_counter()
+        with csv_file:
+            result = import_books_csv(csv_file, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        for error in result.errors:
+            self.stdout.write(self.style.ERROR(f'  ❌ {error}'))
+        if result.error_count > len(result.errors):
+            self.stdout.write(self.style.ERROR(f'  ... and {result.error_count - len(result.errors)} more'))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ {result.rows} row(s) in {elapsed:.2f}s ({result.rows / elapsed:.0f} rows/s): '
+                f'{result.created} created, {result.updated} updated, {result.error_count} error(s)'
+            )
+        )
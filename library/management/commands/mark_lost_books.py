@@ -2,13 +2,36 @@
 Management command to mark severely overdue books as lost and free them for the system.
 Run this daily to automatically recover books that are overdue by 14+ days.
 
-Usage: python manage.py mark_lost_books
+Only loans past the threshold are read (the due date cutoff is applied in
+the query) and they are processed in chunks: each chunk marks its copies
+lost, closes the borrowings and logs the waitlist notices with a few bulk
+statements in one transaction, so the run scales with the number of lost
+books, not the number of active loans.
+
+Usage: python manage.py mark_lost_books [--threshold 14] [--chunk-size 500] [--dry-run]
 """
 
+import time
+from datetime import timedelta
+from itertools import islice
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
+from library.audit import audit_scope, log_events
+from library.availability import refresh_book_availability
 from library.models import Borrowing, BookCopy, Reservation, ReservationLog
-from library.email_utils import send_overdue_notice
+from library.user_summary import invalidate_user_summary
+
+
+def overdue_cutoff(threshold_days, now=None):
+    """
+    Loans due before this moment are at least `threshold_days` overdue,
+    counted in calendar days like Borrowing.days_overdue()
+    """
+    now = now or timezone.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight - timedelta(days=threshold_days - 1)
 
 
 class Command(BaseCommand):
@@ -21,6 +44,12 @@ class Command(BaseCommand):
             default=14,
             help='Number of days overdue before marking as lost (default: 14)',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Loans marked lost per transaction (default: 500)',
+        )
         parser.add_argument(
             '--dry-run',
             action='store_true',
@@ -30,115 +59,118 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         threshold_days = options['threshold']
         dry_run = options['dry_run']
-        
+        self.verbosity = options['verbosity']
+
         if dry_run:
             self.stdout.write(self.style.WARNING(f'🔍 DRY RUN MODE - No changes will be made\n'))
 
         self.stdout.write(f'🔍 Checking for books overdue by {threshold_days}+ days...\n')
-        
-        # Find all severely overdue borrowings
+        started = time.perf_counter()
+
+        # Only severely overdue loans are read, streamed in chunks
         severely_overdue = Borrowing.objects.filter(
             return_date__isnull=True,
-            status='active'
-        ).select_related('user', 'copy__book')
-        
+            status='active',
+            due_date__lt=overdue_cutoff(threshold_days),
+        ).select_related('user', 'copy__book').order_by('id').iterator(chunk_size=options['chunk_size'])
+
         lost_count = 0
         notified_users = 0
-        would_mark_count = 0  # Track dry-run results
-        
-        for borrowing in severely_overdue:
-            days_overdue = borrowing.days_overdue()
-            
-            if days_overdue >= threshold_days:
-                book_copy = borrowing.copy
-                book = book_copy.book
-                user = borrowing.user
-                
+
+        while True:
+            chunk = list(islice(severely_overdue, options['chunk_size']))
+            if not chunk:
+                break
+
+            for borrowing in chunk:
                 self.stdout.write(
                     self.style.ERROR(
-                        f'⚠️  Book "{book.title}" (Copy {book_copy.location}) '
-                        f'borrowed by {user.username} is {days_overdue} days overdue'
+                        f'⚠️  Book "{borrowing.copy.book.title}" (Copy {borrowing.copy.location}) '
+                        f'borrowed by {borrowing.user.username} is {borrowing.days_overdue()} days overdue'
                     )
                 )
-                
-                if not dry_run:
-                    # Mark the copy as lost
-                    book_copy.mark_as_lost(
-                        reason=f'Not returned after {days_overdue} days overdue. '
-                               f'Borrowed by {user.username} on {borrowing.borrow_date.strftime("%Y-%m-%d")}'
-                    )
-                    
-                    # Mark the borrowing as returned (with note)
-                    borrowing.status = 'returned'
-                    borrowing.return_date = timezone.now()
-                    borrowing.save()
-                    
-                    # Create log entry
-                    ReservationLog.objects.create(
-                        reservation=None,
-                        action='book_marked_lost',
-                        details=f'Book copy {book_copy.location} of "{book.title}" marked as lost. '
-                                f'Was {days_overdue} days overdue by {user.username}.'
-                    )
-                    
-                    lost_count += 1
-                    
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'  ✓ Marked copy {book_copy.location} as lost and closed borrowing'
-                        )
-                    )
-                    
-                    # Check for pending reservations for this book
-                    pending_reservations = Reservation.objects.filter(
-                        book=book,
-                        status='pending'
-                    ).select_related('user')
-                    
-                    if pending_reservations.exists():
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f'  📧 Found {pending_reservations.count()} pending reservation(s) for this book'
-                            )
-                        )
-                        
-                        # Send notification to all waiting users
-                        for reservation in pending_reservations:
-                            # TODO: Create email template for lost book notification
-                            # For now, just log it
-                            ReservationLog.objects.create(
-                                reservation=reservation,
-                                action='notified_book_lost',
-                                details=f'User {reservation.user.username} notified that copy {book_copy.location} was marked as lost'
-                            )
-                            notified_users += 1
-                            
-                            self.stdout.write(
-                                self.style.WARNING(
-                                    f'    → Logged notification for {reservation.user.username}'
-                                )
-                            )
-                else:
-                    would_mark_count += 1
-                    self.stdout.write(
-                        self.style.WARNING(
-                            f'  [DRY RUN] Would mark copy {book_copy.location} as lost'
-                        )
-                    )
-        
+
+            if dry_run:
+                lost_count += len(chunk)
+                continue
+
+            notified_users += self.mark_lost(chunk)
+            lost_count += len(chunk)
+
+        elapsed = time.perf_counter() - started
+
         # Summary
-        if lost_count > 0 or would_mark_count > 0:
-            count_to_show = lost_count if not dry_run else would_mark_count
-            summary = f'\n{"[DRY RUN] Would mark" if dry_run else "Marked"} {count_to_show} book(s) as lost'
+        if lost_count > 0:
+            summary = f'\n{"[DRY RUN] Would mark" if dry_run else "Marked"} {lost_count} book(s) as lost'
             if notified_users > 0:
                 summary += f', notified {notified_users} waiting user(s)'
-            self.stdout.write(self.style.SUCCESS(summary))
+            self.stdout.write(self.style.SUCCESS(f'{summary} in {elapsed:.2f}s'))
         else:
-            self.stdout.write(self.style.SUCCESS('\n✅ No severely overdue books found'))
-        
+            self.stdout.write(self.style.SUCCESS(f'\n✅ No severely overdue books found ({elapsed:.2f}s)'))
+
         if not dry_run and lost_count > 0:
             self.stdout.write(
                 self.style.WARNING(
                     f'\n💡 TIP: Admin should contact the {lost_count} user(s) about lost books'
                 )
             )
+
+    def mark_lost(self, borrowings):
+        """Mark the copies lost, close the loans and log waitlist notices; returns the notice count"""
+        now = timezone.now()
+        copies = []
+        events = []
+        for borrowing in borrowings:
+            book_copy = borrowing.copy
+            days_overdue = borrowing.days_overdue()
+            book_copy.condition = 'lost'
+            book_copy.lost_date = now
+            book_copy.lost_reason = (
+                f'Not returned after {days_overdue} days overdue. '
+                f'Borrowed by {borrowing.user.username} on {borrowing.borrow_date.strftime("%Y-%m-%d")}'
+            )
+            copies.append(book_copy)
+            events.append(ReservationLog(
+                reservation=None,
+                action='book_marked_lost',
+                details=f'Book copy {book_copy.location} of "{book_copy.book.title}" marked as lost. '
+                        f'Was {days_overdue} days overdue by {borrowing.user.username}.'
+            ))
+
+        book_ids = {book_copy.book_id for book_copy in copies}
+
+        # Everyone waiting for these books is told a copy was lost (all books in one query)
+        waiting = {}
+        for reservation in Reservation.objects.filter(
+            book_id__in=book_ids, status='pending'
+        ).select_related('user').order_by('reservation_date'):
+            waiting.setdefault(reservation.book_id, []).append(reservation)
+
+        notified = 0
+        for book_copy in copies:
+            for reservation in waiting.get(book_copy.book_id, []):
+                # TODO: Create email template for lost book notification
+                # For now, just log it
+                events.append(ReservationLog(
+                    reservation=reservation,
+                    action='notified_book_lost',
+                    details=f'User {reservation.user.username} notified that copy {book_copy.location} was marked as lost'
+                ))
+                notified += 1
+                if self.verbosity >= 2:
+                    self.stdout.write(self.style.WARNING(f'    → Logged notification for {reservation.user.username}'))
+
+        with audit_scope(), transaction.atomic():
+            BookCopy.objects.filter(id__in=[book_copy.id for book_copy in copies]).update(condition='lost', lost_date=now)
+            BookCopy.objects.bulk_update(copies, ['lost_reason'])  # The only per-copy value
+            Borrowing.objects.filter(
+                id__in=[borrowing.id for borrowing in borrowings], return_date__isnull=True
+            ).update(status='returned', return_date=now)
+            log_events(events)
+
+            # bulk_update() and update() skip the post_save signals
+            refresh_book_availability(book_ids)
+            invalidate_user_summary({borrowing.user_id for borrowing in borrowings})
+
+        self.stdout.write(self.style.SUCCESS(f'  ✓ Marked {len(copies)} cop(ies) as lost and closed their borrowings'))
+        return notified
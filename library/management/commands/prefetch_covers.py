@@ -0,0 +1,119 @@
+"""
+Management command to look up Google Books covers for the catalog.
+Run this after importing books and then daily via Windows Task Scheduler
+or cron job; pages only ever show covers that this command has stored.
+
+Set GOOGLE_BOOKS_API_URL to point it at a local stub.
+
+Usage: python manage.py prefetch_covers [--workers 8] [--rate 5] [--limit 500]
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from library.covers import (
+    ERROR_RETRY, NO_COVER_RETRY, RateLimiter, books_needing_covers, fetch_cover_url,
+)
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Resolve missing book cover URLs from Google Books and store them on the books'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Concurrent API requests (default: 8)',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=5,
+            help='Maximum API requests per second, 0 for no limit (default: 5)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Only look up this many books',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=5,
+            help='Per-request timeout in seconds (default: 5)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Books saved per bulk update (default: 100)',
+        )
+
+    def handle(self, *args, **options):
+        books = books_needing_covers().only('id', 'isbn', 'cover_url', 'cover_retry_after').order_by('id')
+        if options['limit']:
+            books = books[:options['limit']]
+        books = list(books)
+
+        if not books:
+            self.stdout.write(self.style.SUCCESS('✅ All book covers are up to date'))
+            return
+
+        self.stdout.write(
+            f'🖼️  Looking up covers for {len(books)} book(s) via {settings.GOOGLE_BOOKS_API_URL} '
+            f'({options["workers"]} workers, {options["rate"] or "unlimited"} req/s)...'
+        )
+
+        limiter = RateLimiter(options['rate'])
+        timeout = options['timeout']
+
+        def lookup(book):
+            limiter.wait()
+            try:
+                return book, fetch_cover_url(book.isbn, timeout=timeout), None
+            except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+                return book, None, e
+
+        found = missing = failed = 0
+        pending = []
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for book, cover_url, error in pool.map(lookup, books):
+                now = timezone.now()
+                if error is not None:
+                    failed += 1
+                    book.cover_url = Book.NO_COVER
+                    book.cover_retry_after = now + ERROR_RETRY
+                    self.stdout.write(self.style.WARNING(f'  ⚠️  {book.isbn}: {error}'))
+                elif cover_url:
+                    found += 1
+                    book.cover_url = cover_url
+                    book.cover_retry_after = None
+                else:
+                    missing += 1
+                    book.cover_url = Book.NO_COVER
+                    book.cover_retry_after = now + NO_COVER_RETRY
+
+                pending.append(book)
+                if len(pending) >= options['batch_size']:
+                    Book.objects.bulk_update(pending, ['cover_url', 'cover_retry_after'])
+                    pending = []
+
+        if pending:
+            Book.objects.bulk_update(pending, ['cover_url', 'cover_retry_after'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ {found} cover(s) found, {missing} without a cover, {failed} failed '
+                f'in {elapsed:.2f}s ({len(books) / elapsed:.1f} books/s)'
+            )
+        )
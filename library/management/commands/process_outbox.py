@@ -0,0 +1,72 @@
+"""
+Management command to deliver queued notification emails from the outbox.
+Run this every minute via Windows Task Scheduler or cron job, or keep one
+worker running with --watch.
+
+Usage: python manage.py process_outbox [--batch-size 50] [--watch]
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from library.models import EmailOutbox
+from library.outbox import OutboxStats, process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send pending emails from the outbox over one SMTP connection, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Messages loaded and sent per batch (default: 50)',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=settings.OUTBOX_MAX_ATTEMPTS,
+            help=f'Attempts before a message is dead-lettered (default: {settings.OUTBOX_MAX_ATTEMPTS})',
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Keep running and poll the outbox every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='Seconds between polls in --watch mode (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            stats = OutboxStats()
+            try:
+                process_outbox(options['batch_size'], options['max_attempts'], stats)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'❌ Could not connect to the mail server: {e}'))
+            self.report(stats)
+
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
+
+    def report(self, stats):
+        if stats.sent or stats.retried or stats.dead:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'✅ Sent {stats.sent} email(s) in {stats.batches} batch(es), '
+                    f'{stats.elapsed:.2f}s ({stats.rate:.1f} msg/s)'
+                )
+            )
+        if stats.retried:
+            self.stdout.write(self.style.WARNING(f'⚠️  {stats.retried} email(s) failed and will be retried'))
+        if stats.dead:
+            self.stdout.write(self.style.ERROR(f'❌ {stats.dead} email(s) dead-lettered after too many attempts'))
+
+        pending = EmailOutbox.objects.filter(status='pending').count()
+        self.stdout.write(f'📬 {pending} email(s) pending in the outbox')
@@ -0,0 +1,62 @@
+"""
+Management command to rebuild the materialized BookAvailability counters.
+Counters are kept in sync automatically; run this after raw SQL edits,
+data imports or if you suspect drift.
+
+Usage: python manage.py rebuild_availability [--check]
+"""
+
+from django.core.management.base import BaseCommand
+from library.models import Book, BookAvailability
+from library.availability import COUNTER_FIELDS, compute_book_availability, refresh_book_availability
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-book availability counters and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report books whose counters have drifted, do not fix them',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of books recomputed per query (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        check_only = options['check']
+        batch_size = options['batch_size']
+
+        book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+        drifted = 0
+
+        for start in range(0, len(book_ids), batch_size):
+            batch = book_ids[start:start + batch_size]
+            expected = compute_book_availability(batch)
+            stored = {
+                row['book_id']: row
+                for row in BookAvailability.objects.filter(book_id__in=batch).values('book_id', *COUNTER_FIELDS)
+            }
+
+            stale_ids = [
+                book_id for book_id, counters in expected.items()
+                if book_id not in stored or any(stored[book_id][f] != counters[f] for f in COUNTER_FIELDS)
+            ]
+            drifted += len(stale_ids)
+
+            for book_id in stale_ids:
+                self.stdout.write(self.style.WARNING(f'  Drift for book {book_id}: {expected[book_id]}'))
+
+            if stale_ids and not check_only:
+                refresh_book_availability(stale_ids)
+
+        if drifted == 0:
+            self.stdout.write(self.style.SUCCESS(f'✅ All {len(book_ids)} availability rows are up to date'))
+        elif check_only:
+            self.stdout.write(self.style.WARNING(f'⚠️  {drifted} of {len(book_ids)} book(s) have drifted counters'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ Rebuilt availability for {drifted} of {len(book_ids)} book(s)'))
@@ -7,6 +7,7 @@ Example: python manage.py restore_lost_book 3-B-4
 """
 
 from django.core.management.base import BaseCommand
+from library.audit import log_event
 from library.models import BookCopy, Reservation
 
 
@@ -124,10 +125,9 @@ class Command(BaseCommand):
             )
         
         # Log the restoration
-        from library.models import ReservationLog
-        ReservationLog.objects.create(
-            reservation=None,
-            action='lost_book_restored',
-            details=f'Book copy {location} of "{book.title}" was restored. '
-                   f'Previous reason: {old_reason}'
+        log_event(
+            None,
+            'lost_book_restored',
+            f'Book copy {location} of "{book.title}" was restored. '
+            f'Previous reason: {old_reason}'
         )
@@ -0,0 +1,127 @@
+"""
+Management command that stands in for a Prometheus server: scrapes the
+/metrics endpoint, checks that it parses, and prints a summary. With
+--count above 1 it scrapes every --interval seconds and reports the
+change since the previous scrape, like rate() and histogram_quantile()
+over that window.
+
+The bearer token defaults to settings.METRICS_TOKEN.
+
+Usage: python manage.py scrape_metrics [--url http://127.0.0.1:8000/metrics] [--token TOKEN] [--count 1] [--interval 15]
+"""
+
+import time
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from library.metrics import METRICS, parse
+
+
+def by_label(samples, name, label):
+    """{label value: sample value} for one sample name"""
+    return {dict(labels).get(label, ''): value for (sample, labels), value in samples.items() if sample == name}
+
+
+def bucket_quantile(samples, name, fraction, **labels):
+    """Upper bound of the histogram bucket holding the given quantile, in seconds"""
+    buckets = sorted(
+        (float(dict(sample_labels)['le']), value)
+        for (sample, sample_labels), value in samples.items()
+        if sample == f'{name}_bucket'
+        and all(dict(sample_labels).get(label) == wanted for label, wanted in labels.items())
+    )
+    if not buckets or not buckets[-1][1]:
+        return None
+    for bound, count in buckets:
+        if count >= buckets[-1][1] * fraction:
+            return bound
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Scrape /metrics like a Prometheus server would and print a summary'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000/metrics',
+            help='Metrics endpoint (default: http://127.0.0.1:8000/metrics)',
+        )
+        parser.add_argument('--token', default=None, help='Bearer token (default: settings.METRICS_TOKEN)')
+        parser.add_argument('--count', type=int, default=1, help='Number of scrapes (default: 1)')
+        parser.add_argument('--interval', type=float, default=15, help='Seconds between scrapes (default: 15)')
+
+    def handle(self, *args, **options):
+        previous = None
+        for number in range(options['count']):
+            if number:
+                time.sleep(options['interval'])
+            samples = self.scrape(options['url'], options['token'] or settings.METRICS_TOKEN)
+            if previous is None:
+                self.stdout.write(self.style.SUCCESS(f'✅ {len(samples)} samples, totals since the counters started'))
+                self.report(samples)
+            else:
+                self.stdout.write(self.style.SUCCESS(f'\n✅ Change over the last {options["interval"]:g}s'))
+                counters = {
+                    key: value - previous.get(key, 0)
+                    for key, value in samples.items()
+                    if METRICS.get(key[0], ('counter',))[0] != 'gauge'
+                }
+                self.report(counters, gauges=samples)
+            previous = samples
+
+    def scrape(self, url, token):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        started = time.perf_counter()
+        try:
+            response = requests.get(url, headers=headers, timeout=10)
+            response.raise_for_status()
+            samples = parse(response.text)
+        except (requests.RequestException, ValueError) as e:
+            raise CommandError(f'Scrape of {url} failed: {e}')
+        self.stdout.write(f'📡 Scraped {url} in {(time.perf_counter() - started) * 1000:.1f}ms')
+        return samples
+
+    def report(self, samples, gauges=None):
+        """Counters from `samples`, gauges from `gauges` (the latest scrape)"""
+        gauges = samples if gauges is None else gauges
+
+        counts = by_label(samples, 'library_request_duration_seconds_count', 'view')
+        seconds = by_label(samples, 'library_request_duration_seconds_sum', 'view')
+        queries = by_label(samples, 'library_db_queries_total', 'view')
+        if any(counts.values()):
+            self.stdout.write('\n🌐 Requests')
+            for view, count in sorted(counts.items(), key=lambda item: -item[1]):
+                if not count:
+                    continue
+                p95 = bucket_quantile(samples, 'library_request_duration_seconds', 0.95, view=view)
+                self.stdout.write(
+                    f'  {view:<32} {count:>8.0f} req  mean {seconds[view] / count * 1000:8.1f}ms  '
+                    f'p95 ≤ {p95 * 1000 if p95 is not None else 0:g}ms  {queries.get(view, 0) / count:5.1f} queries/req'
+                )
+
+        hits = by_label(samples, 'library_cache_hits_total', 'cache')
+        misses = by_label(samples, 'library_cache_misses_total', 'cache')
+        if hits or misses:
+            self.stdout.write('\n🗄️  Cache hit ratio')
+            for name in sorted(set(hits) | set(misses)):
+                total = hits.get(name, 0) + misses.get(name, 0)
+                ratio = f'{hits.get(name, 0) / total:6.1%}' if total else '     -'
+                self.stdout.write(f'  {name:<16} {ratio}  ({total:.0f} lookups)')
+
+        self.stdout.write('\n🔌 Outbound calls')
+        for label, histogram, failures in (
+            ('Google Books', 'library_google_books_request_duration_seconds', 'library_google_books_failures_total'),
+            ('Email', 'library_email_send_duration_seconds', 'library_email_failures_total'),
+        ):
+            calls = sum(by_label(samples, f'{histogram}_count', 'kind').values())
+            total_seconds = sum(by_label(samples, f'{histogram}_sum', 'kind').values())
+            failed = sum(by_label(samples, failures, 'kind').values())
+            mean = f'mean {total_seconds / calls * 1000:.1f}ms' if calls else 'no calls'
+            self.stdout.write(f'  {label:<16} {calls:>6.0f} calls  {failed:>4.0f} failed  {mean}')
+
+        self.stdout.write('\n📊 Gauges')
+        for name in (name for name, (kind, _) in METRICS.items() if kind == 'gauge'):
+            value = gauges.get((name, ()))
+            self.stdout.write(f'  {name:<32} {"-" if value is None else f"{value:.0f}"}')
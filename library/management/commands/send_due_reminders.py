@@ -2,16 +2,41 @@
 Management command to send due date reminders and overdue notices.
 Run this daily via Windows Task Scheduler or cron job.
 
-Usage: python manage.py send_due_reminders
+Every email is recorded in the ReminderDelivery ledger, so rerunning the
+command on the same day skips loans that were already notified. With the
+outbox, the outbox row and the ledger row are written in one transaction
+per loan. An email sent directly is recorded as soon as the send
+succeeds, and failed sends are left out so the next run retries them.
+
+--batch is for days with thousands of loans due at once (semester end):
+each template is compiled once, emails are rendered by a thread pool and
+sent over a single SMTP connection, bypassing the outbox.
+
+Usage: python manage.py send_due_reminders [--batch] [--workers 4] [--chunk-size 100]
 """
 
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.template.loader import get_template
 from django.utils import timezone
+from django.utils.html import strip_tags
 from datetime import timedelta
-from library.models import Borrowing
-from library.email_utils import send_due_date_reminder, send_overdue_notice
+from library import metrics
+from library.models import Borrowing, ReminderDelivery
+from library.email_utils import deliver_email, due_date_reminder_email, overdue_notice_email, render_reminder
+from library.outbox import add_email
 from django.conf import settings
 
+EMAIL_BUILDERS = {
+    'due_reminder': due_date_reminder_email,
+    'overdue_notice': overdue_notice_email,
+}
+
 
 class Command(BaseCommand):
     help = 'Send due date reminders (2 days before) and overdue notices for borrowings'
@@ -22,9 +47,36 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what emails would be sent without actually sending them',
         )
+        parser.add_argument(
+            '--batch',
+            action='store_true',
+            help='Render in parallel and send in chunks over one SMTP connection (for large runs)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Rendering threads in --batch mode (default: 4)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Emails rendered per round in --batch mode (default: 100)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Send even to loans already notified today',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
+        batch = options['batch']
+        self.sent_count = 0
+        self.failed_count = 0
+        self.connection = None
+        started = time.perf_counter()
         
         if dry_run:
             self.stdout.write(self.style.WARNING('🔍 DRY RUN MODE - No emails will be sent\n'))
@@ -42,22 +94,27 @@ class Command(BaseCommand):
                 return_date__isnull=True,
                 user__email__isnull=False  # Only users with email
             ).select_related('user', 'copy__book')
+            if not options['force']:
+                due_soon_borrowings = self.not_yet_sent(due_soon_borrowings, 'due_reminder', today)
             
             reminder_count = 0
             self.stdout.write(f'\n📧 Checking for books due on {reminder_date}...')
             
-            for borrowing in due_soon_borrowings:
-                if borrowing.user.email:
-                    if not dry_run:
-                        send_due_date_reminder(borrowing.user, borrowing)
+            if batch:
+                reminder_count = len(self.send_batch('due_reminder', due_soon_borrowings, today, options))
+            else:
+                for borrowing in due_soon_borrowings:
+                    if borrowing.user.email:
+                        if not dry_run and not self.deliver('due_reminder', borrowing, today):
+                            continue
                     
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'  ✓ {"[DRY RUN] Would send" if dry_run else "Sent"} reminder to {borrowing.user.email} '
-                            f'for "{borrowing.copy.book.title}"'
+                        self.stdout.write(
+                            self.style.SUCCESS(
+                                f'  ✓ {"[DRY RUN] Would send" if dry_run else "Sent"} reminder to {borrowing.user.email} '
+                                f'for "{borrowing.copy.book.title}"'
+                            )
                         )
-                    )
-                    reminder_count += 1
+                        reminder_count += 1
             
             if reminder_count == 0:
                 self.stdout.write('  ℹ️  No due date reminders to send today')
@@ -80,6 +137,8 @@ class Command(BaseCommand):
                 return_date__isnull=True,
                 user__email__isnull=False  # Only users with email
             ).select_related('user', 'copy__book')
+            if not options['force']:
+                overdue_borrowings = self.not_yet_sent(overdue_borrowings, 'overdue_notice', today)
             
             overdue_count = 0
             urgent_count = 0
@@ -87,50 +146,54 @@ class Command(BaseCommand):
             
             self.stdout.write(f'\n🚨 Checking for overdue books...')
             
-            for borrowing in overdue_borrowings:
-                if borrowing.user.email:
-                    # Convert due_date to date if it's a datetime
-                    due_date = borrowing.due_date.date() if hasattr(borrowing.due_date, 'date') else borrowing.due_date
-                    days_overdue = (today - due_date).days
-                    
-                    # Escalation levels:
-                    # 1-6 days: Standard overdue notice (sent daily)
-                    # 7 days: URGENT warning
-                    # 14 days: FINAL WARNING before marking as lost
+            if batch:
+                delivered = self.send_batch('overdue_notice', overdue_borrowings, today, options)
+                for borrowing in delivered:
+                    days_overdue = (today - borrowing.due_date.date()).days
+                    urgent_count += days_overdue == 7
+                    final_warning_count += days_overdue == 14
+                overdue_count = len(delivered)
+            else:
+                for borrowing in overdue_borrowings:
+                    if borrowing.user.email:
+                        # Convert due_date to date if it's a datetime
+                        due_date = borrowing.due_date.date() if hasattr(borrowing.due_date, 'date') else borrowing.due_date
+                        days_overdue = (today - due_date).days
                     
-                    email_type = "overdue"
-                    if days_overdue == 7:
-                        email_type = "urgent"
-                        urgent_count += 1
-                    elif days_overdue == 14:
-                        email_type = "final_warning"
-                        final_warning_count += 1
+                        # Escalation levels:
+                        # 1-6 days: Standard overdue notice (sent daily)
+                        # 7 days: URGENT warning
+                        # 14 days: FINAL WARNING before marking as lost
                     
-                    if not dry_run:
-                        # Send appropriate email based on escalation level
-                        if email_type == "urgent" or email_type == "final_warning":
-                            # For now, use same email but we can create specific templates later
-                            send_overdue_notice(borrowing.user, borrowing)
-                        else:
-                            send_overdue_notice(borrowing.user, borrowing)
+                        email_type = "overdue"
+                        if days_overdue == 7:
+                            email_type = "urgent"
+                            urgent_count += 1
+                        elif days_overdue == 14:
+                            email_type = "final_warning"
+                            final_warning_count += 1
                     
-                    style_method = self.style.ERROR
-                    prefix = "⚠️ "
+                        # For now every escalation level uses the same email; specific templates can come later
+                        if not dry_run and not self.deliver('overdue_notice', borrowing, today):
+                            continue
                     
-                    if email_type == "urgent":
                         style_method = self.style.ERROR
-                        prefix = "🚨 URGENT: "
-                    elif email_type == "final_warning":
-                        style_method = self.style.ERROR  
-                        prefix = "⛔ FINAL WARNING: "
+                        prefix = "⚠️ "
+                    
+                        if email_type == "urgent":
+                            style_method = self.style.ERROR
+                            prefix = "🚨 URGENT: "
+                        elif email_type == "final_warning":
+                            style_method = self.style.ERROR  
+                            prefix = "⛔ FINAL WARNING: "
                     
-                    self.stdout.write(
-                        style_method(
-                            f'  {prefix}{"[DRY RUN] Would send" if dry_run else "Sent"} {email_type} notice to {borrowing.user.email} '
-                            f'for "{borrowing.copy.book.title}" ({days_overdue} days overdue)'
+                        self.stdout.write(
+                            style_method(
+                                f'  {prefix}{"[DRY RUN] Would send" if dry_run else "Sent"} {email_type} notice to {borrowing.user.email} '
+                                f'for "{borrowing.copy.book.title}" ({days_overdue} days overdue)'
+                            )
                         )
-                    )
-                    overdue_count += 1
+                        overdue_count += 1
             
             if overdue_count == 0:
                 self.stdout.write('  ✅ No overdue books - all good!')
@@ -146,7 +209,19 @@ class Command(BaseCommand):
                 self.style.WARNING('⚠️  Overdue notifications are disabled in settings\n')
             )
 
+        if self.connection is not None:
+            self.connection.close()
+        
         # ===== SUMMARY =====
+        if batch:
+            elapsed = time.perf_counter() - started
+            rate = self.sent_count / elapsed if elapsed else 0
+            self.stdout.write(f'\n⏱️  {self.sent_count} email(s) in {elapsed:.2f}s ({rate:.1f} msg/s)')
+        if self.failed_count:
+            self.stdout.write(
+                self.style.ERROR(f'❌ {self.failed_count} email(s) failed to send; rerun to retry them')
+            )
+        
         if not dry_run:
             self.stdout.write(
                 self.style.SUCCESS(
@@ -159,3 +234,89 @@ class Command(BaseCommand):
                     f'\n✅ Dry run completed - no emails were actually sent'
                 )
             )
+
+    def not_yet_sent(self, borrowings, kind, today):
+        """Exclude loans that already have a ledger entry of this kind for today"""
+        return borrowings.exclude(
+            Exists(ReminderDelivery.objects.filter(borrowing=OuterRef('pk'), kind=kind, sent_on=today))
+        )
+
+    def record_delivery(self, borrowing, kind, today):
+        # Ignore the row a --force rerun finds already there
+        ReminderDelivery.objects.bulk_create(
+            [ReminderDelivery(borrowing=borrowing, kind=kind, sent_on=today)], ignore_conflicts=True,
+        )
+
+    def deliver(self, kind, borrowing, today):
+        """Queue or send one email and record it in the ledger; returns False if the send failed"""
+        subject, plain_message, html_message = render_reminder(kind, borrowing.user, borrowing)
+        if settings.USE_EMAIL_OUTBOX:
+            with transaction.atomic():
+                add_email(kind, borrowing.user.email, subject, plain_message, html_message)
+                self.record_delivery(borrowing, kind, today)
+            return True
+
+        if not deliver_email(kind, borrowing.user.email, subject, plain_message, html_message):
+            self.failed_count += 1
+            self.stdout.write(self.style.ERROR(f'  ❌ Failed to send {kind} email to {borrowing.user.email}'))
+            return False
+        self.record_delivery(borrowing, kind, today)
+        return True
+
+    def send_batch(self, kind, borrowings, today, options):
+        """
+        Render `kind` emails for the borrowings with a thread pool, chunk by
+        chunk, and send them one at a time over one connection, recording each
+        success in the ledger. Returns the borrowings whose email was sent
+        (all of them in a dry run).
+        """
+        template = get_template(f'emails/{kind}.html')  # Compiled once per type
+        build_email = EMAIL_BUILDERS[kind]
+
+        def render(borrowing):
+            subject, context = build_email(borrowing.user, borrowing)
+            html_message = template.render(context)
+            message = EmailMultiAlternatives(
+                subject=subject,
+                body=strip_tags(html_message),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[borrowing.user.email],
+            )
+            message.attach_alternative(html_message, 'text/html')
+            return message
+
+        chunk_size = options['chunk_size']
+        borrowings = [borrowing for borrowing in borrowings if borrowing.user.email]
+        delivered = []
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for start in range(0, len(borrowings), chunk_size):
+                chunk = borrowings[start:start + chunk_size]
+                messages = list(pool.map(render, chunk))  # Relations are preloaded, so no queries in threads
+                if options['dry_run']:
+                    continue
+
+                if self.connection is None:
+                    self.connection = get_connection(fail_silently=False)
+                for position, (borrowing, message) in enumerate(zip(chunk, messages)):
+                    started = time.perf_counter()
+                    try:
+                        self.connection.open()  # No-op while the connection is already open
+                        if not self.connection.send_messages([message]):
+                            raise ValueError('message was not accepted for delivery')
+                    except Exception as e:
+                        # The rest of the chunk is not recorded in the ledger, so the next run retries it
+                        unsent = len(chunk) - position
+                        metrics.inc('library_email_failures_total', unsent, kind=kind)
+                        self.failed_count += unsent
+                        self.stdout.write(self.style.ERROR(f'  ❌ Failed to send {unsent} {kind} email(s): {e}'))
+                        self.connection.close()
+                        break
+                    finally:
+                        metrics.observe('library_email_send_duration_seconds', time.perf_counter() - started, kind=kind)
+
+                    self.record_delivery(borrowing, kind, today)
+                    self.sent_count += 1
+                    delivered.append(borrowing)
+
+        return borrowings if options['dry_run'] else delivered
@@ -0,0 +1,254 @@
+"""
+Prometheus metrics for the /metrics endpoint.
+
+Each process (web worker, management command) counts into an in-memory
+registry: request latency histograms and query counts per URL name
+(MetricsMiddleware), cache hits and misses per cache (record_cache() in
+library/request_metrics.py), and Google Books and email latency and
+failures (timed()). Histograms are stored as their cumulative bucket,
+sum and count samples, so every value is a plain counter.
+
+To add up all processes, each one writes its counters to its own JSON
+file in settings.METRICS_DIR. The write happens at most once per
+FLUSH_INTERVAL, from a timer thread, and again at exit. The scraped
+process sums every file with its own live counters. Files of processes
+that have exited are kept, so totals never go backwards when a worker
+is recycled. Empty the directory on deploy to start again from zero. An
+empty METRICS_DIR keeps the metrics of each process to itself.
+
+Gauges are not counted here. Pending reservations, open loans and lost
+copies are sums of the BookAvailability counters, which the circulation
+signals keep up to date. Overdue loans change with the clock, so the
+endpoint recounts them at most once a minute (see views._metrics_gauges).
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1.0  # Seconds between writes of a process's counter file
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+
+# name -> (type, help); exposition order
+METRICS = {
+    'library_request_duration_seconds': ('histogram', 'Request latency by URL name'),
+    'library_db_queries_total': ('counter', 'Database queries run by requests, by URL name'),
+    'library_cache_hits_total': ('counter', 'Cache lookups served from the cache'),
+    'library_cache_misses_total': ('counter', 'Cache lookups that had to compute the value'),
+    'library_google_books_request_duration_seconds': ('histogram', 'Google Books API request latency'),
+    'library_google_books_failures_total': ('counter', 'Google Books API requests that failed'),
+    'library_email_send_duration_seconds': ('histogram', 'Email delivery latency by kind'),
+    'library_email_failures_total': ('counter', 'Email deliveries that failed, by kind'),
+    'library_pending_reservations': ('gauge', 'Reservations waiting for a copy'),
+    'library_active_loans': ('gauge', 'Borrowings not yet returned'),
+    'library_overdue_loans': ('gauge', 'Borrowings not yet returned and past their due date'),
+    'library_lost_copies': ('gauge', 'Copies marked lost'),
+}
+
+_SAMPLE_RE = re.compile(r'^(?P<name>[a-zA-Z_:][\w:]*)(?:\{(?P<labels>.*)\})? (?P<value>\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+_BUCKET_LABELS = [(bound, ('le', _format_value(bound))) for bound in BUCKETS]
+
+
+class Registry:
+    """Counters of one process, keyed by (sample name, label pairs: sorted, then 'le' for buckets)"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.token = f'{self.pid}-{uuid.uuid4().hex[:8]}'
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.flush_pending = False
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + value
+        self.schedule_flush()
+
+    def observe(self, name, seconds, **labels):
+        """Record one histogram observation"""
+        label_items = tuple(sorted(labels.items()))
+        bucket = f'{name}_bucket'
+        with self.lock:
+            for bound, le in _BUCKET_LABELS:
+                if seconds <= bound:
+                    key = (bucket, label_items + (le,))  # 'le' last, as Prometheus writes it
+                    self.samples[key] = self.samples.get(key, 0) + 1
+            for suffix, value in (('_sum', seconds), ('_count', 1)):
+                key = (name + suffix, label_items)
+                self.samples[key] = self.samples.get(key, 0) + value
+        self.schedule_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.samples)
+
+    def schedule_flush(self):
+        if self.flush_pending or not settings.METRICS_DIR:
+            return
+        self.flush_pending = True
+        timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+        timer.daemon = True
+        timer.start()
+
+    def path(self):
+        return Path(settings.METRICS_DIR) / f'{self.token}.json'
+
+    def flush(self):
+        """Write this process's counters to its file in METRICS_DIR"""
+        self.flush_pending = False
+        if not settings.METRICS_DIR or not self.samples:
+            return
+        rows = [[name, list(labels), value] for (name, labels), value in self.snapshot().items()]
+        path = self.path()
+        temporary = path.with_name(f'.{path.name}.tmp')
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary.write_text(json.dumps(rows))
+            os.replace(temporary, path)  # Readers never see a half-written file
+        except OSError:
+            logger.warning('metrics not written file=%s', path, exc_info=True)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def registry():
+    """The registry of the current process (a forked worker starts a fresh one)"""
+    global _registry
+    if _registry is None or _registry.pid != os.getpid():
+        with _registry_lock:
+            if _registry is None or _registry.pid != os.getpid():
+                _registry = Registry()
+    return _registry
+
+
+def inc(name, value=1, **labels):
+    registry().inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    registry().observe(name, seconds, **labels)
+
+
+@contextmanager
+def timed(histogram, failures, **labels):
+    """Observe the duration of the block; count it in `failures` if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc(failures, **labels)
+        raise
+    finally:
+        observe(histogram, time.perf_counter() - started, **labels)
+
+
+@atexit.register
+def _flush_at_exit():
+    if _registry is not None and _registry.pid == os.getpid():
+        _registry.flush()
+
+
+def collect():
+    """Counters of all processes: the files in METRICS_DIR plus this process's live counters"""
+    own = registry()
+    totals = {}
+    if settings.METRICS_DIR:
+        directory = Path(settings.METRICS_DIR)
+        files = directory.glob('*.json') if directory.is_dir() else []
+        for path in files:
+            if path.name == own.path().name:
+                continue
+            try:
+                rows = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # Removed or replaced while reading
+            for name, labels, value in rows:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                totals[key] = totals.get(key, 0) + value
+    for key, value in own.snapshot().items():
+        totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _family(sample_name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        base = sample_name[:-len(suffix)] if sample_name.endswith(suffix) else None
+        if base and METRICS.get(base, ('',))[0] == 'histogram':
+            return base
+    return sample_name
+
+
+def _sort_key(item):
+    """Label order, then a histogram's buckets (by bound), sum and count"""
+    (name, labels), _ = item
+    part = 0
+    if name != _family(name):
+        part = ('_bucket', '_sum', '_count').index(name[name.rfind('_'):])
+    return ([pair for pair in labels if pair[0] != 'le'], part, float(dict(labels).get('le', 0)))
+
+
+def render(samples, gauges):
+    """Prometheus text exposition (format 0.0.4) of counter samples plus {gauge name: value}"""
+    families = {}
+    for key, value in samples.items():
+        families.setdefault(_family(key[0]), []).append((key, value))
+    for name, value in gauges.items():
+        families.setdefault(name, []).append(((name, ()), value))
+
+    lines = []
+    for family, (kind, help_text) in METRICS.items():
+        if family not in families:
+            continue
+        lines.append(f'# HELP {family} {help_text}')
+        lines.append(f'# TYPE {family} {kind}')
+        for (name, labels), value in sorted(families[family], key=_sort_key):
+            label_text = ','.join(f'{label}="{_escape(text)}"' for label, text in labels)
+            lines.append(f'{name}{{{label_text}}} {_format_value(value)}' if labels else f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def parse(text):
+    """{(sample name, sorted label pairs): value} from exposition text"""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = _SAMPLE_RE.match(line)
+        if not match:
+            raise ValueError(f'Not a metrics sample: {line!r}')
+        labels = tuple(sorted(
+            (label, re.sub(r'\\(.)', lambda escaped: '\n' if escaped[1] == 'n' else escaped[1], value))
+            for label, value in _LABEL_RE.findall(match['labels'] or '')
+        ))
+        samples[(match['name'], labels)] = float(match['value'])
+    return samples
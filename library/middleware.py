@@ -0,0 +1,151 @@
+"""
+Request middleware for the library app.
+"""
+
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+from .audit import audit_scope
+from .profiling import ProfileCapture, profiling_enabled
+from .request_metrics import MAX_LOGGED_SQL, finish_request, start_request
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure a sampled fraction of requests (settings.REQUEST_METRICS_SAMPLE_RATE):
+    query count, SQL time, repeated queries, template render time and cache
+    hits/misses (see library/request_metrics.py). Results go out as a
+    Server-Timing header and one log line per request, keyed by URL name.
+    With a sample rate of 0 the middleware is not loaded at all.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        metrics, token = start_request()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            finish_request(token)
+        total_time = time.perf_counter() - started
+
+        response['Server-Timing'] = metrics.server_timing(total_time)
+
+        if logger.isEnabledFor(logging.INFO):
+            self.log(request, response, metrics, total_time)
+        return response
+
+
+    def log(self, request, response, metrics, total_time):
+        match = request.resolver_match
+        fields = {
+            'url': match.view_name if match else 'unresolved',
+            'method': request.method,
+            'status': response.status_code,
+            **metrics.as_fields(total_time),
+        }
+        message = ' '.join(f'{name}={value}' for name, value in fields.items())
+        repeated = metrics.most_repeated()
+        if repeated:
+            sql, count = repeated
+            fields['repeated_sql'] = sql[:MAX_LOGGED_SQL]
+            message += f' repeated={count}x "{fields["repeated_sql"]}"'
+        logger.info('request %s', message, extra={'request_metrics': fields})
+
+
+class QueryCount:
+    """execute_wrapper that only counts statements"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Count every request for /metrics (library/metrics.py): latency
+    histogram and database queries per URL name. Not loaded when
+    settings.METRICS_ENABLED is off.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        queries = QueryCount()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.observe('library_request_duration_seconds', elapsed, view=view)
+        metrics.inc('library_db_queries_total', queries.count, view=view)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    cProfile the views named in settings.PROFILE_URL_NAMES and keep the
+    profiles of the slow ones (see library/profiling.py). Not loaded when
+    no URL name is configured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not settings.PROFILE_URL_NAMES:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        capture = getattr(request, '_profile_capture', None)
+        if capture is not None:
+            capture.stop()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The URL name is only known once the URL has been resolved
+        name = request.resolver_match.view_name
+        if profiling_enabled('request', name):
+            capture = ProfileCapture('request', name)
+            if capture.start():
+                request._profile_capture = capture
+
+
+class AuditLogMiddleware:
+    """Buffer reservation audit events for the whole request and write them in one INSERT"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with audit_scope():
+            return self.get_response(request)
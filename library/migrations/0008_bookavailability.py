@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Q
+
+
+def populate_availability(apps, schema_editor):
+    Book = apps.get_model('library', 'Book')
+    BookCopy = apps.get_model('library', 'BookCopy')
+    Borrowing = apps.get_model('library', 'Borrowing')
+    Reservation = apps.get_model('library', 'Reservation')
+    BookAvailability = apps.get_model('library', 'BookAvailability')
+
+    unavailable = Q(Exists(Borrowing.objects.filter(copy_id=OuterRef('pk'), return_date__isnull=True))) | \
+        Q(Exists(Reservation.objects.filter(copy_id=OuterRef('pk'), status='assigned')))
+    counts = {
+        row['book_id']: row
+        for row in BookCopy.objects.values('book_id').annotate(
+            total=Count('id', filter=~Q(condition='lost')),
+            lost=Count('id', filter=Q(condition='lost')),
+            unavailable=Count('id', filter=~Q(condition='lost') & unavailable),
+        ).order_by()
+    }
+
+    rows = []
+    for book_id in Book.objects.values_list('id', flat=True):
+        row = counts.get(book_id, {'total': 0, 'lost': 0, 'unavailable': 0})
+        rows.append(BookAvailability(
+            book_id=book_id,
+            total_copies=row['total'],
+            unavailable_copies=row['unavailable'],
+            available_copies=row['total'] - row['unavailable'],
+            lost_copies=row['lost'],
+        ))
+    BookAvailability.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_bookcopy_lost_date_bookcopy_lost_reason_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookAvailability',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='availability', serialize=False, to='library.book')),
+                ('total_copies', models.IntegerField(default=0)),
+                ('unavailable_copies', models.IntegerField(default=0)),
+                ('available_copies', models.IntegerField(default=0)),
+                ('lost_copies', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'book_availability',
+                'indexes': [models.Index(fields=['available_copies'], name='availability_available_idx')],
+            },
+        ),
+        migrations.RunPython(populate_availability, migrations.RunPython.noop),
+    ]
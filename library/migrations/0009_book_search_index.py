@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:17
+
+import django.db.models.deletion
+import library.models
+from django.db import migrations, models
+
+from library.search import install_search_index, uninstall_search_index
+
+
+def create_search_index(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_bookavailability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchEntry',
+            fields=[
+                ('book', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='library.book')),
+                ('document', library.models.FullTextField(db_column='books_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'books_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_email_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('due_reminder', 'Due Date Reminder'), ('overdue_notice', 'Overdue Notice')], max_length=20)),
+                ('sent_on', models.DateField()),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('borrowing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminder_deliveries', to='library.borrowing')),
+            ],
+            options={
+                'db_table': 'reminder_deliveries',
+                'constraints': [models.UniqueConstraint(fields=('borrowing', 'kind', 'sent_on'), name='reminder_delivery_once_per_day')],
+            },
+        ),
+    ]
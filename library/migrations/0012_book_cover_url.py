@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0011_reminder_delivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_retry_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_url',
+            field=models.URLField(blank=True, max_length=500, null=True),
+        ),
+    ]
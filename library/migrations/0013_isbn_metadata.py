@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:27
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0012_book_cover_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IsbnMetadata',
+            fields=[
+                ('isbn', models.CharField(max_length=13, primary_key=True, serialize=False)),
+                ('volume_info', models.JSONField(blank=True, null=True)),
+                ('fetched_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'isbn_metadata',
+            },
+        ),
+    ]
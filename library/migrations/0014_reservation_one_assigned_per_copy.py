@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:38
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def release_double_assignments(apps, schema_editor):
+    """Put all but the oldest reservation holding the same copy back in the queue"""
+    Reservation = apps.get_model('library', 'Reservation')
+
+    shared_copies = Reservation.objects.filter(status='assigned', copy__isnull=False).values('copy_id').annotate(
+        holders=Count('id'),
+    ).filter(holders__gt=1).values_list('copy_id', flat=True)
+
+    for copy_id in shared_copies:
+        holders = Reservation.objects.filter(status='assigned', copy_id=copy_id).order_by('reservation_date', 'id')
+        extra_ids = list(holders.values_list('id', flat=True)[1:])
+        Reservation.objects.filter(id__in=extra_ids).update(status='pending', copy=None, expiration_date=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_isbn_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(release_double_assignments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'assigned')), fields=('copy',), name='reservation_one_assigned_per_copy'),
+        ),
+    ]
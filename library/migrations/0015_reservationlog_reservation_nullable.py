@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_reservation_one_assigned_per_copy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservationlog',
+            name='reservation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='library.reservation'),
+        ),
+    ]
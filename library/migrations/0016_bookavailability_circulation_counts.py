@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-17 03:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_circulation_counts(apps, schema_editor):
+    Borrowing = apps.get_model('library', 'Borrowing')
+    Reservation = apps.get_model('library', 'Reservation')
+    BookAvailability = apps.get_model('library', 'BookAvailability')
+
+    loans = dict(
+        Borrowing.objects.filter(return_date__isnull=True, status='active')
+        .values('copy__book_id').annotate(count=Count('id')).order_by()
+        .values_list('copy__book_id', 'count')
+    )
+    pending = dict(
+        Reservation.objects.filter(status='pending')
+        .values('book_id').annotate(count=Count('id')).order_by()
+        .values_list('book_id', 'count')
+    )
+
+    rows = list(BookAvailability.objects.filter(book_id__in=set(loans) | set(pending)))
+    for row in rows:
+        row.active_loans = loans.get(row.book_id, 0)
+        row.pending_reservations = pending.get(row.book_id, 0)
+    BookAvailability.objects.bulk_update(rows, ['active_loans', 'pending_reservations'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0015_reservationlog_reservation_nullable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookavailability',
+            name='active_loans',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bookavailability',
+            name='pending_reservations',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_circulation_counts, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,9 @@ from django.db import models
 from django.core.validators import RegexValidator
 from django.utils import timezone
 from datetime import timedelta
+import logging
+
+logger = logging.getLogger(__name__)
 
 class UserManager(BaseUserManager):
     def create_superuser(self, username, email=None, password=None, **extra_fields):
@@ -32,6 +35,12 @@ class Book(models.Model):
     genre = models.CharField(max_length=50, null=True, blank=True)
     isbn = models.CharField(max_length=13, null=True, blank=True, unique=True)
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
+    # Google Books cover, filled in by `manage.py prefetch_covers`:
+    # NULL = not looked up yet, NO_COVER = none found (retry after cover_retry_after)
+    cover_url = models.URLField(max_length=500, null=True, blank=True)
+    cover_retry_after = models.DateTimeField(null=True, blank=True)
+
+    NO_COVER = ''
 
     class Meta:
         db_table = 'books'
@@ -48,51 +57,71 @@ class Book(models.Model):
         """
         Get book cover URL with fallback priority:
         1. Uploaded image (if exists)
-        2. Google Books API (if ISBN exists) - CACHED
+        2. Google Books cover stored by the prefetch_covers command
         3. Default placeholder gradient
+        Never makes network calls, so it is safe to use while rendering.
         """
         # Priority 1: Check if we have an uploaded cover
         if self.cover_image:
             return self.cover_image.url
         
-        # Priority 2: Try Google Books API if ISBN exists (with caching)
-        if self.isbn:
-            # Check cache first to avoid repeated API calls
-            from django.core.cache import cache
-            cache_key = f'book_cover_{self.isbn}'
-            cached_url = cache.get(cache_key)
-            
-            if cached_url:
-                return cached_url if cached_url != 'NO_COVER' else None
-            
-            try:
-                import requests
-                response = requests.get(
-                    f'https://www.googleapis.com/books/v1/volumes?q=isbn:{self.isbn}',
-                    timeout=2  # Reduced from 3 to 2 seconds
-                )
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('totalItems', 0) > 0:
-                        image_links = data['items'][0]['volumeInfo'].get('imageLinks', {})
-                        # Try to get the best quality available
-                        for quality in ['large', 'medium', 'small', 'thumbnail', 'smallThumbnail']:
-                            if quality in image_links:
-                                cover_url = image_links[quality]
-                                # Cache for 24 hours (86400 seconds)
-                                cache.set(cache_key, cover_url, 86400)
-                                return cover_url
-                
-                # No cover found - cache this fact too
-                cache.set(cache_key, 'NO_COVER', 86400)
-            except:
-                # API failed - cache failure for 1 hour to avoid repeated failures
-                cache.set(cache_key, 'NO_COVER', 3600)
-                pass  # Fail silently and fall back to placeholder
+        # Priority 2: Cover resolved in the background (NO_COVER or None if not found/not checked yet)
+        if self.cover_url:
+            return self.cover_url
         
         # Priority 3: Return None to use CSS gradient placeholder
         return None
 
+class IsbnMetadata(models.Model):
+    """
+    Google Books lookup result for an ISBN, kept so re-scanning or bulk
+    importing the same ISBN never calls the API again; see library/isbn_lookup.py.
+    """
+    isbn = models.CharField(max_length=13, primary_key=True)
+    volume_info = models.JSONField(null=True, blank=True)  # Google's volumeInfo; NULL if no book was found
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'isbn_metadata'
+
+    def __str__(self):
+        return f"{self.isbn} ({'found' if self.volume_info else 'not found'})"
+
+class FullTextField(models.TextField):
+    """Hidden FTS5 column named after its table; supports the `match` lookup"""
+
+
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class BookSearchEntry(models.Model):
+    """
+    Row of the books_fts FTS5 index over title/author/genre/isbn.
+    The virtual table and its sync triggers only exist on SQLite;
+    see library/search.py.
+    """
+    book = models.OneToOneField(
+        Book,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        related_name='search_entry',
+    )
+    document = FullTextField(db_column='books_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'books_fts'
+
 class BookCopy(models.Model):
     CONDITION_CHOICES = (
         ('new', 'New'),
@@ -130,6 +159,32 @@ class BookCopy(models.Model):
         self.lost_reason = reason or 'Book not returned after extended overdue period'
         self.save()
 
+class BookAvailability(models.Model):
+    """
+    Materialized copy and circulation counts for a book.
+
+    Rows are recomputed by library.availability whenever a Borrowing,
+    Reservation or BookCopy changes, so availability reads are a single
+    primary-key lookup instead of a multi-join COUNT.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='availability')
+    total_copies = models.IntegerField(default=0)  # Excludes lost copies
+    unavailable_copies = models.IntegerField(default=0)  # Borrowed or assigned to a reservation
+    available_copies = models.IntegerField(default=0)
+    lost_copies = models.IntegerField(default=0)
+    active_loans = models.IntegerField(default=0)  # Active borrowings not yet returned
+    pending_reservations = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'book_availability'
+        indexes = [
+            models.Index(fields=['available_copies'], name='availability_available_idx'),  # For "available now" filter
+        ]
+
+    def __str__(self):
+        return f"{self.book_id}: {self.available_copies}/{self.total_copies} available"
+
 class Reservation(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -153,28 +208,24 @@ class Reservation(models.Model):
             models.Index(fields=['expiration_date'], name='reservation_expiry_idx'),  # For expiry checks
             models.Index(fields=['book', 'status'], name='reservation_book_status_idx'),  # For book availability
         ]
+        constraints = [
+            # A copy can be held for at most one reservation at a time
+            models.UniqueConstraint(
+                fields=['copy'],
+                condition=models.Q(status='assigned'),
+                name='reservation_one_assigned_per_copy',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.book.title} ({self.status})"
 
     def assign_copy(self):
-        if self.status == 'pending':
-            available_copy = BookCopy.objects.filter(
-                book=self.book
-            ).exclude(
-                condition='lost'  # Never assign lost copies
-            ).exclude(
-                id__in=Reservation.objects.filter(status='assigned').values('copy_id')  # Only 'assigned', not 'picked_up'
-            ).exclude(
-                id__in=Borrowing.objects.filter(return_date__isnull=True).values('copy_id')
-            ).first()
-            if available_copy:
-                self.copy = available_copy
-                self.status = 'assigned'
-                self.expiration_date = timezone.now() + timedelta(days=3)
-                self.save()
-            else:
-                print(f"No available copy for book {self.book.title} for reservation {self.id}")
+        """Assign a free copy if this reservation is pending (see library/assignment.py)"""
+        from .assignment import assign_copy
+
+        if self.status == 'pending' and assign_copy(self) is None:
+            logger.debug('no copy available book=%s reservation=%s', self.book_id, self.id)
 
 class Borrowing(models.Model):
     STATUS_CHOICES = (
@@ -249,8 +300,33 @@ class Borrowing(models.Model):
         self.save()
         return True, f"Renewed successfully. New due date: {self.due_date.strftime('%Y-%m-%d')}"
 
+class ReminderDelivery(models.Model):
+    """
+    Ledger of due date reminders and overdue notices, one row per
+    borrowing, kind and day, so rerunning send_due_reminders never
+    emails the same loan twice on the same day.
+    """
+    KIND_CHOICES = (
+        ('due_reminder', 'Due Date Reminder'),
+        ('overdue_notice', 'Overdue Notice'),
+    )
+    borrowing = models.ForeignKey(Borrowing, on_delete=models.CASCADE, related_name='reminder_deliveries')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    sent_on = models.DateField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'reminder_deliveries'
+        constraints = [
+            models.UniqueConstraint(fields=['borrowing', 'kind', 'sent_on'], name='reminder_delivery_once_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for borrowing {self.borrowing_id} on {self.sent_on}"
+
 class ReservationLog(models.Model):
-    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE)
+    # NULL for events about a copy rather than a reservation (e.g. book_marked_lost)
+    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE, null=True, blank=True)
     action = models.CharField(max_length=50)
     action_date = models.DateTimeField(auto_now_add=True)
     details = models.TextField(null=True, blank=True)
@@ -259,4 +335,36 @@ class ReservationLog(models.Model):
         db_table = 'reservation_logs'
 
     def __str__(self):
-        return f"{self.reservation} - {self.action}"
\ No newline at end of file
+        return f"{self.reservation or 'No reservation'} - {self.action}"
+
+class EmailOutbox(models.Model):
+    """
+    Notification email waiting to be delivered by the process_outbox worker.
+    Rows are written when the surrounding transaction commits, so a rolled
+    back request never sends mail; see library/outbox.py.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),  # Waiting for first delivery or a retry
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),  # Gave up after too many failed attempts
+    )
+    kind = models.CharField(max_length=50)  # Template name, e.g. 'reservation_assigned'
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body_text = models.TextField()
+    body_html = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'email_outbox'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),  # For the worker's due batch
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.to_email} ({self.status})"
@@ -0,0 +1,163 @@
+"""
+Transactional email outbox.
+
+Request handlers never talk to the SMTP server. enqueue_email() adds an
+EmailOutbox row when the current transaction commits, and the
+process_outbox command delivers pending rows in batches over a single
+reused mail connection. Failed messages are retried with exponential
+backoff and dead-lettered after OUTBOX_MAX_ATTEMPTS.
+
+Run a single worker at a time (cron or `process_outbox --watch`).
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import EmailOutbox
+
+RETRY_BASE_SECONDS = 60  # First retry after 1 minute, then 2, 4, 8...
+RETRY_MAX_SECONDS = 6 * 60 * 60
+
+
+def add_email(kind, to_email, subject, body_text, body_html=''):
+    """
+    Write an outbox row now, in the caller's transaction. For callers that
+    record the email elsewhere in the same transaction (the reminder ledger).
+    """
+    return EmailOutbox.objects.create(
+        kind=kind,
+        to_email=to_email,
+        subject=subject,
+        body_text=body_text,
+        body_html=body_html,
+    )
+
+
+def enqueue_email(kind, to_email, subject, body_text, body_html=''):
+    """Queue an email to be written to the outbox once the transaction commits"""
+    transaction.on_commit(lambda: add_email(kind, to_email, subject, body_text, body_html))
+
+
+def enqueue_emails(kind, messages):
+    """
+    Queue many emails of one kind with a single INSERT on commit.
+    `messages` holds (to_email, subject, body_text, body_html) tuples.
+    """
+    entries = [
+        EmailOutbox(kind=kind, to_email=to_email, subject=subject, body_text=body_text, body_html=body_html)
+        for to_email, subject, body_text, body_html in messages
+    ]
+    if entries:
+        transaction.on_commit(lambda: EmailOutbox.objects.bulk_create(entries, batch_size=500))
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt after `attempts` failures"""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def build_message(entry, connection):
+    message = EmailMultiAlternatives(
+        subject=entry.subject,
+        body=entry.body_text,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[entry.to_email],
+        connection=connection,
+    )
+    if entry.body_html:
+        message.attach_alternative(entry.body_html, 'text/html')
+    return message
+
+
+class OutboxStats:
+    """Counters for one worker run"""
+
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        """Delivered messages per second"""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+def deliver_batch(entries, connection, max_attempts, stats):
+    """Send a batch over an open connection and record each outcome"""
+    now = timezone.now()
+    for entry in entries:
+        entry.attempts += 1
+        try:
+            with metrics.timed('library_email_send_duration_seconds', 'library_email_failures_total', kind=entry.kind):
+                if not connection.send_messages([build_message(entry, connection)]):
+                    raise ValueError('message was not accepted for delivery')
+        except Exception as e:
+            entry.last_error = f'{type(e).__name__}: {e}'
+            if entry.attempts >= max_attempts:
+                entry.status = 'dead'
+                stats.dead += 1
+            else:
+                entry.next_attempt_at = now + retry_delay(entry.attempts)
+                stats.retried += 1
+            # The SMTP session may be unusable after an error; start a fresh one
+            try:
+                connection.close()
+                connection.open()
+            except Exception:
+                pass  # Server still unreachable; the next send retries the connection
+        else:
+            entry.status = 'sent'
+            entry.sent_at = timezone.now()
+            entry.last_error = None
+            stats.sent += 1
+
+    EmailOutbox.objects.bulk_update(
+        entries, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+    )
+    stats.batches += 1
+
+
+def process_outbox(batch_size=50, max_attempts=None, stats=None):
+    """
+    Deliver every pending message that is due, batch by batch, over one
+    mail connection. Returns the OutboxStats for the run.
+    """
+    max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+    stats = stats or OutboxStats()
+    connection = None
+    last_id = 0
+
+    try:
+        while True:
+            # Walk forward by id so messages rescheduled in this run wait for the next one
+            entries = list(
+                EmailOutbox.objects.filter(
+                    status='pending',
+                    next_attempt_at__lte=timezone.now(),
+                    id__gt=last_id,
+                ).order_by('id')[:batch_size]
+            )
+            if not entries:
+                break
+            if connection is None:
+                connection = get_connection(fail_silently=False)
+                connection.open()
+            deliver_batch(entries, connection, max_attempts, stats)
+            last_id = entries[-1].id
+    finally:
+        if connection is not None:
+            connection.close()
+    return stats
@@ -0,0 +1,169 @@
+"""
+Keyset (seek) pagination for the catalog and admin list views.
+
+Django's Paginator runs COUNT(*) on every request and pages with OFFSET,
+so deep pages get linearly slower. KeysetPaginator instead remembers the
+sort key of the last (or first) row shown in an opaque cursor and asks
+for the rows after (or before) it with a WHERE clause on the ordering
+columns, which the database can answer from an index. Page 500 costs the
+same as page 1.
+
+The ordering must end in a unique column (normally 'id') and its columns
+must not be NULL.
+"""
+
+import base64
+import datetime
+import hashlib
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .cache_versions import get_or_compute
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keep full microsecond precision; DjangoJSONEncoder truncates to milliseconds"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, direction, ordering):
+    payload = json.dumps({'v': values, 'd': direction, 'o': ','.join(ordering)}, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = payload['v'], payload['d']
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    if payload.get('o') != ','.join(ordering):
+        raise InvalidCursor(cursor)  # Cursor from a differently sorted list (e.g. search vs browse)
+    return values, direction
+
+
+class KeysetPage:
+    """One page of results; iterable like a Paginator page"""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginate `queryset` by `ordering`, e.g. ('title', 'id') or
+    ('-reservation_date', 'id'). Names may be model fields or annotations.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+    def page(self, cursor=None):
+        """Return the page after/before `cursor`; a missing or invalid cursor gives the first page"""
+        values, direction = None, 'n'
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor, self.ordering)
+                values = self._to_python(values)
+            except (InvalidCursor, ValidationError, ValueError, TypeError):
+                values, direction = None, 'n'
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(values, backwards=direction == 'p'))
+
+        if direction == 'p':
+            # Walk backwards from the cursor, then restore display order
+            reversed_ordering = [
+                name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering
+            ]
+            rows = list(queryset.order_by(*reversed_ordering)[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = values is not None
+        else:
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = values is not None
+
+        next_cursor = encode_cursor(self._key(rows[-1]), 'n', self.ordering) if rows and has_next else None
+        previous_cursor = encode_cursor(self._key(rows[0]), 'p', self.ordering) if rows and has_previous else None
+        return KeysetPage(rows, has_next, has_previous, next_cursor, previous_cursor)
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def _to_python(self, values):
+        if len(values) != len(self.fields):
+            raise InvalidCursor(values)
+        converted = []
+        for field_name, value in zip(self.fields, values):
+            try:
+                field = self.queryset.model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                converted.append(value)  # Annotation, e.g. search rank
+            else:
+                converted.append(field.to_python(value))
+        return converted
+
+    def _seek_filter(self, values, backwards=False):
+        """
+        Rows strictly after `values` in ordering order (before, if backwards):
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            # Forward in an ascending column means "greater than"
+            greater = self.descending[i] == backwards
+            clause = Q(**{f'{field}__{"gt" if greater else "lt"}': values[i]})
+            for previous_field, previous_value in zip(self.fields[:i], values[:i]):
+                clause &= Q(**{previous_field: previous_value})
+            condition |= clause
+        return condition
+
+
+def cached_count(queryset, timeout=60 * 10):
+    """
+    COUNT(*) for a filtered queryset, cached under a key derived from its
+    SQL so repeated page loads don't recount large tables. Entries live in
+    the 'lists' namespace, so any book, copy, borrowing or reservation
+    change invalidates them.
+    """
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+    return get_or_compute('lists', f'count_{digest}', queryset.count, timeout)
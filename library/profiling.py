@@ -0,0 +1,184 @@
+"""
+Opt-in cProfile capture for slow requests and management commands.
+
+Profiling is switched on per URL name (settings.PROFILE_URL_NAMES, read by
+ProfilingMiddleware) or per command name (settings.PROFILE_COMMANDS, read
+by manage.py); '*' enables everything. The profiler runs for the whole
+request or command, but the result is only kept when it took at least
+settings.PROFILE_THRESHOLD_MS. It is then written gzip-compressed to
+settings.PROFILE_DIR, which keeps the newest settings.PROFILE_MAX_FILES
+files. Nothing leaves the machine: the "Slow profiles" admin page reads
+the files back, and a decompressed file is a regular pstats dump for
+`python -m pstats` or snakeviz.
+"""
+
+import cProfile
+import gzip
+import io
+import logging
+import marshal
+import pstats
+import re
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FILENAME_RE = re.compile(
+    r'^(?P<stamp>\d{8}T\d{12})_(?P<kind>request|command)_(?P<name>[\w.-]+)_(?P<ms>\d+)ms\.prof\.gz$'
+)
+
+
+def profiling_enabled(kind, name):
+    names = settings.PROFILE_URL_NAMES if kind == 'request' else settings.PROFILE_COMMANDS
+    return '*' in names or name in names
+
+
+class ProfileCapture:
+    """cProfile run that is saved on stop() only if it was slow"""
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.profiler = cProfile.Profile()
+        self.started = None
+
+    def start(self):
+        """Returns False if another profiler is already active in this thread"""
+        try:
+            self.profiler.enable()
+        except ValueError:
+            return False
+        self.started = time.perf_counter()
+        return True
+
+    def stop(self):
+        self.profiler.disable()
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        if elapsed_ms < settings.PROFILE_THRESHOLD_MS:
+            return None
+        try:
+            path = save_profile(self.profiler, self.kind, self.name, elapsed_ms)
+        except OSError:
+            # A full or read-only disk must never break the request or command
+            logger.exception('profile not saved kind=%s name=%s', self.kind, self.name)
+            return None
+        logger.info('profile saved kind=%s name=%s ms=%.0f file=%s', self.kind, self.name, elapsed_ms, path.name)
+        return path
+
+
+@contextmanager
+def profiled(kind, name):
+    """Profile the block if profiling is enabled for `name`"""
+    capture = ProfileCapture(kind, name) if profiling_enabled(kind, name) else None
+    if capture is None or not capture.start():
+        yield
+        return
+    try:
+        yield
+    finally:
+        capture.stop()
+
+
+def profile_command(argv):
+    """Used by manage.py around execute_from_command_line()"""
+    return profiled('command', argv[1] if len(argv) > 1 else 'help')
+
+
+def save_profile(profiler, kind, name, elapsed_ms):
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    profiler.create_stats()
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    safe_name = re.sub(r'[^\w.-]', '.', name)
+    path = directory / f'{stamp}_{kind}_{safe_name}_{elapsed_ms:.0f}ms.prof.gz'
+    with gzip.open(path, 'wb') as output:
+        output.write(marshal.dumps(profiler.stats))
+
+    rotate_profiles(directory)
+    return path
+
+
+def rotate_profiles(directory):
+    """Delete the oldest profiles beyond PROFILE_MAX_FILES (names start with the timestamp)"""
+    files = sorted(path for path in directory.iterdir() if FILENAME_RE.match(path.name))
+    for path in files[:-settings.PROFILE_MAX_FILES]:
+        path.unlink(missing_ok=True)
+
+
+class SavedProfile:
+    def __init__(self, path, match):
+        self.path = path
+        self.filename = path.name
+        self.kind = match['kind']
+        self.name = match['name']
+        self.ms = int(match['ms'])
+        self.captured_at = datetime.strptime(match['stamp'], '%Y%m%dT%H%M%S%f').replace(tzinfo=timezone.utc)
+        self.size = path.stat().st_size
+
+
+def saved_profiles():
+    """All saved profiles, slowest first"""
+    directory = Path(settings.PROFILE_DIR)
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in directory.iterdir():
+        match = FILENAME_RE.match(path.name)
+        if match:
+            profiles.append(SavedProfile(path, match))
+    return sorted(profiles, key=lambda profile: profile.ms, reverse=True)
+
+
+def top_offenders(profiles):
+    """Per URL name / command: capture count, slowest and mean duration, slowest first"""
+    groups = {}
+    for profile in profiles:
+        groups.setdefault((profile.kind, profile.name), []).append(profile)
+    offenders = [
+        {
+            'kind': kind,
+            'name': name,
+            'count': len(group),
+            'max_ms': max(profile.ms for profile in group),
+            'mean_ms': round(sum(profile.ms for profile in group) / len(group)),
+            'slowest': max(group, key=lambda profile: profile.ms),
+        }
+        for (kind, name), group in groups.items()
+    ]
+    return sorted(offenders, key=lambda offender: offender['max_ms'], reverse=True)
+
+
+def find_profile(filename):
+    """The saved profile with this file name, or None (never a path outside PROFILE_DIR)"""
+    match = FILENAME_RE.match(filename)
+    path = Path(settings.PROFILE_DIR) / filename
+    if not match or not path.is_file():
+        return None
+    return SavedProfile(path, match)
+
+
+class _LoadedStats:
+    """What pstats.Stats accepts in place of a Profile object"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profile_report(profile, sort='cumulative', limit=40):
+    """pstats text report of the top `limit` functions"""
+    with gzip.open(profile.path, 'rb') as source:
+        stats = marshal.loads(source.read())
+    if not stats:
+        return 'No function calls were recorded.'  # pstats refuses empty profiles
+    output = io.StringIO()
+    pstats.Stats(_LoadedStats(stats), stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
@@ -0,0 +1,146 @@
+"""
+Per-request performance metrics for RequestMetricsMiddleware.
+
+For a sampled request the middleware installs a RequestMetrics object as
+an execute_wrapper on every database connection and as the current
+metrics of the request's context. It then collects:
+
+- the query count and total SQL time
+- repeated statements: the same SQL run again with the same parameters
+  (duplicates) or with other parameters (similar, the usual N+1 shape)
+- template render time, timed by the TimedDjangoTemplates backend
+  (outermost render only, so includes are not counted twice)
+- cache hits and misses, reported by the project's cache lookups
+  through record_cache(), which also counts them for /metrics
+  (library/metrics.py)
+
+Outside a sampled request every hook is a single ContextVar lookup.
+"""
+
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from . import metrics
+
+_current = ContextVar('request_metrics', default=None)
+
+MAX_LOGGED_SQL = 200  # Characters of the most repeated statement kept in the log line
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()  # SQL text -> executions
+        self.executions = Counter()  # (SQL text, parameters) -> executions
+        self.template_time = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper hook"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+            if not many:
+                self.executions[(sql, repr(params))] += 1
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.executions.values())
+
+    @property
+    def similar(self):
+        return sum(count - 1 for count in self.statements.values())
+
+    def most_repeated(self):
+        """(SQL, executions) of the most repeated statement, or None if nothing repeated"""
+        if not self.statements:
+            return None
+        sql, count = self.statements.most_common(1)[0]
+        return (sql, count) if count > 1 else None
+
+    def as_fields(self, total_time):
+        return {
+            'ms': round(total_time * 1000, 1),
+            'queries': self.queries,
+            'sql_ms': round(self.sql_time * 1000, 1),
+            'duplicates': self.duplicates,
+            'similar': self.similar,
+            'template_ms': round(self.template_time * 1000, 1),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+    def server_timing(self, total_time):
+        """Value for the Server-Timing response header"""
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries, '
+            f'{self.duplicates} duplicate, {self.similar} similar"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'total;dur={total_time * 1000:.1f}',
+        ])
+
+
+def current_metrics():
+    """Metrics of the request being measured, or None"""
+    return _current.get()
+
+
+def start_request():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def record_cache(name, hits=0, misses=0):
+    """Count lookups in the cache `name` for /metrics and against the request being measured, if any"""
+    if hits:
+        metrics.inc('library_cache_hits_total', hits, cache=name)
+    if misses:
+        metrics.inc('library_cache_misses_total', misses, cache=name)
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.cache_hits += hits
+        request_metrics.cache_misses += misses
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+
+        metrics.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+            metrics.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render times reported to the current request's metrics"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
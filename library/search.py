@@ -0,0 +1,147 @@
+"""
+Full-text search for the book catalog.
+
+On SQLite the catalog is indexed by an FTS5 virtual table (books_fts) over
+title, author, genre and isbn. It is an external-content table: the rows
+live in `books` and triggers keep the index in sync on every insert,
+update and delete, including bulk_create() and queryset.update().
+Other databases fall back to the original icontains search.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = 'books_fts'
+INDEXED_COLUMNS = ('title', 'author', 'genre', 'isbn')
+
+# Control characters used to mark highlights so they survive HTML escaping
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_columns = ', '.join(INDEXED_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in INDEXED_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in INDEXED_COLUMNS)
+
+INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_columns},
+        content='books',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON books BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_columns} ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+]
+
+UNINSTALL_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def supports_fts(connection):
+    """True if the connection is SQLite with the FTS5 extension compiled in"""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def install_search_index(connection):
+    """Create the FTS table and sync triggers (idempotent) and (re)build the index"""
+    if not supports_fts(connection):
+        return False
+    with connection.cursor() as cursor:
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def uninstall_search_index(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in UNINSTALL_SQL:
+            cursor.execute(statement)
+
+
+_ready_databases = set()
+
+
+def search_index_ready(using='default'):
+    """True if the books_fts table exists on this database (positive result cached per process)"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    key = (using, str(connection.settings_dict['NAME']))
+    if key not in _ready_databases and FTS_TABLE in connection.introspection.table_names():
+        _ready_databases.add(key)
+    return key in _ready_databases
+
+
+def build_match_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix.
+    'harry pot' -> '"harry"* "pot"*'. Returns None if there are no words.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_books(queryset, text):
+    """
+    Filter a Book queryset by a free-text query, ordered by relevance.
+
+    Matching books are annotated with `search_rank` (lower is better) and
+    `title_highlight` / `author_highlight`, which contain the matched terms
+    wrapped in HIGHLIGHT_START/HIGHLIGHT_END (see highlight_html()).
+    """
+    if not search_index_ready(queryset.db):
+        return queryset.filter(
+            Q(title__icontains=text) |
+            Q(author__icontains=text) |
+            Q(isbn__icontains=text)
+        )
+
+    match_query = build_match_query(text)
+    if match_query is None:
+        return queryset.none()
+
+    return queryset.filter(search_entry__document__match=match_query).annotate(
+        search_rank=F('search_entry__rank'),
+        title_highlight=RawSQL(
+            f'highlight({FTS_TABLE}, 0, %s, %s)', (HIGHLIGHT_START, HIGHLIGHT_END)
+        ),
+        author_highlight=RawSQL(
+            f'highlight({FTS_TABLE}, 1, %s, %s)', (HIGHLIGHT_START, HIGHLIGHT_END)
+        ),
+    ).order_by('search_rank', 'id')
+
+
+def highlight_html(text):
+    """Escape highlighted text and turn the markers into <mark> tags"""
+    if not text:
+        return ''
+    html = escape(text).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    return mark_safe(html)
@@ -1,10 +1,17 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver  # Add this import
 from django.utils import timezone
 from datetime import timedelta
-from .models import Reservation, ReservationLog, Borrowing
+import logging
+from .models import Book, BookCopy, Reservation, Borrowing
+from .audit import log_event
+from .availability import refresh_book_availability
+from .cache_versions import invalidate_models, register
+from .user_summary import invalidate_user_summary
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 # allauth pre-social-login hook
 try:
     from allauth.socialaccount.signals import pre_social_login
@@ -40,21 +47,85 @@ except Exception:
 
 @receiver(post_save, sender=Reservation)
 def handle_reservation_save(sender, instance, created, **kwargs):
-    print(f"Signal triggered for reservation {instance.id}, status: {instance.status}, created: {created}")
+    logger.debug('reservation saved id=%s status=%s created=%s', instance.id, instance.status, created)
     if created:
-        print(f"New reservation created, assigning copy for reservation {instance.id}")
         instance.assign_copy()
-        ReservationLog.objects.create(
-            reservation=instance,
-            action='created',
-            details=f"Reservation created with status {instance.status}"
-        )
+        log_event(instance, 'created', f"Reservation created with status {instance.status}")
     else:
-        print(f"Reservation {instance.id} updated, new status: {instance.status}")
-        ReservationLog.objects.create(
-            reservation=instance,
-            action='updated',
-            details=f"Status changed to {instance.status}"
-        )
+        log_event(instance, 'updated', f"Status changed to {instance.status}")
         # Note: Borrowing creation is now handled in the confirm_pickup view
-        # to prevent race conditions and duplicate borrowing records
\ No newline at end of file
+        # to prevent race conditions and duplicate borrowing records
+
+
+# ===================================
+# AVAILABILITY COUNTERS
+# ===================================
+
+def _deleting_book(origin):
+    """True when a delete cascades from a Book (its availability row goes with it)"""
+    model = getattr(origin, 'model', None) or type(origin)
+    return model is Book
+
+
+@receiver(post_save, sender=Book)
+def create_book_availability(sender, instance, created, **kwargs):
+    if created:
+        refresh_book_availability([instance.id])
+
+
+@receiver(post_save, sender=BookCopy)
+@receiver(post_delete, sender=BookCopy)
+def update_availability_for_copy(sender, instance, origin=None, **kwargs):
+    if _deleting_book(origin):
+        return
+    refresh_book_availability([instance.book_id])
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def update_availability_for_reservation(sender, instance, origin=None, **kwargs):
+    if _deleting_book(origin):
+        return
+    refresh_book_availability([instance.book_id])
+
+
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def update_availability_for_borrowing(sender, instance, origin=None, **kwargs):
+    if _deleting_book(origin):
+        return
+    refresh_book_availability([instance.copy.book_id])
+
+
+# ===================================
+# USER CIRCULATION SUMMARY
+# ===================================
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def invalidate_summary_for_user(sender, instance, **kwargs):
+    invalidate_user_summary([instance.user_id])
+
+
+# ===================================
+# CACHE NAMESPACES
+# ===================================
+
+register(Book, 'catalog', 'dashboard', 'lists')
+register(BookCopy, 'dashboard', 'lists')
+register(Borrowing, 'dashboard', 'lists')
+register(Reservation, 'dashboard', 'lists')
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookCopy)
+@receiver(post_delete, sender=BookCopy)
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def invalidate_cache_namespaces(sender, **kwargs):
+    invalidate_models(sender)
@@ -0,0 +1,137 @@
+"""
+Synthetic library data for the bench_library command and the query
+budget tests.
+
+build_dataset(books) fills an empty database with `books` titles and
+proportional circulation: about two copies per book, one student per ten
+books, an open loan on a fifth of the copies (some of them overdue, a few
+long enough to be marked lost), one returned loan per copy, pending
+reservations on borrowed titles, assigned pickups (some already expired)
+and closed reservations. Rows are written with bulk_create, so the
+availability counters are rebuilt at the end. The same seed always gives
+the same data. Calling it again adds that much more data on top.
+"""
+
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .availability import refresh_book_availability
+from .models import Book, BookCopy, Borrowing, Reservation, User
+
+GENRES = (
+    'Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography',
+    'Poetry', 'Horror', 'Philosophy', 'Travel', 'Science', 'Children',
+)
+TITLE_WORDS = (
+    'Shadow', 'River', 'Empire', 'Garden', 'Winter', 'Dragon', 'Silent', 'Golden',
+    'Night', 'Ocean', 'Forgotten', 'City', 'Stone', 'Glass', 'Storm', 'Letters',
+    'Kingdom', 'Journey', 'Secret', 'Mountain', 'Fire', 'Northern', 'Last', 'House',
+)
+SEARCH_TERM = 'dragon'  # Appears in about 1 in 8 titles
+BATCH_SIZE = 1000
+
+
+def _location(index):
+    """Unique shelf location in the 1-A-1 format"""
+    return f'{index // 2600 + 1}-{chr(65 + index // 100 % 26)}-{index % 100 + 1}'
+
+
+def build_dataset(books, seed=0):
+    """Add a dataset of `books` titles; returns the number of rows added per table"""
+    rng = random.Random(seed)
+    now = timezone.now()
+    # Offsets keep the unique fields unique when adding to earlier data
+    first_book = Book.objects.count()
+    first_copy = BookCopy.objects.count()
+    first_user = User.objects.count()
+
+    created_books = Book.objects.bulk_create(
+        [
+            Book(
+                title=' '.join(rng.sample(TITLE_WORDS, 3)),
+                author=f'Author {i:06d}',  # Authors are unique
+                isbn=f'978{i:010d}',
+                genre=GENRES[i % len(GENRES)],
+                publication_year=1900 + rng.randrange(125),
+            )
+            for i in range(first_book, first_book + books)
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    book_ids = [book.pk for book in created_books]
+
+    copies = []
+    for book_id in book_ids:
+        copies.extend(BookCopy(book_id=book_id) for _ in range(rng.randint(1, 3)))
+    for index, book_copy in enumerate(copies):
+        book_copy.location = _location(first_copy + index)
+    created_copies = BookCopy.objects.bulk_create(copies, batch_size=BATCH_SIZE)
+    copies = [(book_copy.pk, book_copy.book_id) for book_copy in created_copies]
+
+    password = make_password('bench-password')  # Hash once, not per user
+    created_users = User.objects.bulk_create(
+        [
+            User(username=f'student{i:06d}', email=f'student{i:06d}@example.com', password=password)
+            for i in range(first_user, first_user + max(books // 10, 10))
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = [user.pk for user in created_users]
+
+    rng.shuffle(copies)
+    borrowed = copies[:len(copies) // 5]
+    assigned = copies[len(copies) // 5:len(copies) // 4]
+
+    borrowings = [
+        Borrowing(
+            user_id=rng.choice(user_ids), copy_id=copy_id, status='returned',
+            due_date=now - timedelta(days=rng.randint(20, 400)),
+            return_date=now - timedelta(days=rng.randint(1, 19)),
+        )
+        for copy_id, _ in copies
+    ]
+    for index, (copy_id, _) in enumerate(borrowed):
+        if index % 20 == 0:
+            due_date = now - timedelta(days=rng.randint(15, 60))  # Severely overdue
+        elif index % 5 == 0:
+            due_date = now - timedelta(days=rng.randint(1, 13))
+        else:
+            due_date = now + timedelta(days=rng.randint(0, 14))
+        borrowings.append(Borrowing(user_id=rng.choice(user_ids), copy_id=copy_id, due_date=due_date))
+    Borrowing.objects.bulk_create(borrowings, batch_size=BATCH_SIZE)
+
+    reservations = [
+        Reservation(
+            user_id=rng.choice(user_ids), book_id=book_id, copy_id=copy_id, status='assigned',
+            # One pickup in four has already run out
+            expiration_date=now - timedelta(hours=rng.randint(1, 72)) if index % 4 == 0 else now + timedelta(days=3),
+        )
+        for index, (copy_id, book_id) in enumerate(assigned)
+    ]
+    reservations += [
+        Reservation(user_id=rng.choice(user_ids), book_id=book_id, status='pending')
+        for _, book_id in borrowed[:len(borrowed) // 2]
+    ]
+    reservations += [
+        Reservation(
+            user_id=rng.choice(user_ids), book_id=rng.choice(book_ids),
+            status=rng.choice(('picked_up', 'canceled', 'expired')),
+        )
+        for _ in range(books // 5)
+    ]
+    Reservation.objects.bulk_create(reservations, batch_size=BATCH_SIZE)
+
+    # bulk_create() skips the signals that maintain the counters
+    for start in range(0, len(book_ids), BATCH_SIZE):
+        refresh_book_availability(book_ids[start:start + BATCH_SIZE])
+
+    return {
+        'books': len(book_ids),
+        'copies': len(copies),
+        'users': len(user_ids),
+        'borrowings': len(borrowings),
+        'reservations': len(reservations),
+    }
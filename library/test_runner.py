@@ -0,0 +1,29 @@
+"""
+Test runner for the project (settings.TEST_RUNNER).
+
+Runs the suite against a private in-memory cache, whatever CACHE_BACKEND
+the environment selects, so test runs never see entries from earlier
+runs or from a running server. Metrics stay in the test process too:
+test requests must not show up in a running server's /metrics.
+"""
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library_tests',
+    }
+}
+
+
+class LibraryTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(CACHES=TEST_CACHES, METRICS_DIR='')
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
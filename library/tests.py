@@ -1,3 +1,870 @@
-from django.test import TestCase
+import cProfile
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .assignment import assign_copy, claim_copy, free_copy_ids
+from .audit import audit_scope, log_event
+from .book_cards import card_key
+from .cache_versions import get_or_compute
+from .csv_import import import_books_csv
+from .availability import COUNTER_FIELDS, refresh_book_availability
+from .models import (
+    Book, BookAvailability, BookCopy, Borrowing, EmailOutbox, IsbnMetadata, ReminderDelivery, Reservation,
+    ReservationLog, User,
+)
+from .waitlist import expire_pickups, return_borrowings
+from . import metrics
+from .outbox import enqueue_email, process_outbox
+from .pagination import KeysetPaginator, encode_cursor
+from .profiling import save_profile, saved_profiles
+from .request_metrics import RequestMetrics
+from .search import build_match_query, search_books
+from .synthetic import SEARCH_TERM, build_dataset
+from .user_summary import get_user_summary
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    """Mail server stand-in that rejects every message"""
+
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP server unavailable')
+
+
+class OneMessageEmailBackend(BaseEmailBackend):
+    """Mail server stand-in that accepts one message, then drops the connection"""
+    accepted = 0
+
+    def send_messages(self, email_messages):
+        if OneMessageEmailBackend.accepted:
+            raise ConnectionResetError('connection lost')
+        OneMessageEmailBackend.accepted += len(email_messages)
+        mail.outbox.extend(email_messages)
+        return len(email_messages)
+
+
+class EmailOutboxTests(TestCase):
+    def queue(self, count=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                enqueue_email('due_reminder', f'user{i}@example.com', 'Reminder', 'text', '<p>html</p>')
+
+    def test_rolled_back_transaction_queues_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    enqueue_email('due_reminder', 'user@example.com', 'Reminder', 'text')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_delivers_pending_messages_in_batches(self):
+        self.queue(5)
+
+        stats = process_outbox(batch_size=2)
+
+        self.assertEqual(stats.sent, 5)
+        self.assertEqual(stats.batches, 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives[0][0], '<p>html</p>')
+        self.assertFalse(EmailOutbox.objects.exclude(status='sent').exists())
+
+    def test_skips_messages_not_yet_due(self):
+        self.queue()
+        EmailOutbox.objects.update(next_attempt_at=timezone.now() + timedelta(minutes=5))
+
+        self.assertEqual(process_outbox().sent, 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(EMAIL_BACKEND='library.tests.FailingEmailBackend')
+    def test_failed_messages_back_off_then_dead_letter(self):
+        self.queue()
+
+        stats = process_outbox(max_attempts=2)
+        entry = EmailOutbox.objects.get()
+        self.assertEqual(stats.retried, 1)
+        self.assertEqual((entry.status, entry.attempts), ('pending', 1))
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+        self.assertIn('SMTP server unavailable', entry.last_error)
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        stats = process_outbox(max_attempts=2)
+        entry.refresh_from_db()
+        self.assertEqual(stats.dead, 1)
+        self.assertEqual((entry.status, entry.attempts), ('dead', 2))
+
+
+class DueReminderLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        for n in range(3):
+            Borrowing.objects.create(
+                user=User.objects.create_user(f'reader{n}', f'reader{n}@example.com', 'pw'),
+                copy=BookCopy.objects.create(book=book, location=f'1-A-{n}'),
+                due_date=timezone.now() + timedelta(days=2),
+            )
+
+    def send_reminders(self, *args):
+        output = io.StringIO()
+        call_command('send_due_reminders', *args, stdout=output)
+        return output.getvalue()
+
+    def test_rerun_on_the_same_day_queues_nothing(self):
+        self.send_reminders()
+        self.send_reminders()
+
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+        self.assertEqual(ReminderDelivery.objects.count(), 3)
+
+    @override_settings(USE_EMAIL_OUTBOX=False)
+    def test_failed_direct_send_is_retried(self):
+        with override_settings(EMAIL_BACKEND='library.tests.FailingEmailBackend'), \
+                self.assertLogs('library.email_utils', 'ERROR'):
+            self.send_reminders()
+        self.assertFalse(ReminderDelivery.objects.exists())
+
+        self.send_reminders()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(ReminderDelivery.objects.count(), 3)
+
+    def test_batch_records_what_was_sent_before_a_failure(self):
+        OneMessageEmailBackend.accepted = 0
+        with override_settings(EMAIL_BACKEND='library.tests.OneMessageEmailBackend'):
+            output = self.send_reminders('--batch')
+        self.assertIn('Sent 1 due date reminder(s)', output)
+        self.assertEqual(ReminderDelivery.objects.count(), 1)
+
+        self.assertIn('Sent 2 due date reminder(s)', self.send_reminders('--batch'))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [
+            'reader0@example.com', 'reader1@example.com', 'reader2@example.com',
+        ])
+        self.assertEqual(ReminderDelivery.objects.count(), 3)
+
+
+class CopyAssignmentTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert')
+        self.copies = [BookCopy.objects.create(book=self.book, location=f'1-A-{i}') for i in range(2)]
+
+    def reserve(self, username):
+        user = User.objects.create_user(username, password='pw')
+        # Skip the post_save auto-assignment so the test controls the interleaving
+        return Reservation.objects.bulk_create([Reservation(user=user, book=self.book)])[0]
+
+    def test_interleaved_claims_never_share_a_copy(self):
+        first, second = self.reserve('first'), self.reserve('second')
+        # Both requests pick their candidate before either one writes
+        candidate = free_copy_ids(self.book.id)[0]
+        self.assertEqual(free_copy_ids(self.book.id)[0], candidate)
+
+        expires = timezone.now() + timedelta(days=3)
+        self.assertTrue(claim_copy(first.id, candidate, expires))
+        self.assertFalse(claim_copy(second.id, candidate, expires))
+
+        # The loser retries and gets the other copy
+        self.assertEqual(assign_copy(second), self.copies[1])
+        third = self.reserve('third')
+        self.assertIsNone(assign_copy(third))
+        self.assertEqual(Reservation.objects.filter(status='assigned').count(), 2)
+
+    def test_skips_lost_copies(self):
+        for copy in self.copies:
+            copy.mark_as_lost()
+        reservation = self.reserve('reader')
+        self.assertIsNone(assign_copy(reservation))
+        self.assertEqual(reservation.status, 'pending')
+
+
+class SearchTests(TestCase):
+    def search(self, text):
+        return list(search_books(Book.objects.all(), text).values_list('title', flat=True))
+
+    def test_fts_operators_in_user_input_are_plain_words(self):
+        self.assertEqual(build_match_query('"dune" OR her* -NEAR(x'), '"dune"* "OR"* "her"* "NEAR"* "x"*')
+        self.assertIsNone(build_match_query('"*" - ()'))
+
+        Book.objects.create(title='Dune', author='Frank Herbert')
+        Book.objects.create(title='Emma', author='Jane Austen')
+        self.assertEqual(self.search('dune -herb'), ['Dune'])  # '-' is not NOT
+        self.assertEqual(self.search('dune OR emma'), [])  # 'OR' is a word, not an operator
+        self.assertEqual(self.search('"*'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        dune = Book.objects.create(title='Dune', author='Frank Herbert')
+        emma = Book.objects.create(title='Emma', author='Jane Austen')
+
+        dune.title = 'Children of Dune'
+        dune.save()
+        Book.objects.filter(id=emma.id).update(author='Austen Jane')
+        self.assertEqual(self.search('children'), ['Children of Dune'])
+        self.assertEqual(self.search('austen jane'), ['Emma'])
+
+        dune.delete()
+        self.assertEqual(self.search('dune'), [])
+
+    def test_falls_back_to_icontains_without_the_index(self):
+        Book.objects.create(title='Dune', author='Frank Herbert')
+        with mock.patch('library.search.search_index_ready', return_value=False):
+            self.assertEqual(self.search('rank Herb'), ['Dune'])
+            self.assertEqual(self.search('herb rank'), [])
+
+
+class KeysetPaginationTests(TestCase):
+    ORDERING = ('-borrow_date', 'id')
+
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        reader = User.objects.create_user('reader', password='pw')
+        now = timezone.now()
+        for i in range(7):
+            borrowing = Borrowing.objects.create(user=reader, copy=BookCopy.objects.create(book=book, location=f'1-A-{i}'))
+            # Three timestamps shared by several rows, so pages split inside a tie
+            Borrowing.objects.filter(id=borrowing.id).update(borrow_date=now - timedelta(hours=i % 3))
+        cls.expected = list(Borrowing.objects.order_by(*cls.ORDERING).values_list('id', flat=True))
+
+    def paginator(self):
+        return KeysetPaginator(Borrowing.objects.all(), self.ORDERING, 3)
+
+    def test_pages_forward_and_back_through_ties(self):
+        pages, cursor = [], None
+        while True:
+            page = self.paginator().page(cursor)
+            pages.append([borrowing.id for borrowing in page])
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 1])
+
+        backwards = []
+        while page.has_previous:
+            page = self.paginator().page(page.previous_cursor)
+            backwards.insert(0, [borrowing.id for borrowing in page])
+        self.assertEqual(backwards, pages[:-1])
+        self.assertFalse(page.has_previous)
+
+    def test_stale_or_tampered_cursor_gives_the_first_page(self):
+        first = [borrowing.id for borrowing in self.paginator().page()]
+        unparsable = encode_cursor(['yesterday', 1], 'n', self.ORDERING)
+        for cursor in (
+            'not-a-cursor',
+            encode_cursor(['2026-01-01T00:00:00+00:00', 1], 'n', ('title', 'id')),  # Another list's ordering
+            unparsable,
+            encode_cursor([1], 'x', self.ORDERING),
+        ):
+            page = self.paginator().page(cursor)
+            self.assertEqual([borrowing.id for borrowing in page], first)
+            self.assertFalse(page.has_previous)
+
+        self.client.force_login(User.objects.create_user('librarian', password='pw', is_staff=True))
+        self.assertEqual(self.client.get(reverse('admin_borrowings'), {'cursor': unparsable}).status_code, 200)
+
+
+class AvailabilityCounterTests(TestCase):
+    def assertCounters(self, book, *expected):
+        """Stored counters equal `expected` (COUNTER_FIELDS order) and a rebuild_availability --check recount"""
+        stored = BookAvailability.objects.values_list(*COUNTER_FIELDS).get(book=book)
+        self.assertEqual(stored, expected)
+        output = io.StringIO()
+        call_command('rebuild_availability', '--check', stdout=output)
+        self.assertIn('up to date', output.getvalue())
+
+    def test_circulation_keeps_the_counters_in_sync(self):
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        first, second = (BookCopy.objects.create(book=book, location=f'1-A-{i}') for i in range(2))
+        readers = [User.objects.create_user(f'reader{i}', password='pw') for i in range(4)]
+        self.assertCounters(book, 2, 0, 2, 0, 0, 0)
+
+        borrowing = Borrowing.objects.create(user=readers[0], copy=first)
+        self.assertCounters(book, 2, 1, 1, 0, 1, 0)
+
+        holder = Reservation.objects.create(user=readers[1], book=book)  # Assigned the second copy
+        Reservation.objects.create(user=readers[2], book=book)  # Waits
+        self.assertCounters(book, 2, 2, 0, 0, 1, 1)
+
+        Reservation.objects.filter(id=holder.id).update(expiration_date=timezone.now() - timedelta(hours=1))
+        expire_pickups(timezone.now(), batch_size=10)  # The copy passes to the waiting reader
+        self.assertCounters(book, 2, 2, 0, 0, 1, 0)
+
+        return_borrowings(Borrowing.objects.select_related('user', 'copy__book').filter(id=borrowing.id))
+        self.assertCounters(book, 2, 1, 1, 0, 0, 0)
+
+        Borrowing.objects.create(user=readers[3], copy=first, due_date=timezone.now() - timedelta(days=20))
+        call_command('mark_lost_books', stdout=io.StringIO())
+        self.assertCounters(book, 1, 1, 0, 1, 0, 0)
+        self.assertEqual(second.reservation_set.get().status, 'assigned')
+
+
+class WaitlistTests(TestCase):
+    def test_returned_copies_go_to_oldest_pending_reservations(self):
+        books = [Book.objects.create(title=f'Book {i}', author=f'Author {i}') for i in range(3)]
+        borrowings = []
+        for book in books:
+            for i in range(2):
+                copy = BookCopy.objects.create(book=book, location=f'{book.id}-A-{i}')
+                borrower = User.objects.create_user(f'borrower-{copy.id}', password='pw')
+                borrowings.append(Borrowing.objects.create(user=borrower, copy=copy))
+        waiting = [User.objects.create_user(f'waiting{i}', password='pw', email=f'w{i}@example.com') for i in range(3)]
+        for user in waiting:
+            Reservation.objects.create(user=user, book=books[0])
+
+        # Includes the single outbox and audit log INSERTs run on commit
+        with self.assertNumQueries(18):
+            with self.captureOnCommitCallbacks(execute=True):
+                returned, assignments = return_borrowings(
+                    Borrowing.objects.select_related('user', 'copy__book').order_by('id')
+                )
+
+        self.assertEqual(len(returned), 6)
+        self.assertEqual([reservation.user for reservation, _ in assignments], waiting[:2])
+        self.assertEqual(
+            list(Reservation.objects.order_by('id').values_list('status', flat=True)),
+            ['assigned', 'assigned', 'pending'],
+        )
+        self.assertEqual(ReservationLog.objects.filter(action='auto_assigned_on_return').count(), 2)
+        self.assertEqual(EmailOutbox.objects.filter(kind='reservation_assigned').count(), 2)
+        self.assertEqual(books[0].availability.available_copies, 0)
+        books[1].availability.refresh_from_db()
+        self.assertEqual(books[1].availability.available_copies, 2)
+
+    def test_expired_pickups_are_released_in_batches(self):
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        for i in range(3):
+            BookCopy.objects.create(book=book, location=f'1-A-{i}')
+        holders = [Reservation.objects.create(user=User.objects.create_user(f'holder{i}'), book=book) for i in range(3)]
+        Reservation.objects.update(expiration_date=timezone.now() - timedelta(hours=1))
+        waiting = Reservation.objects.create(user=User.objects.create_user('waiting'), book=book)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first, _ = expire_pickups(timezone.now(), batch_size=2)
+            second, _ = expire_pickups(timezone.now(), batch_size=2)
+
+        self.assertEqual((len(first), len(second)), (2, 1))
+        self.assertEqual(Reservation.objects.filter(id__in=[r.id for r in holders], status='expired').count(), 3)
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.status, 'assigned')
+        self.assertEqual(ReservationLog.objects.filter(action='expired').count(), 3)
+        self.assertEqual(expire_pickups(timezone.now(), batch_size=2), ([], []))
+
+
+class AuditLogTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert')
+        BookCopy.objects.create(book=self.book, location='1-A-1')
+        self.user = User.objects.create_user('reader', password='pw', email='reader@example.com')
+
+    def test_request_writes_its_audit_events_in_one_insert(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(reverse('create_reservation', args=[self.book.id]))
+
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "reservation_logs"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            list(ReservationLog.objects.order_by('id').values_list('action', flat=True)),
+            ['updated', 'created'],
+        )
+
+    def test_rolled_back_events_are_not_written(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = Reservation.objects.create(user=self.user, book=self.book)
+            with audit_scope():
+                try:
+                    with transaction.atomic():
+                        log_event(reservation, 'discarded')
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                log_event(reservation, 'kept')
+
+        self.assertFalse(ReservationLog.objects.filter(action='discarded').exists())
+        self.assertTrue(ReservationLog.objects.filter(action='kept').exists())
+
+
+class CsvImportTests(TestCase):
+    HEADER = 'title,author,isbn,genre,publication_year\n'
+
+    def run_import(self, rows, **kwargs):
+        return import_books_csv(io.BytesIO((self.HEADER + rows).encode()), **kwargs)
+
+    def test_rows_are_created_updated_or_skipped(self):
+        Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441172719')
+
+        result = self.run_import(
+            'Dune,Frank Herbert,9780441172719,Science Fiction,1965\n'
+            'Emma,Jane Austen,,Romance,1815\n'
+            'Persuasion,Jane Austen,,Romance,1817\n'
+            ',No Title,,,\n'
+            'Dune,Frank Herbert,9780441172719,Science Fiction,1965\n'
+            'Walden,Henry Thoreau,,,18x\n',
+            chunk_size=2,
+        )
+
+        self.assertEqual((result.rows, result.created, result.updated, result.error_count), (6, 2, 1, 3))
+        self.assertEqual(result.errors, [  # Parse errors of a chunk come before its matching errors
+            'Row 5: Title and author are required',
+            'Row 4: Author "Jane Austen" already has a book ("Emma")',
+            'Row 7: Invalid year "18x"',
+        ])
+        self.assertEqual(Book.objects.get(author='Frank Herbert').genre, 'Science Fiction')
+        self.assertEqual(
+            set(Book.objects.filter(isbn__isnull=True).values_list('title', flat=True)), {'Emma', 'Walden'}
+        )
+        self.assertEqual(BookAvailability.objects.count(), 3)
+
+    def test_failed_chunk_is_saved_row_by_row(self):
+        Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441172719')
+
+        with mock.patch.object(Book.objects, 'bulk_update', side_effect=IntegrityError('collision')):
+            result = self.run_import(
+                'Dune,Frank Herbert,9780441172719,Science Fiction,1965\n'
+                'Emma,Jane Austen,9780141439587,Romance,1815\n'
+            )
+
+        self.assertEqual((result.created, result.updated, result.error_count), (1, 1, 0))
+        self.assertEqual(Book.objects.get(author='Frank Herbert').genre, 'Science Fiction')
+        self.assertTrue(BookAvailability.objects.filter(book__isbn='9780141439587').exists())
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        reader = User.objects.create_user('reader', password='pw')
+        for shelf, title in enumerate(('Dune', 'Emma')):
+            book = Book.objects.create(title=title, author=f'{title} Author')
+            Borrowing.objects.create(user=reader, copy=BookCopy.objects.create(book=book, location=f'1-A-{shelf}'))
+            Reservation.objects.create(user=reader, book=book)  # Both copies are out, so it waits
+        Reservation.objects.filter(book__title='Emma').update(status='canceled')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, dataset, **filters):
+        response = self.client.get(reverse('admin_export', args=[dataset]), {'format': 'jsonl', **filters})
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_exports_honor_the_list_filters(self):
+        self.assertEqual([row['book_title'] for row in self.export('borrowings', search='Dune')], ['Dune'])
+        self.assertEqual([row['book_title'] for row in self.export('reservations', status='pending')], ['Dune'])
+        self.assertEqual(len(self.export('reservations')), 2)
+
+    def test_export_links_keep_the_filters_but_not_the_cursor(self):
+        response = self.client.get(reverse('admin_borrowings'), {'search': 'Dune', 'cursor': 'abc'})
+        self.assertContains(response, '/export/borrowings/?search=Dune&amp;format=csv"')
+        self.assertNotContains(response, 'cursor=abc&amp;format')
+
+
+class CacheNamespaceTests(TestCase):
+    def test_book_changes_invalidate_the_genre_list(self):
+        def genres():
+            return get_or_compute('catalog', 'genres', lambda: sorted(Book.objects.values_list('genre', flat=True)), 60)
+
+        self.assertEqual(genres(), [])
+        Book.objects.create(title='Dune', author='Frank Herbert', genre='Science Fiction')
+        self.assertEqual(genres(), [])  # The bump waits for the commit
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title='Emma', author='Jane Austen', genre='Romance')
+        self.assertEqual(genres(), ['Romance', 'Science Fiction'])
+
+    def test_user_summary_is_recomputed_after_the_commit(self):
+        reader = User.objects.create_user('reader', password='pw')
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        self.assertEqual(get_user_summary(reader.id)['pending_reservations'], 0)
+
+        Reservation.objects.create(user=reader, book=book)
+        self.assertEqual(get_user_summary(reader.id)['pending_reservations'], 0)  # The bump waits for the commit
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Reservation.objects.create(user=reader, book=Book.objects.create(title='Emma', author='Jane Austen'))
+        self.assertEqual(get_user_summary(reader.id)['pending_reservations'], 2)
+
+    def test_catalog_card_is_rerendered_when_availability_changes(self):
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        self.client.force_login(User.objects.create_user('reader', password='pw'))
+
+        first = self.client.get(reverse('book_catalog')).context['books'][0]
+        self.assertIn('0 of 0 copies', cache.get(card_key(first)))
+
+        BookCopy.objects.create(book=book, location='1-A-1')
+        response = self.client.get(reverse('book_catalog'))
+        self.assertNotEqual(card_key(response.context['books'][0]), card_key(first))
+        self.assertContains(response, '1 of 1 copy')
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every page issues a fixed number of queries, whatever the table sizes.
+    Each request is measured with a cold cache on a small dataset, then
+    again after adding ten times more books, loans and reservations
+    (including the reader's own).
+    """
+    SMALL = 30
+    ISBN = '9780441172719'
+
+    # Queries per request with a cold cache
+    BUDGETS = {
+        'student_login': 0,
+        'student_logout': 4,
+        'book_catalog': 6,
+        'book_catalog_search': 6,
+        'book_catalog_more': 3,
+        'create_reservation': 29,
+        'my_reservations': 3,
+        'cancel_reservation': 13,
+        'confirm_pickup': 23,
+        'my_borrowings': 4,
+        'renew_borrowing': 10,
+        'request_return': 11,
+        'admin_dashboard': 10,
+        'admin_reservations': 4,
+        'admin_borrowings': 4,
+        'admin_users': 6,
+        'admin_user_detail': 6,
+        'admin_change_user_role': 4,
+        'admin_delete_user': 6,
+        'admin_data_management': 5,
+        'admin_import_csv': 2,
+        'admin_export_books': 3,
+        'admin_export_borrowings': 3,
+        'admin_export_reservations': 3,
+        'admin_export_logs': 3,
+        'admin_download_sample_csv': 2,
+        'admin_add_book_manual': 2,
+        'admin_add_book_isbn': 2,
+        'admin_isbn_lookup': 3,
+        'admin_scan_book': 2,
+        'admin_manage_copies': 4,
+        'admin_edit_book': 2,
+        'admin_profiles': 2,
+        'admin_profile_detail': 2,
+        'metrics': 3,
+        'admin:auth_group_changelist': 5,
+        'admin:sites_site_changelist': 5,
+        'admin:library_user_changelist': 5,
+        'admin:library_book_changelist': 7,
+        'admin:library_bookcopy_changelist': 5,
+        'admin:library_reservation_changelist': 5,
+        'admin:library_borrowing_changelist': 5,
+        'admin:library_reservationlog_changelist': 5,
+        'admin:library_bookavailability_changelist': 5,
+        'admin:library_emailoutbox_changelist': 6,
+        'admin:library_isbnmetadata_changelist': 5,
+        'admin:account_emailaddress_changelist': 5,
+        'admin:socialaccount_socialapp_changelist': 5,
+        'admin:socialaccount_socialtoken_changelist': 7,
+        'admin:socialaccount_socialaccount_changelist': 6,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        profile_dir = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(PROFILE_DIR=profile_dir, METRICS_ALLOWED_IPS=['127.0.0.1']))
+        profiler = cProfile.Profile()
+        profiler.runcall(sorted, range(10))
+        cls.profile = save_profile(profiler, 'request', 'book_catalog', 750)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        build_dataset(cls.SMALL)
+        cls.staff = User.objects.create_superuser('librarian', 'librarian@example.com', 'pw', role='admin')
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'pw')
+        IsbnMetadata.objects.create(isbn=cls.ISBN, volume_info={'title': 'Dune', 'authors': ['Frank Herbert']})
+        cls.add_reader_history(3)
+
+    @classmethod
+    def add_reader_history(cls, count):
+        """Open and returned loans plus closed reservations for the reader, on books of their own"""
+        first = Book.objects.filter(title__startswith='Reader book').count()
+        books = Book.objects.bulk_create([
+            Book(title=f'Reader book {n}', author=f'Reader author {n}') for n in range(first, first + count)
+        ])
+        copies = BookCopy.objects.bulk_create([
+            BookCopy(book=book, location=f'900-Z-{first + n}') for n, book in enumerate(books)
+        ])
+        now = timezone.now()
+        Borrowing.objects.bulk_create(
+            [Borrowing(user=cls.reader, copy=copy, due_date=now + timedelta(days=7)) for copy in copies]
+            + [Borrowing(user=cls.reader, copy=copy, due_date=now, return_date=now, status='returned') for copy in copies]
+        )
+        Reservation.objects.bulk_create([Reservation(user=cls.reader, book=book, status='canceled') for book in books])
+        refresh_book_availability(book.pk for book in books)
+
+    def fresh_book(self):
+        """A book with one free copy, so actions on it take the same path every time"""
+        number = Book.objects.count()
+        book = Book.objects.create(title=f'Fresh book {number}', author=f'Fresh author {number}')
+        BookCopy.objects.create(book=book, location=f'901-Z-{number}')
+        return book
+
+    def requests(self):
+        """(name, user, method, path, data) for every URL of the app and every admin changelist"""
+        reader, staff = self.reader, self.staff
+        # Stay under the active reservation limit across measurements
+        Reservation.objects.filter(user=reader, status__in=['pending', 'assigned']).update(status='canceled', copy=None)
+        some_book = Book.objects.order_by('id').first()
+        pending = Reservation.objects.create(user=reader, book=self.fresh_book())
+        assigned = Reservation.objects.create(user=reader, book=self.fresh_book())
+        assigned.assign_copy()
+        renewable = Borrowing.objects.create(
+            user=reader, copy=self.fresh_book().bookcopy_set.get(), due_date=timezone.now() + timedelta(days=3),
+        )
+        returning = Borrowing.objects.create(
+            user=reader, copy=self.fresh_book().bookcopy_set.get(), due_date=timezone.now() + timedelta(days=3),
+        )
+        promoted = User.objects.create_user(f'promoted{User.objects.count()}', password='pw')
+        deactivated = User.objects.create_user(f'deactivated{User.objects.count()}', password='pw')
+
+        yield 'student_login', None, 'get', reverse('student_login'), {}
+        yield 'student_logout', reader, 'get', reverse('student_logout'), {}
+        yield 'book_catalog', reader, 'get', reverse('book_catalog'), {}
+        yield 'book_catalog_search', reader, 'get', reverse('book_catalog'), {'search': SEARCH_TERM}
+        yield 'book_catalog_more', reader, 'get', reverse('book_catalog_more'), {}
+        yield 'create_reservation', reader, 'get', reverse('create_reservation', args=[self.fresh_book().id]), {}
+        yield 'my_reservations', reader, 'get', reverse('my_reservations'), {}
+        yield 'cancel_reservation', reader, 'get', reverse('cancel_reservation', args=[pending.id]), {}
+        yield 'confirm_pickup', reader, 'get', reverse('confirm_pickup', args=[assigned.id]), {}
+        yield 'my_borrowings', reader, 'get', reverse('my_borrowings'), {}
+        yield 'renew_borrowing', reader, 'get', reverse('renew_borrowing', args=[renewable.id]), {}
+        yield 'request_return', reader, 'get', reverse('request_return', args=[returning.id]), {}
+
+        yield 'admin_dashboard', staff, 'get', reverse('admin_dashboard'), {}
+        yield 'admin_reservations', staff, 'get', reverse('admin_reservations'), {}
+        yield 'admin_borrowings', staff, 'get', reverse('admin_borrowings'), {}
+        yield 'admin_users', staff, 'get', reverse('admin_users'), {}
+        yield 'admin_user_detail', staff, 'get', reverse('admin_user_detail', args=[reader.id]), {}
+        yield (
+            'admin_change_user_role', staff, 'post',
+            reverse('admin_change_user_role', args=[promoted.id]), {'role': 'teacher'},
+        )
+        yield (
+            'admin_delete_user', staff, 'post',
+            reverse('admin_delete_user', args=[deactivated.id]), {'action': 'deactivate'},
+        )
+        yield 'admin_data_management', staff, 'get', reverse('admin_data_management'), {}
+        yield 'admin_import_csv', staff, 'get', reverse('admin_import_csv'), {}
+        for dataset in ('books', 'borrowings', 'reservations', 'logs'):
+            yield f'admin_export_{dataset}', staff, 'get', reverse('admin_export', args=[dataset]), {}
+        yield 'admin_download_sample_csv', staff, 'get', reverse('admin_download_sample_csv'), {}
+        yield 'admin_add_book_manual', staff, 'get', reverse('admin_add_book_manual'), {}
+        yield 'admin_add_book_isbn', staff, 'get', reverse('admin_add_book_isbn'), {}
+        yield 'admin_isbn_lookup', staff, 'get', reverse('admin_isbn_lookup', args=[self.ISBN]), {}
+        yield 'admin_scan_book', staff, 'get', reverse('admin_scan_book'), {}
+        yield 'admin_manage_copies', staff, 'get', reverse('admin_manage_copies'), {'book_id': some_book.id}
+        yield 'admin_edit_book', staff, 'get', reverse('admin_edit_book'), {'book_id': some_book.id}
+        yield 'admin_profiles', staff, 'get', reverse('admin_profiles'), {}
+        yield 'admin_profile_detail', staff, 'get', reverse('admin_profile_detail', args=[self.profile.name]), {}
+        yield 'metrics', None, 'get', reverse('metrics'), {}
+
+        for model in admin.site._registry:
+            name = f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist'
+            yield name, staff, 'get', reverse(name), {}
+
+    def measure(self):
+        counts = {}
+        for name, user, method, path, data in self.requests():
+            cache.clear()
+            if user is None:
+                self.client.logout()
+            else:
+                self.client.force_login(user)
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                response = getattr(self.client, method)(path, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, name)
+            counts[name] = len(queries)
+        return counts
+
+    def test_query_counts_do_not_grow_with_the_data(self):
+        self.measure()  # Warm the per-process lookups (content types, FTS table check, ...)
+        small = self.measure()
+        build_dataset(self.SMALL * 10, seed=1)
+        self.add_reader_history(30)
+        large = self.measure()
+
+        self.assertEqual(set(small), set(self.BUDGETS))
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(name):
+                self.assertLessEqual(small[name], budget)
+                self.assertEqual(large[name], small[name])
+
+
+class RequestMetricsTests(TestCase):
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1)
+    def test_sampled_request_gets_server_timing_and_a_log_line(self):
+        Book.objects.create(title='Dune', author='Frank Herbert')
+        self.client.force_login(User.objects.create_user('reader', password='pw'))
+
+        with self.assertLogs('library.middleware', 'INFO') as logs:
+            response = self.client.get(reverse('book_catalog'))
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertIn('url=book_catalog ', logs.output[0])
+        self.assertEqual(logs.records[0].request_metrics['cache_misses'], 4)  # Summary, genres, count, card
+
+    def test_repeated_queries_are_counted(self):
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        other = Book.objects.create(title='Emma', author='Jane Austen')
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            for book_id in (book.id, book.id, other.id):
+                Book.objects.get(id=book_id)
+
+        self.assertEqual((metrics.queries, metrics.duplicates, metrics.similar), (3, 1, 2))
+
+
+class ProfilingTests(TestCase):
+    def test_slow_request_is_saved_and_listed(self):
+        staff = User.objects.create_superuser('librarian', 'librarian@example.com', 'pw', role='admin')
+        self.client.force_login(staff)
+
+        with tempfile.TemporaryDirectory() as profile_dir, override_settings(
+            PROFILE_DIR=profile_dir, PROFILE_URL_NAMES=['admin_dashboard'], PROFILE_THRESHOLD_MS=0,
+        ):
+            with self.assertLogs('library.profiling', 'INFO'):
+                self.client.get(reverse('admin_dashboard'))
+            self.client.get(reverse('admin_users'))  # Not selected
+            profiles = saved_profiles()
+            listing = self.client.get(reverse('admin_profiles'))
+            report = self.client.get(reverse('admin_profile_detail', args=[profiles[0].filename]))
+            missing = self.client.get(reverse('admin_profile_detail', args=['nope.prof.gz']))
+
+        self.assertEqual([(profile.kind, profile.name) for profile in profiles], [('request', 'admin_dashboard')])
+        self.assertContains(listing, profiles[0].filename)
+        self.assertContains(report, 'function calls')
+        self.assertEqual(missing.status_code, 404)
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class MetricsTests(TestCase):
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        return metrics.parse(response.content.decode())
+
+    def test_requests_cache_lookups_and_gauges_are_exposed(self):
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        reader = User.objects.create_user('reader', password='pw')
+        Reservation.objects.create(user=reader, book=book)
+        self.client.force_login(reader)
+        catalog = ('library_request_duration_seconds_count', (('view', 'book_catalog'),))
+        card_hits = ('library_cache_hits_total', (('cache', 'book_cards'),))
+
+        # Counters are per process and keep counting across tests
+        cache.clear()
+        before = self.scrape()
+        self.client.get(reverse('book_catalog'))
+        self.client.get(reverse('book_catalog'))
+        after = self.scrape()
+
+        self.assertEqual(after[catalog] - before.get(catalog, 0), 2)
+        self.assertEqual(after[card_hits] - before.get(card_hits, 0), 1)
+        self.assertEqual(after[('library_pending_reservations', ())], 1)
+
+    def test_endpoint_needs_the_token_a_listed_address_or_staff(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)  # Localhost is not trusted by default
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.9']):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.9').status_code, 200)
+
+        self.client.force_login(User.objects.create_user('reader', password='pw'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('librarian', password='pw', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_gauges_come_from_the_maintained_counters(self):
+        reader = User.objects.create_user('reader', password='pw')
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        copy = BookCopy.objects.create(book=book, location='1-A-1')
+        cache.clear()
+        self.scrape()
+
+        Reservation.objects.create(user=reader, book=book)  # Takes the only copy
+        Reservation.objects.create(user=reader, book=book)
+        Borrowing.objects.create(user=reader, copy=copy, due_date=timezone.now() - timedelta(days=1))
+        with self.assertNumQueries(1):  # One SUM; overdue loans are recounted once a minute
+            gauges = self.scrape()
+
+        self.assertEqual(gauges[('library_pending_reservations', ())], 1)
+        self.assertEqual(gauges[('library_active_loans', ())], 1)
+        self.assertEqual(gauges[('library_overdue_loans', ())], 0)  # Until the timeout
+
+    def test_counters_of_other_processes_are_added(self):
+        failures = ('library_email_failures_total', (('kind', 'reservation_assigned'),))
+        with tempfile.TemporaryDirectory() as metrics_dir, override_settings(METRICS_DIR=metrics_dir):
+            own = metrics.collect().get(failures, 0)
+            with open(f'{metrics_dir}/12345-worker.json', 'w') as other_worker:
+                json.dump([[failures[0], [list(pair) for pair in failures[1]], 3]], other_worker)
+            metrics.inc('library_email_failures_total', kind='reservation_assigned')
+            metrics.registry().flush()  # Must not be counted twice
+
+            self.assertEqual(self.scrape()[failures], own + 4)
+
+
+class ConcurrentCopyAssignmentTests(TransactionTestCase):
+    COPIES = 3
+    READERS = 12
+
+    def test_concurrent_reservations_never_share_a_copy(self):
+        book = Book.objects.create(title='Dune', author='Frank Herbert')
+        for i in range(self.COPIES):
+            BookCopy.objects.create(book=book, location=f'1-A-{i}')
+        users = [User.objects.create_user(f'reader{i}', password='pw') for i in range(self.READERS)]
+
+        start = threading.Barrier(self.READERS)
+        errors = []
+
+        def retry(operation):
+            for _ in range(100):
+                try:
+                    with transaction.atomic():
+                        return operation()
+                except OperationalError:  # SQLite write lock held by another thread
+                    time.sleep(0.01)
+            raise AssertionError('database stayed locked')
+
+        def reserve(user):
+            try:
+                start.wait()
+                reservation = retry(lambda: Reservation.objects.create(user=user, book=book))
+                retry(reservation.assign_copy)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        assigned = list(Reservation.objects.filter(status='assigned').values_list('copy_id', flat=True))
+        self.assertEqual(len(assigned), self.COPIES)
+        self.assertEqual(len(set(assigned)), self.COPIES)
+        self.assertEqual(Reservation.objects.filter(status='pending').count(), self.READERS - self.COPIES)
@@ -6,6 +6,7 @@ urlpatterns = [
     path('login/', views.student_login, name='student_login'),
     path('logout/', views.student_logout, name='student_logout'),
     path('catalog/', views.book_catalog, name='book_catalog'),
+    path('catalog/more/', views.book_catalog_more, name='book_catalog_more'),
     path('reserve/<int:book_id>/', views.create_reservation, name='create_reservation'),
     path('reservations/', views.my_reservations, name='my_reservations'),
     path('reservations/cancel/<int:reservation_id>/', views.cancel_reservation, name='cancel_reservation'),
@@ -26,10 +27,17 @@ urlpatterns = [
     # Data Management routes
     path('admin-dashboard/data-management/', views.admin_data_management, name='admin_data_management'),
     path('admin-dashboard/import-csv/', views.admin_import_csv, name='admin_import_csv'),
+    path('admin-dashboard/export/<str:dataset>/', views.admin_export, name='admin_export'),
     path('admin-dashboard/download-sample-csv/', views.admin_download_sample_csv, name='admin_download_sample_csv'),
     path('admin-dashboard/add-book/', views.admin_add_book_manual, name='admin_add_book_manual'),
     path('admin-dashboard/add-book-isbn/', views.admin_add_book_isbn, name='admin_add_book_isbn'),
+    path('admin-dashboard/isbn-lookup/<str:isbn>/', views.admin_isbn_lookup, name='admin_isbn_lookup'),
     path('admin-dashboard/scan-book/', views.admin_scan_book, name='admin_scan_book'),
     path('admin-dashboard/manage-copies/', views.admin_manage_copies, name='admin_manage_copies'),
     path('admin-dashboard/edit-book/', views.admin_edit_book, name='admin_edit_book'),
+    path('admin-dashboard/profiles/', views.admin_profiles, name='admin_profiles'),
+    path('admin-dashboard/profiles/<str:filename>/', views.admin_profile_detail, name='admin_profile_detail'),
+    
+    # Prometheus scrape target
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
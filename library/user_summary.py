@@ -0,0 +1,113 @@
+"""
+Per-user circulation summary (active/overdue loans, pending/assigned
+reservations, totals) shown on the catalog stats bar and the admin user
+detail page.
+
+The summary is computed in a single query and cached under a versioned
+key. Saving or deleting one of the user's Borrowings or Reservations bumps
+the version once the transaction commits (see library/signals.py), so
+stale entries are never read.
+The overdue count is derived from stored due dates: the summary remembers
+the next upcoming due date and is recomputed once that moment has passed.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Borrowing, Reservation, User
+from .request_metrics import record_cache
+
+SUMMARY_TIMEOUT = 60 * 60  # Entries are invalidated on change; the timeout only bounds memory
+
+
+def _version_key(user_id):
+    return f'user_summary_version_{user_id}'
+
+
+def _summary_key(user_id, version):
+    return f'user_summary_{user_id}_v{version}'
+
+
+def _count(queryset):
+    """Scalar subquery counting rows of `queryset` for the outer user"""
+    counted = queryset.filter(user_id=OuterRef('pk')).order_by().values('user_id').annotate(n=Count('id')).values('n')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def compute_user_summary(user_id):
+    """Compute the summary from the database in one query"""
+    now = timezone.now()
+    open_borrowings = Borrowing.objects.filter(return_date__isnull=True)
+
+    next_due = open_borrowings.filter(
+        user_id=OuterRef('pk'),
+        due_date__gte=now,
+    ).order_by('due_date').values('due_date')[:1]
+
+    summary = User.objects.filter(pk=user_id).annotate(
+        total_borrowings=_count(Borrowing.objects.all()),
+        active_borrowings=_count(open_borrowings),
+        overdue_borrowings=_count(open_borrowings.filter(due_date__lt=now)),
+        total_reservations=_count(Reservation.objects.all()),
+        pending_reservations=_count(Reservation.objects.filter(status='pending')),
+        assigned_reservations=_count(Reservation.objects.filter(status='assigned')),
+        next_due_date=Subquery(next_due),
+    ).values(
+        'total_borrowings', 'active_borrowings', 'overdue_borrowings',
+        'total_reservations', 'pending_reservations', 'assigned_reservations',
+        'next_due_date',
+    ).first()
+
+    return summary or {
+        'total_borrowings': 0, 'active_borrowings': 0, 'overdue_borrowings': 0,
+        'total_reservations': 0, 'pending_reservations': 0, 'assigned_reservations': 0,
+        'next_due_date': None,
+    }
+
+
+def get_user_summary(user_id):
+    """Return the cached summary for a user, recomputing it if missing or outdated"""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Start from a fresh version so an evicted counter can't resurrect old entries
+        version = time.time_ns()
+        cache.set(_version_key(user_id), version, None)
+
+    key = _summary_key(user_id, version)
+    summary = cache.get(key)
+
+    # A loan has become overdue since the summary was computed
+    if summary is not None and summary['next_due_date'] and summary['next_due_date'] < timezone.now():
+        summary = None
+
+    if summary is None:
+        record_cache('user_summary', misses=1)
+        summary = compute_user_summary(user_id)
+        cache.set(key, summary, SUMMARY_TIMEOUT)
+    else:
+        record_cache('user_summary', hits=1)
+    return summary
+
+
+def _bump_versions(user_ids):
+    for user_id in user_ids:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def invalidate_user_summary(user_ids):
+    """
+    Bump the summary version of each user when the current transaction
+    commits, so their next read recomputes. Bumping earlier would let a
+    concurrent request cache the pre-commit data under the new version.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        transaction.on_commit(lambda: _bump_versions(user_ids))
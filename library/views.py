@@ -2,18 +2,40 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Q, Count, Case, When, IntegerField, Exists, OuterRef
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Count, Case, When, IntegerField, Exists, OuterRef, Sum
 from django.utils import timezone
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.views.decorators.http import require_http_methods
-from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from datetime import timedelta
 import json
 import csv
-import io
-from .models import Book, BookCopy, Reservation, Borrowing, User
+import logging
+import requests
+from .models import Book, BookAvailability, BookCopy, Reservation, Borrowing, ReservationLog, User
+from .availability import get_book_availability, low_stock_availability, refresh_book_availability
+from .search import search_books, highlight_html
+from .pagination import KeysetPaginator, cached_count
+from .cache_versions import get_or_compute
+from .book_cards import render_book_cards
+from .profiling import find_profile, profile_report, saved_profiles, top_offenders
+from .metrics import collect as collect_metrics, render as render_metrics
+from .request_metrics import record_cache
+from .user_summary import get_user_summary, invalidate_user_summary
+from .isbn_lookup import get_volume_info, normalize_isbn
+from .csv_import import import_books_csv
+from .assignment import assign_copy
+from .audit import log_event
+from .waitlist import return_borrowings
+from .exports import (
+    BOOK_COLUMNS, BORROWING_COLUMNS, EXPORT_FORMATS, LOG_COLUMNS, RESERVATION_COLUMNS, export_response,
+)
 from .email_utils import send_reservation_confirmation, send_reservation_assigned, send_pickup_confirmation, send_return_confirmation
 
+logger = logging.getLogger(__name__)
+
 def student_login(request):
     """Login page for students and admins with role detection"""
     if request.user.is_authenticated:
@@ -46,125 +68,136 @@ def student_logout(request):
     messages.success(request, 'You have been logged out successfully.')
     return redirect('student_login')
 
-@login_required(login_url='student_login')
-def book_catalog(request):
-    """Display all books with search and filter functionality + pagination"""
-    # Calculate user stats for dashboard
-    user = request.user
-    active_borrowings = Borrowing.objects.filter(
-        user=user,
-        return_date__isnull=True  # Any unreturned book
-    ).count()
-    
-    overdue_borrowings = Borrowing.objects.filter(
-        user=user,
-        return_date__isnull=True,
-        due_date__lt=timezone.now()
-    ).count()
-    
-    pending_reservations = Reservation.objects.filter(
-        user=user,
-        status='pending'
-    ).count()
-    
-    assigned_reservations = Reservation.objects.filter(
-        user=user,
-        status='assigned'
-    ).count()
-    
-    books = Book.objects.all().order_by('title')  # Add ordering for consistent pagination
+CATALOG_PAGE_SIZE = 12
+GENRES_CACHE_TIMEOUT = 60 * 60 * 24  # Invalidated by any book change, so this only bounds memory use
+# Overdue loans and new users change the dashboard without a registered save
+DASHBOARD_CACHE_TIMEOUT = 60 * 5
+
+
+def _catalog_books(request):
+    """Build the filtered catalog queryset shared by the catalog page and its infinite scroll endpoint"""
+    books = Book.objects.select_related('availability').order_by('title', 'id')  # Add ordering for consistent pagination
     
-    # Search functionality
+    # Search functionality (full-text index, ranked by relevance)
     search_query = request.GET.get('search', '')
     if search_query:
-        books = books.filter(
-            Q(title__icontains=search_query) |
-            Q(author__icontains=search_query) |
-            Q(isbn__icontains=search_query)
-        )
+        books = search_books(books, search_query)
     
     # Genre filter
     genre_filter = request.GET.get('genre', '')
     if genre_filter:
         books = books.filter(genre=genre_filter)
     
-    # Get all unique genres for filter dropdown (cached for 1 hour)
-    from django.core.cache import cache
-    genres = cache.get('book_genres_list')
-    if not genres:
-        genres = list(Book.objects.exclude(genre__isnull=True).exclude(genre='').values_list('genre', flat=True).distinct())
-        cache.set('book_genres_list', genres, 3600)  # Cache for 1 hour
+    # "Available now" filter (uses the materialized availability counters)
+    available_only = request.GET.get('available') == '1'
+    if available_only:
+        books = books.filter(availability__available_copies__gt=0)
     
-    # Pagination FIRST - only process 12 books
-    page = request.GET.get('page', 1)
-    paginator = Paginator(books, 12)
-    
-    try:
-        books_page = paginator.page(page)
-    except PageNotAnInteger:
-        books_page = paginator.page(1)
-    except EmptyPage:
-        books_page = paginator.page(paginator.num_pages)
-    
-    # OPTIMIZED: Calculate availability using annotations (1 query instead of N+1)
-    # Get the book IDs for current page
-    book_ids = [book.id for book in books_page]
-    
-    # Annotate books with counts in a single query
-    books_with_counts = Book.objects.filter(id__in=book_ids).annotate(
-        total_copies=Count('bookcopy', filter=~Q(bookcopy__condition='lost'), distinct=True),  # Exclude lost copies
-        unavailable_copies_count=Count(
-            'bookcopy',
-            filter=Q(
-                Q(bookcopy__borrowing__return_date__isnull=True, bookcopy__borrowing__status='active') |
-                Q(bookcopy__reservation__status='assigned')
-            ) & ~Q(bookcopy__condition='lost'),  # Exclude lost copies
-            distinct=True
-        )
+    filters = {
+        'search_query': search_query,
+        'genre_filter': genre_filter,
+        'available_only': available_only,
+    }
+    return books, filters
+
+
+def _catalog_ordering(books):
+    """Relevance order for full-text searches, alphabetical otherwise (id breaks ties)"""
+    if 'search_rank' in books.query.annotations:
+        return ('search_rank', 'id')
+    return ('title', 'id')
+
+
+def _attach_availability(books):
+    """Copy availability counters and search highlights onto books for the card template"""
+    for book in books:
+        availability = get_book_availability(book)
+        book.total_copies = availability.total_copies
+        book.unavailable_count = availability.unavailable_copies
+        book.available_copies = availability.available_copies
+        book.title_html = highlight_html(getattr(book, 'title_highlight', None))
+        book.author_html = highlight_html(getattr(book, 'author_highlight', None))
+
+
+@login_required(login_url='student_login')
+def book_catalog(request):
+    """Display all books with search and filter functionality + pagination"""
+    # User stats for dashboard (cached per user, invalidated on borrowing/reservation changes)
+    summary = get_user_summary(request.user.id)
+    
+    books, filters = _catalog_books(request)
+    search_query = filters['search_query']
+    genre_filter = filters['genre_filter']
+    available_only = filters['available_only']
+    
+    # Get all unique genres for filter dropdown (cached until a book changes)
+    genres = get_or_compute(
+        'catalog', 'genres',
+        lambda: list(Book.objects.exclude(genre__isnull=True).exclude(genre='').values_list('genre', flat=True).distinct()),
+        GENRES_CACHE_TIMEOUT,
     )
     
-    # Create a lookup dictionary for O(1) access
-    availability_lookup = {
-        book.id: {
-            'total_copies': book.total_copies,
-            'unavailable_count': book.unavailable_copies_count,
-            'available_copies': book.total_copies - book.unavailable_copies_count
-        }
-        for book in books_with_counts
-    }
+    # Keyset pagination - only process 12 books, no OFFSET scan or COUNT(*) per request
+    paginator = KeysetPaginator(books, _catalog_ordering(books), CATALOG_PAGE_SIZE)
+    books_page = paginator.page(request.GET.get('cursor'))
     
-    # Apply the availability data to the paginated books
-    books_with_availability = []
-    for book in books_page:
-        if book.id in availability_lookup:
-            book.total_copies = availability_lookup[book.id]['total_copies']
-            book.unavailable_count = availability_lookup[book.id]['unavailable_count']
-            book.available_copies = availability_lookup[book.id]['available_copies']
-        else:
-            # Fallback for edge cases
-            book.total_copies = 0
-            book.unavailable_count = 0
-            book.available_copies = 0
-        books_with_availability.append(book)
+    _attach_availability(books_page)
     
     context = {
         'books': books_page,
+        'book_cards': render_book_cards(books_page),
         'search_query': search_query,
         'genres': genres,
         'genre_filter': genre_filter,
-        'total_books': paginator.count,
-        'has_next': books_page.has_next(),
-        'has_previous': books_page.has_previous(),
-        'current_page': books_page.number,
-        'total_pages': paginator.num_pages,
+        'available_only': available_only,
+        'total_books': cached_count(books),
+        'has_next': books_page.has_next,
+        'has_previous': books_page.has_previous,
+        'next_cursor': books_page.next_cursor,
         # User stats for dashboard
-        'active_borrowings': active_borrowings,
-        'overdue_borrowings': overdue_borrowings,
-        'pending_reservations': pending_reservations,
-        'assigned_reservations': assigned_reservations,
+        'active_borrowings': summary['active_borrowings'],
+        'overdue_borrowings': summary['overdue_borrowings'],
+        'pending_reservations': summary['pending_reservations'],
+        'assigned_reservations': summary['assigned_reservations'],
     }
     return render(request, 'library/book_catalog.html', context)
 
+@login_required(login_url='student_login')
+def book_catalog_more(request):
+    """
+    Next batch of book cards for the catalog's infinite scroll, after ?cursor=.
+    Skips the user stats, genre list and base template; returns JSON with
+    the rendered cards and availability data, or the bare HTML fragment
+    with ?format=html.
+    """
+    books, filters = _catalog_books(request)
+    
+    paginator = KeysetPaginator(books, _catalog_ordering(books), CATALOG_PAGE_SIZE)
+    batch = paginator.page(request.GET.get('cursor'))
+    _attach_availability(batch)
+    
+    html = render_book_cards(batch)
+    
+    if request.GET.get('format') == 'html':
+        response = HttpResponse(html)
+        response['X-Next-Cursor'] = batch.next_cursor or ''
+        return response
+    
+    return JsonResponse({
+        'html': html,
+        'books': [
+            {
+                'id': book.id,
+                'available_copies': book.available_copies,
+                'total_copies': book.total_copies,
+            }
+            for book in batch
+        ],
+        'has_next': batch.has_next,
+        'next_cursor': batch.next_cursor,
+    })
+
+
 @login_required(login_url='student_login')
 def create_reservation(request, book_id):
     """Create a reservation for a book"""
@@ -234,7 +267,7 @@ def create_reservation(request, book_id):
 @login_required(login_url='student_login')
 def my_reservations(request):
     """Display user's reservations"""
-    reservations = Reservation.objects.filter(user=request.user).order_by('-reservation_date')
+    reservations = Reservation.objects.filter(user=request.user).select_related('book', 'copy').order_by('-reservation_date')
     
     context = {
         'reservations': reservations,
@@ -285,12 +318,7 @@ def confirm_pickup(request, reservation_id):
         send_pickup_confirmation(request.user, borrowing)
         
         # Log the action for audit trail
-        from .models import ReservationLog
-        ReservationLog.objects.create(
-            reservation=reservation,
-            action='self_pickup_confirmed',
-            details=f'Student self-confirmed pickup. Borrowing ID: {borrowing.id}'
-        )
+        log_event(reservation, 'self_pickup_confirmed', f'Student self-confirmed pickup. Borrowing ID: {borrowing.id}')
         
         messages.success(request, f'Pickup confirmed! You have successfully borrowed "{reservation.book.title}". Due date: {borrowing.due_date.strftime("%Y-%m-%d")}. Check your email for details.')
         return redirect('my_borrowings')
@@ -386,6 +414,29 @@ def request_return(request, borrowing_id):
 # ADMIN DASHBOARD VIEWS
 # ===================================
 
+def _dashboard_stats():
+    """Site-wide counts for the admin dashboard (one aggregate query per table)"""
+    copies = BookCopy.objects.aggregate(
+        total_copies=Count('id'),
+        lost_books=Count('id', filter=Q(condition='lost')),
+    )
+    borrowings = Borrowing.objects.filter(return_date__isnull=True, status='active').aggregate(
+        active_borrowings=Count('id'),
+        overdue_borrowings=Count('id', filter=Q(due_date__lt=timezone.now())),
+    )
+    reservations = Reservation.objects.filter(status__in=['pending', 'assigned']).aggregate(
+        pending_reservations=Count('id', filter=Q(status='pending')),
+        assigned_reservations=Count('id', filter=Q(status='assigned')),
+    )
+    return {
+        'total_books': Book.objects.count(),
+        'total_users': User.objects.filter(is_staff=False).count(),
+        **copies,
+        **borrowings,
+        **reservations,
+    }
+
+
 @login_required(login_url='student_login')
 def admin_dashboard(request):
     """Admin dashboard with comprehensive stats and overview"""
@@ -394,38 +445,8 @@ def admin_dashboard(request):
         messages.error(request, 'You do not have permission to access the admin dashboard.')
         return redirect('book_catalog')
     
-    # Import cache at top of function (it's already used elsewhere in the file)
-    from django.core.cache import cache
-    
-    # Try to get cached statistics (cache for 5 minutes = 300 seconds)
-    cache_key = 'admin_dashboard_stats'
-    stats = cache.get(cache_key)
-    
-    if not stats:
-        # Calculate statistics (only if not cached)
-        stats = {
-            'total_books': Book.objects.count(),
-            'total_copies': BookCopy.objects.count(),
-            'total_users': User.objects.filter(is_staff=False).count(),
-            'active_borrowings': Borrowing.objects.filter(
-                return_date__isnull=True,
-                status='active'
-            ).count(),
-            'overdue_borrowings': Borrowing.objects.filter(
-                return_date__isnull=True,
-                status='active',
-                due_date__lt=timezone.now()
-            ).count(),
-            'pending_reservations': Reservation.objects.filter(
-                status='pending'
-            ).count(),
-            'assigned_reservations': Reservation.objects.filter(
-                status='assigned'
-            ).count(),
-            'lost_books': BookCopy.objects.filter(condition='lost').count(),
-        }
-        # Cache for 5 minutes
-        cache.set(cache_key, stats, 300)
+    # Statistics are cached until a book, copy, borrowing or reservation changes
+    stats = get_or_compute('dashboard', 'stats', _dashboard_stats, DASHBOARD_CACHE_TIMEOUT)
     
     # Extract stats from cache/calculated
     total_books = stats['total_books']
@@ -446,22 +467,11 @@ def admin_dashboard(request):
         'user', 'copy__book'
     ).order_by('-borrow_date')[:5]
     
-    # Books running low on copies (less than 2 available)
-    low_stock_books = []
-    for book in Book.objects.all():
-        total_copies_count = BookCopy.objects.filter(book=book).count()
-        unavailable_count = BookCopy.objects.filter(book=book).filter(
-            Q(borrowing__return_date__isnull=True, borrowing__status='active') |
-            Q(reservation__status__in=['assigned', 'picked_up'])
-        ).distinct().count()
-        available = total_copies_count - unavailable_count
-        
-        if available < 2 and total_copies_count > 0:
-            low_stock_books.append({
-                'book': book,
-                'available': available,
-                'total': total_copies_count
-            })
+    # Books running low on copies, scarcest first (single query on the availability counters)
+    low_stock_books = [
+        {'book': row.book, 'available': row.available_copies, 'total': row.total_copies}
+        for row in low_stock_availability(settings.LOW_STOCK_THRESHOLD, settings.LOW_STOCK_LIMIT)
+    ]
     
     context = {
         'total_books': total_books,
@@ -474,12 +484,47 @@ def admin_dashboard(request):
         'lost_books': lost_books,
         'recent_reservations': recent_reservations,
         'recent_borrowings': recent_borrowings,
-        'low_stock_books': low_stock_books[:5],  # Top 5 low stock
+        'low_stock_books': low_stock_books,
     }
     
     return render(request, 'library/admin_dashboard.html', context)
 
 
+def _filtered_reservations(request):
+    """
+    Reservations matching the admin_reservations filters in request.GET
+    (shared by the list and its export). Returns (queryset, filters).
+    """
+    # Get filter parameters
+    status_filter = request.GET.get('status', 'all')
+    search_query = request.GET.get('search', '')
+    user_filter = request.GET.get('user', '')  # Filter by specific user
+    
+    # Base queryset
+    reservations = Reservation.objects.select_related(
+        'user', 'book', 'copy'
+    ).order_by('-reservation_date')
+    
+    # Apply user filter (from clicked stat card)
+    if user_filter:
+        reservations = reservations.filter(user_id=user_filter)
+    
+    # Apply status filter
+    if status_filter != 'all':
+        reservations = reservations.filter(status=status_filter)
+    
+    # Apply search filter
+    if search_query:
+        reservations = reservations.filter(
+            Q(book__title__icontains=search_query) |
+            Q(user__username__icontains=search_query) |
+            Q(user__email__icontains=search_query)
+        )
+    
+    filters = {'status_filter': status_filter, 'search_query': search_query}
+    return reservations, filters
+
+
 @login_required(login_url='student_login')
 def admin_reservations(request):
     """Admin view to manage all reservations with filtering and bulk actions"""
@@ -517,26 +562,14 @@ def admin_reservations(request):
             elif action == 'assign_copy':
                 # Manually assign copies to pending reservations
                 count = 0
-                for reservation in reservations:
+                for reservation in reservations.select_related('user'):
                     if reservation.status == 'pending':
-                        # Find an available copy
-                        available_copy = BookCopy.objects.filter(
-                            book=reservation.book
-                        ).exclude(
-                            id__in=Reservation.objects.filter(status='assigned').values('copy_id')  # Only 'assigned', not 'picked_up'
-                        ).exclude(
-                            id__in=Borrowing.objects.filter(return_date__isnull=True).values('copy_id')
-                        ).first()
-                        
-                        if available_copy:
-                            reservation.copy = available_copy
-                            reservation.status = 'assigned'
-                            reservation.expiration_date = timezone.now() + timedelta(days=3)
-                            reservation.save()
+                        assigned_copy = assign_copy(reservation)
+                        if assigned_copy:
                             count += 1
                             
                             # Send assignment email to user
-                            send_reservation_assigned(reservation.user, reservation, available_copy)
+                            send_reservation_assigned(reservation.user, reservation, assigned_copy)
                 
                 if count > 0:
                     messages.success(request, f'✓ Successfully assigned {count} reservation(s) and sent notification emails')
@@ -545,111 +578,36 @@ def admin_reservations(request):
             
             elif action == 'cancel':
                 # Cancel selected reservations
-                count = reservations.filter(status__in=['pending', 'assigned']).count()
-                reservations.filter(status__in=['pending', 'assigned']).update(status='canceled')
+                to_cancel = reservations.filter(status__in=['pending', 'assigned'])
+                affected = list(to_cancel.values_list('book_id', 'user_id'))
+                count = to_cancel.update(status='canceled')
+                refresh_book_availability({book_id for book_id, _ in affected})
+                invalidate_user_summary(user_id for _, user_id in affected)
                 messages.success(request, f'✓ Canceled {count} reservation(s)')
             
             return redirect('admin_reservations')
     
-    # Get filter parameters
-    status_filter = request.GET.get('status', 'all')
-    search_query = request.GET.get('search', '')
-    user_filter = request.GET.get('user', '')  # Filter by specific user
-    
-    # Base queryset
-    reservations = Reservation.objects.select_related(
-        'user', 'book', 'copy'
-    ).order_by('-reservation_date')
-    
-    # Apply user filter (from clicked stat card)
-    if user_filter:
-        reservations = reservations.filter(user_id=user_filter)
-    
-    # Apply status filter
-    if status_filter != 'all':
-        reservations = reservations.filter(status=status_filter)
-    
-    # Apply search filter
-    if search_query:
-        reservations = reservations.filter(
-            Q(book__title__icontains=search_query) |
-            Q(user__username__icontains=search_query) |
-            Q(user__email__icontains=search_query)
-        )
+    reservations, filters = _filtered_reservations(request)
     
-    # Pagination
-    paginator = Paginator(reservations, 20)
-    page = request.GET.get('page', 1)
-    
-    try:
-        reservations_page = paginator.page(page)
-    except PageNotAnInteger:
-        reservations_page = paginator.page(1)
-    except EmptyPage:
-        reservations_page = paginator.page(paginator.num_pages)
+    # Keyset pagination (newest first)
+    paginator = KeysetPaginator(reservations, ('-reservation_date', 'id'), 20)
+    reservations_page = paginator.page(request.GET.get('cursor'))
     
     context = {
         'reservations': reservations_page,
-        'status_filter': status_filter,
-        'search_query': search_query,
-        'total_count': reservations.count(),
+        'status_filter': filters['status_filter'],
+        'search_query': filters['search_query'],
+        'total_count': cached_count(reservations),
     }
     
     return render(request, 'library/admin_reservations.html', context)
 
 
-@login_required(login_url='student_login')
-def admin_borrowings(request):
-    """Admin view to manage all borrowings with filtering and actions"""
-    # Check if user is staff
-    if not request.user.is_staff:
-        messages.error(request, 'You do not have permission to access this page.')
-        return redirect('book_catalog')
-    
-    # Handle actions
-    if request.method == 'POST':
-        action = request.POST.get('action')
-        borrowing_id = request.POST.get('borrowing_id')
-        
-        if action and borrowing_id:
-            borrowing = get_object_or_404(Borrowing, id=borrowing_id)
-            
-            if action == 'process_return':
-                # Single-step: Mark as returned AND shelve (auto-assign to waitlist)
-                borrowing.return_date = timezone.now()
-                borrowing.status = 'returned'
-                borrowing.save()
-                
-                # Send return confirmation email to the user who returned the book
-                send_return_confirmation(borrowing.user, borrowing)
-                
-                # Immediately check if there are pending reservations for this book
-                next_reservation = Reservation.objects.filter(
-                    book=borrowing.copy.book,
-                    status='pending'
-                ).order_by('reservation_date').first()
-                
-                if next_reservation:
-                    # Auto-assign to next person in waitlist
-                    next_reservation.copy = borrowing.copy
-                    next_reservation.status = 'assigned'
-                    next_reservation.expiration_date = timezone.now() + timedelta(days=3)
-                    next_reservation.save()
-                    
-                    # Send assignment email to next person
-                    send_reservation_assigned(next_reservation.user, next_reservation, borrowing.copy)
-                    
-                    messages.success(request, f'✓ Book returned and assigned to {next_reservation.user.username} at {borrowing.copy.location}. Pickup expires in 3 days. Notification emails sent.')
-                else:
-                    messages.success(request, f'✓ Book returned and shelved at {borrowing.copy.location}. Available for new reservations. Confirmation email sent to {borrowing.user.email}.')
-            
-            elif action == 'extend_due_date':
-                borrowing.due_date = borrowing.due_date + timedelta(days=7)
-                borrowing.save()
-                messages.success(request, f'✓ Due date extended to {borrowing.due_date.strftime("%B %d, %Y")}')
-            
-            return redirect('admin_borrowings')
-    
+def _filtered_borrowings(request):
+    """
+    Borrowings matching the admin_borrowings filters in request.GET
+    (shared by the list and its export). Returns (queryset, filters).
+    """
     # Get filter parameters
     filter_type = request.GET.get('filter', 'active_all')
     search_query = request.GET.get('search', '')
@@ -704,22 +662,61 @@ def admin_borrowings(request):
             Q(user__email__icontains=search_query)
         )
     
-    # Pagination
-    paginator = Paginator(borrowings, 20)
-    page = request.GET.get('page', 1)
+    filters = {'filter_type': filter_type, 'search_query': search_query}
+    return borrowings, filters
+
+
+@login_required(login_url='student_login')
+def admin_borrowings(request):
+    """Admin view to manage all borrowings with filtering and actions"""
+    # Check if user is staff
+    if not request.user.is_staff:
+        messages.error(request, 'You do not have permission to access this page.')
+        return redirect('book_catalog')
+    
+    # Handle actions
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        borrowing_id = request.POST.get('borrowing_id')
+        
+        if action and borrowing_id:
+            borrowing = get_object_or_404(Borrowing, id=borrowing_id)
+            
+            if action == 'process_return':
+                # Single-step: Mark as returned AND shelve (auto-assign to waitlist)
+                returned, assignments = return_borrowings([borrowing])
+                if not returned:
+                    messages.warning(request, f'Borrowing for {borrowing.user.username} is already returned.')
+                    return redirect('admin_borrowings')
+                
+                # Send return confirmation email to the user who returned the book
+                send_return_confirmation(borrowing.user, borrowing)
+                
+                if assignments:
+                    # The next person in the waitlist was assigned the copy and notified
+                    next_reservation, _ = assignments[0]
+                    messages.success(request, f'✓ Book returned and assigned to {next_reservation.user.username} at {borrowing.copy.location}. Pickup expires in 3 days. Notification emails sent.')
+                else:
+                    messages.success(request, f'✓ Book returned and shelved at {borrowing.copy.location}. Available for new reservations. Confirmation email sent to {borrowing.user.email}.')
+            
+            elif action == 'extend_due_date':
+                borrowing.due_date = borrowing.due_date + timedelta(days=7)
+                borrowing.save()
+                messages.success(request, f'✓ Due date extended to {borrowing.due_date.strftime("%B %d, %Y")}')
+            
+            return redirect('admin_borrowings')
     
-    try:
-        borrowings_page = paginator.page(page)
-    except PageNotAnInteger:
-        borrowings_page = paginator.page(1)
-    except EmptyPage:
-        borrowings_page = paginator.page(paginator.num_pages)
+    borrowings, filters = _filtered_borrowings(request)
+    
+    # Keyset pagination (newest first)
+    paginator = KeysetPaginator(borrowings, ('-borrow_date', 'id'), 20)
+    borrowings_page = paginator.page(request.GET.get('cursor'))
     
     context = {
         'borrowings': borrowings_page,
-        'filter_type': filter_type,
-        'search_query': search_query,
-        'total_count': borrowings.count(),
+        'filter_type': filters['filter_type'],
+        'search_query': filters['search_query'],
+        'total_count': cached_count(borrowings),
         'now': timezone.now(),
     }
     
@@ -759,16 +756,9 @@ def admin_users(request):
         pending_reservations_count=Count('reservation', filter=Q(reservation__status__in=['pending', 'assigned']), distinct=True)
     )
     
-    # Pagination
-    paginator = Paginator(users_list, 20)  # 20 users per page
-    page = request.GET.get('page', 1)
-    
-    try:
-        users = paginator.page(page)
-    except PageNotAnInteger:
-        users = paginator.page(1)
-    except EmptyPage:
-        users = paginator.page(paginator.num_pages)
+    # Keyset pagination - 20 users per page, newest first
+    paginator = KeysetPaginator(users_list, ('-date_joined', 'id'), 20)
+    users = paginator.page(request.GET.get('cursor'))
     
     context = {
         'users': users,
@@ -801,28 +791,19 @@ def admin_user_detail(request, user_id):
         'book', 'copy'
     ).order_by('-reservation_date')
     
-    # Calculate stats
-    total_borrowings = borrowings.count()
-    active_borrowings = borrowings.filter(status='active').count()
-    overdue_borrowings = borrowings.filter(
-        status='active',
-        due_date__lt=timezone.now()
-    ).count()
-    
-    total_reservations = reservations.count()
-    pending_reservations = reservations.filter(status='pending').count()
-    assigned_reservations = reservations.filter(status='assigned').count()
+    # Calculate stats (one query, cached per user)
+    summary = get_user_summary(user.id)
     
     context = {
         'viewed_user': user,
         'borrowings': borrowings[:10],  # Show last 10
         'reservations': reservations[:10],  # Show last 10
-        'total_borrowings': total_borrowings,
-        'active_borrowings': active_borrowings,
-        'overdue_borrowings': overdue_borrowings,
-        'total_reservations': total_reservations,
-        'pending_reservations': pending_reservations,
-        'assigned_reservations': assigned_reservations,
+        'total_borrowings': summary['total_borrowings'],
+        'active_borrowings': summary['active_borrowings'],
+        'overdue_borrowings': summary['overdue_borrowings'],
+        'total_reservations': summary['total_reservations'],
+        'pending_reservations': summary['pending_reservations'],
+        'assigned_reservations': summary['assigned_reservations'],
     }
     
     return render(request, 'library/admin_user_detail.html', context)
@@ -993,99 +974,71 @@ def admin_import_csv(request):
             messages.error(request, 'File must be a CSV file.')
             return render(request, 'library/admin_import_csv.html')
         
-        # Validate file size (5MB max)
-        if csv_file.size > 5 * 1024 * 1024:
-            messages.error(request, 'File size must be under 5MB.')
+        # Validate file size (large files are streamed from a temporary file, not held in memory)
+        if csv_file.size > settings.CSV_IMPORT_MAX_BYTES:
+            messages.error(request, f'File size must be under {settings.CSV_IMPORT_MAX_BYTES // (1024 * 1024)}MB.')
             return render(request, 'library/admin_import_csv.html')
         
         try:
-            # Read CSV file
-            decoded_file = csv_file.read().decode('utf-8')
-            csv_data = csv.DictReader(io.StringIO(decoded_file))
-            
-            books_created = 0
-            books_updated = 0
-            errors = []
-            
-            for row_num, row in enumerate(csv_data, start=2):  # Start at 2 (header is row 1)
-                try:
-                    title = row.get('title', '').strip()
-                    author = row.get('author', '').strip()
-                    isbn = row.get('isbn', '').strip()
-                    genre = row.get('genre', '').strip()
-                    publication_year = row.get('publication_year', '').strip()
-                    publisher = row.get('publisher', '').strip()
-                    description = row.get('description', '').strip()
-                    
-                    # Validate required fields
-                    if not title or not author:
-                        errors.append(f'Row {row_num}: Title and author are required')
-                        continue
-                    
-                    # Convert year to integer if provided
-                    year = None
-                    if publication_year:
-                        try:
-                            year = int(publication_year)
-                        except ValueError:
-                            errors.append(f'Row {row_num}: Invalid year "{publication_year}"')
-                    
-                    # Check if book exists (by ISBN or title+author)
-                    book = None
-                    if isbn:
-                        book = Book.objects.filter(isbn=isbn).first()
-                    
-                    if not book:
-                        book = Book.objects.filter(title=title, author=author).first()
-                    
-                    if book:
-                        # Update existing book
-                        if isbn and not book.isbn:
-                            book.isbn = isbn
-                        if genre:
-                            book.genre = genre
-                        if year:
-                            book.publication_year = year
-                        if publisher:
-                            book.publisher = publisher
-                        if description:
-                            book.description = description
-                        book.save()
-                        books_updated += 1
-                    else:
-                        # Create new book
-                        Book.objects.create(
-                            title=title,
-                            author=author,
-                            isbn=isbn or '',
-                            genre=genre or '',
-                            publication_year=year
-                        )
-                        books_created += 1
-                
-                except Exception as e:
-                    errors.append(f'Row {row_num}: {str(e)}')
+            # Parse and import in chunks (bulk inserts/updates, one transaction per chunk)
+            result = import_books_csv(csv_file.file)
             
             # Show results
-            if books_created > 0:
-                messages.success(request, f'✅ Successfully imported {books_created} new books.')
-            if books_updated > 0:
-                messages.info(request, f'ℹ️ Updated {books_updated} existing books.')
-            if errors:
-                error_msg = f'⚠️ {len(errors)} errors occurred:\n' + '\n'.join(errors[:5])
-                if len(errors) > 5:
-                    error_msg += f'\n... and {len(errors) - 5} more'
+            if result.created > 0:
+                messages.success(request, f'✅ Successfully imported {result.created} new books.')
+            if result.updated > 0:
+                messages.info(request, f'ℹ️ Updated {result.updated} existing books.')
+            if result.error_count:
+                error_msg = f'⚠️ {result.error_count} errors occurred:\n' + '\n'.join(result.errors[:5])
+                if result.error_count > 5:
+                    error_msg += f'\n... and {result.error_count - 5} more'
                 messages.warning(request, error_msg)
             
             return redirect('admin_data_management')
         
         except Exception as e:
+            # Chunks before the failing one are already committed
             messages.error(request, f'Error processing CSV file: {str(e)}')
             return render(request, 'library/admin_import_csv.html')
     
     return render(request, 'library/admin_import_csv.html')
 
 
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='student_login')
+def admin_export(request, dataset):
+    """
+    Stream books, borrowings, reservations or reservation logs as ?format=csv
+    or jsonl. Borrowings and reservations honor the same filters as their admin pages.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse('Unsupported export format', status=400)
+    
+    if dataset == 'books':
+        queryset, _ = _catalog_books(request)
+        columns = BOOK_COLUMNS
+    elif dataset == 'borrowings':
+        queryset, _ = _filtered_borrowings(request)
+        queryset = queryset.order_by('-borrow_date', 'id')
+        columns = BORROWING_COLUMNS
+    elif dataset == 'reservations':
+        queryset, _ = _filtered_reservations(request)
+        queryset = queryset.order_by('-reservation_date', 'id')
+        columns = RESERVATION_COLUMNS
+    elif dataset == 'logs':
+        queryset = ReservationLog.objects.order_by('-action_date', 'id')
+        if request.GET.get('action'):
+            queryset = queryset.filter(action=request.GET['action'])
+        if request.GET.get('user'):
+            queryset = queryset.filter(reservation__user_id=request.GET['user'])
+        columns = LOG_COLUMNS
+    else:
+        raise Http404('Unknown export')
+    
+    return export_response(queryset, columns, export_format, dataset)
+
+
 @login_required
 @user_passes_test(lambda u: u.is_staff, login_url='student_login')
 def admin_download_sample_csv(request):
@@ -1235,7 +1188,6 @@ def admin_add_book_isbn(request):
             cover_image = None
             if cover_url:
                 try:
-                    import requests
                     from django.core.files.base import ContentFile
                     
                     response = requests.get(cover_url, timeout=10)
@@ -1244,7 +1196,7 @@ def admin_add_book_isbn(request):
                         filename = f"{isbn or title[:30].replace(' ', '_')}.jpg"
                         cover_image = ContentFile(response.content, name=filename)
                 except Exception as e:
-                    print(f"Error downloading cover: {e}")
+                    logger.warning('cover download failed isbn=%s error=%s', isbn, e)
             
             # Create book
             book = Book.objects.create(
@@ -1269,6 +1221,25 @@ def admin_add_book_isbn(request):
     return render(request, 'library/admin_add_book_isbn.html')
 
 
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='student_login')
+def admin_isbn_lookup(request, isbn):
+    """
+    Google Books metadata for an ISBN, served from the IsbnMetadata cache.
+    Same shape as the Google Books volumes API so the lookup page can use either.
+    """
+    isbn = normalize_isbn(isbn)
+    if not isbn:
+        return JsonResponse({'error': 'Invalid ISBN'}, status=400)
+    try:
+        volume_info = get_volume_info(isbn)
+    except requests.RequestException as e:
+        return JsonResponse({'error': f'Error fetching ISBN: {e}'}, status=502)
+    if volume_info is None:
+        return JsonResponse({'totalItems': 0, 'items': []})
+    return JsonResponse({'totalItems': 1, 'items': [{'volumeInfo': volume_info}]})
+
+
 @login_required
 @user_passes_test(lambda u: u.is_staff, login_url='student_login')
 def admin_scan_book(request):
@@ -1431,6 +1402,104 @@ def admin_edit_book(request):
     return redirect('admin_manage_copies')
 
 
+# ===================================
+# PROFILING VIEWS
+# ===================================
+
+PROFILE_SORTS = ('cumulative', 'tottime', 'ncalls')
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='student_login')
+def admin_profiles(request):
+    """Slow request/command profiles saved by library/profiling.py, worst offenders first"""
+    profiles = saved_profiles()
+    context = {
+        'offenders': top_offenders(profiles),
+        'recent': sorted(profiles, key=lambda profile: profile.captured_at, reverse=True)[:50],
+        'total_profiles': len(profiles),
+        'url_names': settings.PROFILE_URL_NAMES,
+        'commands': settings.PROFILE_COMMANDS,
+        'threshold_ms': settings.PROFILE_THRESHOLD_MS,
+    }
+    return render(request, 'library/admin_profiles.html', context)
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='student_login')
+def admin_profile_detail(request, filename):
+    """pstats report of one saved profile; ?download=1 returns the compressed file"""
+    profile = find_profile(filename)
+    if profile is None:
+        raise Http404('Unknown profile')
+    
+    if request.GET.get('download'):
+        return FileResponse(open(profile.path, 'rb'), as_attachment=True, filename=profile.filename)
+    
+    sort = request.GET.get('sort', 'cumulative')
+    if sort not in PROFILE_SORTS:
+        sort = 'cumulative'
+    context = {
+        'profile': profile,
+        'report': profile_report(profile, sort=sort),
+        'sort': sort,
+        'sorts': PROFILE_SORTS,
+    }
+    return render(request, 'library/admin_profile_detail.html', context)
+
+
+# ===================================
+# PROMETHEUS METRICS
+# ===================================
+
+# Overdue loans depend on the clock, so no write can keep them counted. They are
+# recounted at most once a minute, cached under their own key with a fixed timeout.
+METRICS_OVERDUE_KEY = 'metrics_overdue_loans'
+METRICS_OVERDUE_TIMEOUT = 60
+
+
+def _metrics_gauges():
+    """Gauge values: sums of the maintained availability counters, plus the cached overdue count"""
+    gauges = BookAvailability.objects.aggregate(
+        library_pending_reservations=Sum('pending_reservations', default=0),
+        library_active_loans=Sum('active_loans', default=0),
+        library_lost_copies=Sum('lost_copies', default=0),
+    )
+    overdue = cache.get(METRICS_OVERDUE_KEY)
+    if overdue is None:
+        record_cache('metrics_overdue', misses=1)
+        overdue = Borrowing.objects.filter(
+            return_date__isnull=True, status='active', due_date__lt=timezone.now(),
+        ).count()
+        cache.set(METRICS_OVERDUE_KEY, overdue, METRICS_OVERDUE_TIMEOUT)
+    else:
+        record_cache('metrics_overdue', hits=1)
+    return {**gauges, 'library_overdue_loans': overdue}
+
+
+def _metrics_allowed(request):
+    """Bearer token, listed scraper address, or a staff login"""
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and constant_time_compare(authorization, f'Bearer {token}'):
+        return True
+    # Check the address before the user so scrapes never load a session
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    return request.user.is_staff
+
+
+def prometheus_metrics(request):
+    """Metrics of all worker processes in Prometheus text format (see library/metrics.py)"""
+    if not _metrics_allowed(request):
+        return HttpResponse('Forbidden', status=403)
+    
+    return HttpResponse(
+        render_metrics(collect_metrics(), _metrics_gauges()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
 # ===================================
 # CUSTOM ERROR HANDLERS
 # ===================================
@@ -0,0 +1,174 @@
+"""
+First come, first served waitlist.
+
+When copies come back into circulation (returns, expired pickups) they
+are matched to the oldest pending reservations for their books in one
+pass: one query ranks the waitlist per book, the assignments are written
+with bulk_update, the log rows with bulk_create, and the pickup emails
+are queued in the outbox. The cost is a handful of queries however many
+copies are freed at once.
+"""
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .assignment import PICKUP_WINDOW
+from .audit import log_events
+from .availability import refresh_book_availability, unavailable_copy_filter
+from .email_utils import send_reservations_assigned
+from .models import BookCopy, Borrowing, Reservation, ReservationLog
+from .user_summary import invalidate_user_summary
+
+
+def oldest_pending_reservations(needed):
+    """
+    Map book_id -> its oldest pending reservations, at most needed[book_id]
+    of them, oldest first (1 query for the ranking, 1 to lock the rows)
+    """
+    if not needed:
+        return {}
+
+    ranked_ids = Reservation.objects.filter(
+        book_id__in=needed, status='pending',
+    ).annotate(
+        queue_position=Window(
+            RowNumber(),
+            partition_by=[F('book_id')],
+            order_by=[F('reservation_date').asc(), F('id').asc()],
+        ),
+    ).filter(queue_position__lte=max(needed.values())).values_list('id', flat=True)
+
+    # Row locks (where supported) keep a concurrent assignment from taking the same reservation
+    queue = {}
+    for reservation in Reservation.objects.select_for_update(of=('self',)).filter(
+        id__in=list(ranked_ids), status='pending',
+    ).select_related('user', 'book').order_by('reservation_date', 'id'):
+        waiting = queue.setdefault(reservation.book_id, [])
+        if len(waiting) < needed[reservation.book_id]:
+            waiting.append(reservation)
+    return queue
+
+
+def assign_freed_copies(freed, action):
+    """
+    Hand freed copies to the waitlist and refresh their books' availability.
+    `freed` maps copy_id to the reason shown in the log (e.g. 'after return
+    by alice'); copies that are lost or already back in use are skipped.
+    Returns [(reservation, copy)].
+    """
+    if not freed:
+        return []
+
+    with transaction.atomic():
+        copies = {
+            copy.id: copy
+            for copy in BookCopy.objects.filter(id__in=freed).exclude(condition='lost').filter(~unavailable_copy_filter())
+        }
+        needed = {}
+        for copy in copies.values():
+            needed[copy.book_id] = needed.get(copy.book_id, 0) + 1
+        queue = oldest_pending_reservations(needed)
+
+        # Copies are matched in the order they were freed
+        now = timezone.now()
+        assignments = []
+        for copy_id in freed:
+            copy = copies.get(copy_id)
+            if copy is None or not queue.get(copy.book_id):
+                continue
+            reservation = queue[copy.book_id].pop(0)
+            reservation.copy = copy
+            reservation.status = 'assigned'
+            reservation.expiration_date = now + PICKUP_WINDOW
+            assignments.append((reservation, copy))
+
+        # bulk_update() and bulk_create() skip the post_save signals, so refresh
+        # the counters and summaries here
+        if assignments:
+            Reservation.objects.bulk_update(
+                [reservation for reservation, _ in assignments], ['copy', 'status', 'expiration_date'],
+            )
+            log_events([
+                ReservationLog(
+                    reservation=reservation,
+                    action=action,
+                    details=f'Auto-assigned copy {copy.location} {freed[copy.id]}',
+                )
+                for reservation, copy in assignments
+            ])
+            invalidate_user_summary({reservation.user_id for reservation, _ in assignments})
+        refresh_book_availability(needed.keys())
+
+    send_reservations_assigned(assignments)
+    return assignments
+
+
+def return_borrowings(borrowings):
+    """
+    Mark open borrowings as returned with one UPDATE and pass their copies
+    to the waitlist. Borrowings already returned are ignored.
+    Returns (returned borrowings, [(reservation, copy)]).
+    """
+    borrowings = [borrowing for borrowing in borrowings if borrowing.return_date is None]
+    if not borrowings:
+        return [], []
+
+    now = timezone.now()
+    with transaction.atomic():
+        Borrowing.objects.filter(
+            id__in=[borrowing.id for borrowing in borrowings], return_date__isnull=True,
+        ).update(return_date=now, status='returned')
+        for borrowing in borrowings:
+            borrowing.return_date = now
+            borrowing.status = 'returned'
+
+        assignments = assign_freed_copies(
+            {borrowing.copy_id: f'after return by {borrowing.user.username}' for borrowing in borrowings},
+            'auto_assigned_on_return',
+        )
+
+        # update() skips the post_save signals; assign_freed_copies() already
+        # refreshed the availability of the returned copies' books
+        invalidate_user_summary({borrowing.user_id for borrowing in borrowings})
+    return borrowings, assignments
+
+
+def expire_pickups(now, batch_size):
+    """
+    Expire up to `batch_size` assigned reservations whose pickup window ended
+    before `now` (one UPDATE, one log INSERT) and hand their copies to the
+    waitlist, all in one transaction. Returns (expired rows, [(reservation, copy)]).
+    """
+    with transaction.atomic():
+        expired = list(
+            Reservation.objects.select_for_update(of=('self',)).filter(
+                status='assigned', expiration_date__lt=now,
+            ).order_by('expiration_date', 'id').values(
+                'id', 'user_id', 'user__username', 'copy_id', 'expiration_date',
+            )[:batch_size]
+        )
+        if not expired:
+            return [], []
+
+        Reservation.objects.filter(
+            id__in=[row['id'] for row in expired], status='assigned',
+        ).update(status='expired', copy=None)
+        log_events([
+            ReservationLog(
+                reservation_id=row['id'],
+                action='expired',
+                details=f"Reservation expired after {row['expiration_date']}",
+            )
+            for row in expired
+        ])
+        # update() skips the post_save signals; assign_freed_copies() refreshes
+        # the availability of the freed copies' books
+        invalidate_user_summary({row['user_id'] for row in expired})
+
+        assignments = assign_freed_copies(
+            {row['copy_id']: f"after reservation {row['id']} expired" for row in expired if row['copy_id']},
+            'auto_assigned_on_expiration',
+        )
+    return expired, assignments
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -31,6 +32,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library.middleware.RequestMetricsMiddleware',  # Sampled SQL/template/cache timings (off unless enabled below)
+    'library.middleware.MetricsMiddleware',  # Latency and query counters for /metrics
+    'library.middleware.ProfilingMiddleware',  # cProfile of slow requests for PROFILE_URL_NAMES (off by default)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -39,13 +43,15 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',  # Required for django-allauth
+    'library.middleware.AuditLogMiddleware',  # One ReservationLog INSERT per request
 ]
 
 ROOT_URLCONF = 'library_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend plus render timing for RequestMetricsMiddleware
+        'BACKEND': 'library.request_metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'library' / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -61,12 +67,97 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'library_system.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default. Set DB_ENGINE=postgresql (and the POSTGRES_* variables)
+# to switch to PostgreSQL with a connection pool; that needs
+# `pip install "psycopg[binary,pool]"`.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'library'),
+            'USER': os.environ.get('POSTGRES_USER', 'library'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 0,  # Must be 0 with the pool; the pool keeps connections open
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX', 10)),
+                    'timeout': 10,
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Keep connections open between requests so the pragmas and page cache are reused
+            'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Take the write lock when a transaction starts, so concurrent writers wait
+                # for busy_timeout instead of failing with "database is locked" on upgrade
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
+
+# Applied to every new SQLite connection by library.db (connection_created)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # Readers never block the writer and vice versa
+    'busy_timeout': 5000,  # ms to wait for a lock before "database is locked"
+    'synchronous': 'NORMAL',  # Safe with WAL; fsync at checkpoints instead of every commit
+    'cache_size': -64000,  # 64 MB page cache per connection (negative = KiB)
+    'mmap_size': 256 * 1024 * 1024,  # Memory-map up to 256 MB of the database file
+    'temp_store': 'MEMORY',  # Sorts and temp indexes in memory
 }
+SQLITE_OPTIMIZE_INTERVAL = 60 * 60  # Seconds between PRAGMA optimize runs on a persistent connection
+
+# Shared cache, so every worker process sees the same entries and invalidations
+# (library/cache_versions.py). CACHE_BACKEND: file (default), db, redis or locmem.
+# The db backend needs its table once: python manage.py createcachetable
+# Tests always run on a private in-memory cache (library/test_runner.py)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'file')
+TEST_RUNNER = 'library.test_runner.LibraryTestRunner'
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+            'TIMEOUT': 60 * 60,
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'library_cache',
+            'TIMEOUT': 60 * 60,
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+elif CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'library_system_cache')),
+            'TIMEOUT': 60 * 60,
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -164,4 +255,86 @@ SEND_OVERDUE_NOTIFICATIONS = True
 # 2. Generate an "App Password" at https://myaccount.google.com/apppasswords
 # 3. Set environment variables:
 #    - EMAIL_HOST_USER=vital.tyrsu@gmail.com
-#    - EMAIL_HOST_PASSWORD=your_app_password (16-character code from Google)
\ No newline at end of file
+#    - EMAIL_HOST_PASSWORD=your_app_password (16-character code from Google)
+
+# Notification emails are queued in the EmailOutbox table and delivered by
+# `python manage.py process_outbox` (run it from cron or with --watch).
+# Set to False to send synchronously inside the request instead.
+USE_EMAIL_OUTBOX = os.environ.get('USE_EMAIL_OUTBOX', 'True') == 'True'
+OUTBOX_MAX_ATTEMPTS = 5  # Failed sends are retried with backoff, then dead-lettered
+
+# ===================================
+# GOOGLE BOOKS API
+# ===================================
+# Base URL (override with a local stub for testing)
+GOOGLE_BOOKS_API_URL = os.environ.get('GOOGLE_BOOKS_API_URL', 'https://www.googleapis.com/books/v1')
+
+# ===================================
+# ADMIN DASHBOARD
+# ===================================
+# Largest CSV accepted by the admin book import (uploads over 2.5MB are streamed from disk)
+CSV_IMPORT_MAX_BYTES = 100 * 1024 * 1024
+
+# Low stock alert: titles with fewer available copies than the threshold
+LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 2))
+LOW_STOCK_LIMIT = int(os.environ.get('LOW_STOCK_LIMIT', 5))  # How many titles to show
+
+# ===================================
+# REQUEST METRICS AND PROFILING
+# ===================================
+# Fraction of requests measured by RequestMetricsMiddleware (e.g. 0.05); each one gets a
+# Server-Timing header and a "request url=..." log line. 0 disables the middleware.
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 0))
+
+# cProfile capture of slow requests and commands (library/profiling.py). Comma separated
+# URL names (e.g. admin_dashboard) and command names (e.g. send_due_reminders); '*' for all.
+# Only runs over the threshold are kept, as compressed files in PROFILE_DIR.
+PROFILE_URL_NAMES = [name for name in os.environ.get('PROFILE_URL_NAMES', '').split(',') if name]
+PROFILE_COMMANDS = [name for name in os.environ.get('PROFILE_COMMANDS', '').split(',') if name]
+PROFILE_THRESHOLD_MS = int(os.environ.get('PROFILE_THRESHOLD_MS', 500))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'library_system_profiles'))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200))
+
+# ===================================
+# PROMETHEUS METRICS
+# ===================================
+# Prometheus metrics at /metrics (library/metrics.py). Each process writes its counters
+# to METRICS_DIR, shared by all workers on a host, and a scrape adds them up ('' = per process).
+# The endpoint answers staff users, requests with "Authorization: Bearer <METRICS_TOKEN>"
+# (bearer_token in the Prometheus scrape config), and the client addresses in
+# METRICS_ALLOWED_IPS (comma separated, empty by default). That list must hold the
+# scraper's real address: behind a reverse proxy every client arrives from the proxy's
+# address (often 127.0.0.1), so listing it would publish the metrics to everyone. Use
+# the token there.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'library_system_metrics'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [address for address in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if address]
+
+# ===================================
+# LOGGING
+# ===================================
+# Leveled logging for the library app (reservation signals and email
+# delivery log at DEBUG; set LIBRARY_LOG_LEVEL=DEBUG to see them)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+        },
+    },
+    'loggers': {
+        'library': {
+            'handlers': ['console'],
+            'level': os.environ.get('LIBRARY_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -15,7 +15,9 @@ def main():
             "available on your PYTHONPATH environment variable? Did you "
             "forget to activate a virtual environment?"
         ) from exc
-    execute_from_command_line(sys.argv)
+    from library.profiling import profile_command
+    with profile_command(sys.argv):  # No-op unless the command is in PROFILE_COMMANDS
+        execute_from_command_line(sys.argv)
 
 
 if __name__ == '__main__':